@@ -12,6 +12,7 @@ import sys
 import os
 from dotenv import load_dotenv
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
 
 # 导入自定义模块
 from src.ui.main_window import MainWindow
@@ -34,6 +35,14 @@ def main():
     window = MainWindow(config)
     window.show()
     
+    # 在后台预热与API服务器的连接，避免首次点击承担握手开销
+    window.api_client.warm_up()
+    
+    # 微信窗口获得焦点时重新预热空闲过久的连接，开启预取时在后台检测聊天内容变化
+    focus_timer = QTimer()
+    focus_timer.timeout.connect(window.check_wechat_focus)
+    focus_timer.start(1000)
+    
     # 运行应用程序
     sys.exit(app.exec_())
 
@@ -8,197 +8,765 @@
 """
 
 import time
-from openai import OpenAI
+import json
+import asyncio
+import threading
+import concurrent.futures
+from openai import (OpenAI, AsyncOpenAI, RateLimitError, APITimeoutError,
+                    APIConnectionError, InternalServerError)
+
+from src.utils.response_cache import ResponseCache
+from src.utils.rate_limiter import TokenBucket, parse_retry_after
+from src.api.prompt_builder import PromptBuilder, PromptCacheStats
+from src.utils.token_budget import TokenBudgeter
+from src.utils.single_flight import SingleFlight
+from src.api.request_policy import RequestPolicy, DeadlineExceeded, HedgeLost
+from src.api.http_pool import HttpPool
+from src.api.model_router import ModelRouter
+from src.api.stream_parser import IncrementalListParser, parse_list
+from src.utils.tracing import span
+from src.utils.simhash import NearDuplicateIndex
+from src.utils.cancellation import RequestCancelled
+from src.data.chat_parser import conversation_text
+
+# 默认使用的模型
+DEFAULT_MODEL = "deepseek-chat"
+
+# 支持的请求模式
+MODES = ("predict", "suggest", "analyze")
+
+# 预测与建议的条目数，流式输出达到该数量后提前结束
+LIST_ITEM_COUNT = 5
+
+# 一次请求同时返回三部分结果的合并模式，输出为JSON
+INSIGHTS_MODE = "insights"
+
+# 可以重试的请求异常
+RETRYABLE_ERRORS = (APITimeoutError, APIConnectionError, RateLimitError, InternalServerError)
+
+# 各模式请求失败时的提示
+FAILURE_MESSAGES = {
+    "predict": "预测失败",
+    "suggest": "生成建议失败",
+    "analyze": "分析失败",
+    "insights": "请求失败",
+}
 
 class DeepSeekAPI:
     """DeepSeek API交互类"""
     
-    def __init__(self, config):
-        """初始化API客户端"""
+    def __init__(self, config, reply_model=None, history_index=None, contact_provider=None):
+        """初始化API客户端
+        
+        reply_model为可选的本地回复预测模型，请求失败时用于代替预测结果；
+        history_index为可选的过往聊天记录索引，用于在提示中附上相关的过往对话；
+        contact_provider返回写入记录时使用的当前聊天对象，未提供时根据聊天内容推断。
+        """
         self.config = config
+        self.reply_model = reply_model
+        self.history_index = history_index
+        self.contact_provider = contact_provider
+        # 各模式最近一次结果是否来自本地模型
+        self.last_fallback = {}
+        # 同步与异步客户端共用可配置的长连接池
+        self.http_pool = HttpPool(config)
+        # 重试由请求策略统一处理，客户端自身不再重试
         self.client = OpenAI(
             api_key=config.api_key,
-            base_url=config.api_base_url
+            base_url=config.api_base_url,
+            max_retries=0,
+            http_client=self.http_pool.client
         )
-        # 上次请求时间，用于控制请求频率
-        self.last_request_time = 0
-        # 请求间隔时间（秒）
-        self.request_interval = 2
+        # 异步客户端，用于并发请求多个模式
+        self.async_client = AsyncOpenAI(
+            api_key=config.api_key,
+            base_url=config.api_base_url,
+            max_retries=0,
+            http_client=self.http_pool.async_client
+        )
+        # 各模式的模型、输出上限与温度
+        self.router = ModelRouter(config)
+        # 截止时间、重试、对冲与熔断策略
+        self.policy = RequestPolicy(config, RETRYABLE_ERRORS)
+        # 令牌桶限流器，工作线程与异步请求共用
+        self.rate_limiter = TokenBucket(config.rate_limit_rps, config.rate_limit_burst)
+        # 各模式最近一次请求的排队等待时间（秒）
+        self.last_queue_wait = {}
+        # 各模式最近一次请求的首字延迟（秒）
+        self.last_ttft = {}
+        # 响应缓存，相同对话与设置的请求直接返回结果
+        self.cache = ResponseCache(
+            config.cache_dir,
+            max_memory_entries=config.cache_memory_entries,
+            ttl=config.cache_ttl,
+            max_disk_bytes=config.cache_disk_mb * 1024 * 1024
+        ) if config.cache_enabled else None
+        # 各模式最近一次请求是否命中缓存
+        self.last_cache_hit = {}
+        # 相似对话复用：最近一次命中时与原对话指纹的差异位数，精确命中或未命中时为None
+        self.near_duplicates = NearDuplicateIndex(
+            config.near_duplicate_threshold, config.near_duplicate_entries
+        ) if self.cache is not None and config.near_duplicate_enabled else None
+        self.last_near_distance = {}
+        # 提示构建器与服务端上下文缓存命中统计
+        self.prompt_builder = PromptBuilder()
+        self.prompt_cache_stats = PromptCacheStats()
+        # 上下文预算裁剪器，以及各模式最近一次裁剪前后的token数
+        self.budgeter = TokenBudgeter()
+        self.last_token_counts = {}
+        # 合并并发的相同请求
+        self.single_flight = SingleFlight()
+        # 后台读取用量的任务
+        self._drains = set()
+        # 运行异步请求的后台事件循环
+        self._loop = None
+        self._loop_lock = threading.Lock()
+    
+    def _wait_for_rate_limit(self, mode, cancel_token=None):
+        """等待令牌桶放行，并记录排队时间"""
+        self.last_queue_wait[mode] = self.rate_limiter.acquire(cancel_token)
+    
+    async def _await_rate_limit(self, mode):
+        """在协程中等待令牌桶放行，并记录排队时间"""
+        self.last_queue_wait[mode] = await self.rate_limiter.acquire_async()
+    
+    def _report_outcome(self, error=None):
+        """将请求结果反馈给限流器，遇到429时按Retry-After暂停并降低速率"""
+        if error is None:
+            self.rate_limiter.on_success()
+        elif isinstance(error, RateLimitError):
+            retry_after = parse_retry_after(error.response.headers.get("retry-after"))
+            self.rate_limiter.on_rate_limited(retry_after)
+    
+    def get_queue_wait(self, mode):
+        """获取指定模式最近一次请求的排队等待时间（秒），无记录时返回None"""
+        return self.last_queue_wait.get(mode)
+    
+    def _completion_options(self, mode):
+        """获取模式的请求参数：路由选择的模型、输出上限与温度，合并模式要求输出JSON对象"""
+        options = self.router.options(mode)
+        options.setdefault("model", DEFAULT_MODEL)
+        if mode == INSIGHTS_MODE:
+            options["response_format"] = {"type": "json_object"}
+        return options
+    
+    def get_route_stats(self):
+        """获取各模式的路由参数与生成耗时统计"""
+        return self.router.get_stats()
     
-    def _wait_for_rate_limit(self):
-        """等待请求间隔，避免频率限制"""
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
+    def stream_chat(self, messages, model=DEFAULT_MODEL, on_usage=None, timeout=None, options=None,
+                    cancel_token=None):
+        """以流式方式调用API，逐块产出增量文本，结束时通过on_usage回调返回用量
         
-        if elapsed < self.request_interval:
-            # 需要等待的时间
-            wait_time = self.request_interval - elapsed
-            time.sleep(wait_time)
+        cancel_token被取消时立即关闭连接，正在等待数据的读取随之中断并抛出RequestCancelled。
+        """
+        client = self.client.with_options(timeout=timeout) if timeout else self.client
+        params = {"model": model}
+        params.update(options or {})
+        stream = client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **params
+        )
+        if cancel_token is not None:
+            cancel_token.add_callback(stream.close)
+        try:
+            for chunk in stream:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                # 最后一个数据块只包含用量信息
+                if chunk.usage is not None and on_usage:
+                    on_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            # 连接被取消回调关闭后，读取会以连接错误结束
+            if cancel_token is not None and cancel_token.cancelled and not isinstance(e, RequestCancelled):
+                raise RequestCancelled("请求已取消") from e
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(stream.close)
+            # 提前退出时关闭连接，避免继续接收数据
+            stream.close()
+    
+    def _request(self, mode, messages, on_delta=None, deadline=None, claim=None, cancel_token=None):
+        """发送请求并返回完整文本，流式模式下通过on_delta回调推送增量
         
-        # 更新上次请求时间
-        self.last_request_time = time.time()
+        deadline为time.monotonic()下的截止时间；claim用于对冲请求，
+        在产出第一段文本前调用，返回False时放弃本次请求；
+        cancel_token被取消时中断请求并抛出RequestCancelled。
+        """
+        start_time = time.time()
+        timeout = max(0.1, deadline - time.monotonic()) if deadline else None
+        
+        if not self.config.stream_output:
+            client = self.client.with_options(timeout=timeout) if timeout else self.client
+            response = client.chat.completions.create(
+                messages=messages,
+                stream=False,
+                **self._completion_options(mode)
+            )
+            # 同步的非流式请求无法中途中断，取消后丢弃结果
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if claim and not claim():
+                raise HedgeLost()
+            # 非流式模式下首字即整个结果
+            self.last_ttft[mode] = time.time() - start_time
+            self.prompt_cache_stats.record(mode, response.usage)
+            return response.choices[0].message.content
+        
+        result = ""
+        parser = self._make_list_parser(mode)
+        on_usage = lambda usage: self.prompt_cache_stats.record(mode, usage)
+        deltas = self.stream_chat(messages, on_usage=on_usage, timeout=timeout,
+                                  options=self._completion_options(mode), cancel_token=cancel_token)
+        for delta in deltas:
+            if not result:
+                if claim and not claim():
+                    raise HedgeLost()
+                first_time = time.time()
+                self.last_ttft[mode] = first_time - start_time
+            if deadline and time.monotonic() > deadline:
+                raise DeadlineExceeded("请求超过截止时间")
+            result += delta
+            if on_delta:
+                on_delta(delta, result)
+            # 已得到足够的条目时立即返回，不再等待后续的说明文字
+            if parser is not None:
+                parser.feed(delta)
+                if parser.done:
+                    self._drain_usage(deltas)
+                    break
+        if result:
+            # 记录从首字到结束的生成耗时，供路由调整输出上限
+            self.router.record(mode, time.time() - first_time)
+        return result
     
-    def predict_replies(self, chat_history, nickname="", relation="朋友", additional_info="", gender=""):
-        """预测对方可能的回复"""
-        self._wait_for_rate_limit()
-        
-        # 构建系统提示
-        system_prompt = "你是一个专业的对话预测助手。根据提供的聊天历史，预测对方接下来最可能说的5句话。"
-        
-        # 构建用户提示
-        if nickname:
-            user_prompt =  f"\n我的昵称是：{nickname}\n"
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt += f"以下是{nickname}与一位{relation_text}的聊天记录：\n\n"
-        else:
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt = f"\n以下是我与一位{relation_text}的聊天记录：\n\n"
-        
-        # 添加聊天历史
-        for message in chat_history:
-            user_prompt += f"{message}\n"
-        
-        if additional_info:
-            user_prompt += f"\n补充信息：{additional_info}\n"
-        
-        user_prompt += "\n请预测对方接下来最可能回复的5句话，使用自然的口语表达，避免重复句式，可以使用Emoji表情。"
-        print(user_prompt)
+    def _drain_usage(self, deltas):
+        """在后台读完提前结束的流式响应，不再转发增量，只为取得最后一个数据块中的用量"""
+        def _drain():
+            try:
+                for _ in deltas:
+                    pass
+            except Exception as e:
+                if self.config.debug_mode:
+                    print(f"读取用量失败: {e}")
+        
+        threading.Thread(target=_drain, daemon=True).start()
+    
+    async def _adrain_usage(self, mode, stream):
+        """_drain_usage的协程版本，读完后关闭连接"""
         try:
-            # 调用API
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=False
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self.prompt_cache_stats.record(mode, chunk.usage)
+        except Exception as e:
+            if self.config.debug_mode:
+                print(f"读取用量失败: {e}")
+        finally:
+            await stream.close()
+    
+    def _make_list_parser(self, mode):
+        """为列表类模式创建增量解析器，用于提前结束流式输出"""
+        if mode in ("predict", "suggest"):
+            return IncrementalListParser(LIST_ITEM_COUNT)
+        return None
+    
+    def get_ttft(self, mode):
+        """获取指定模式最近一次请求的首字延迟（秒），无记录时返回None"""
+        return self.last_ttft.get(mode)
+    
+    def _fit_history(self, mode, chat_history):
+        """按模式的输入预算裁剪聊天历史，丢弃最旧的内容"""
+        history, before, after = self.budgeter.fit(chat_history, self.config.input_token_budgets.get(mode))
+        self.last_token_counts[mode] = (before, after)
+        if self.config.debug_mode and after < before:
+            print(f"聊天历史已裁剪: {before} -> {after} tokens")
+        return history
+    
+    def get_token_counts(self, mode):
+        """获取指定模式最近一次请求裁剪前后的历史token数，无记录时返回None"""
+        return self.last_token_counts.get(mode)
+    
+    def _related_exchanges(self, chat_history, nickname=""):
+        """从过往聊天记录中检索与当前话题相关的对话片段"""
+        if self.history_index is None or not self.config.retrieval_enabled or not chat_history:
+            return []
+        try:
+            contact = self.contact_provider() if self.contact_provider else None
+            return self.history_index.related_exchanges(
+                conversation_text(chat_history), nickname, self.config.retrieval_top_k, contact=contact
             )
-            
-            # 解析结果
-            result = response.choices[0].message.content
-            return self._parse_predictions(result)
-            
         except Exception as e:
             if self.config.debug_mode:
-                print(f"API请求失败: {e}")
-            return [f"预测失败: {str(e)}"] if self.config.debug_mode else ["预测失败，请稍后再试"]
+                print(f"检索过往对话失败: {e}")
+            return []
     
-    def suggest_replies(self, chat_history, nickname="", relation="朋友", additional_info="", gender=""):
-        """生成建议回复"""
-        self._wait_for_rate_limit()
-        
-        # 构建系统提示
-        system_prompt = "你是一个专业的对话助手。根据提供的聊天历史，生成5条合适的回复内容。"
-        
-        # 构建用户提示
-        if nickname:
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt = f"以下是{nickname}与一位{relation_text}的聊天记录：\n\n"
-        else:
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt = f"以下是我与一位{relation_text}的聊天记录：\n\n"
-        # 添加聊天历史
-        for message in chat_history:
-            user_prompt += f"{message}\n"
-        
-        
-        if additional_info:
-            user_prompt += f"\n补充信息：{additional_info}\n"
-        
-        user_prompt += "\n请为我生成5条合适的回复内容，使用自然的口语表达，避免重复句式，可以使用Emoji表情。"
-        print(user_prompt)
+    def _build_messages(self, mode, chat_history, nickname="", relation="朋友", additional_info="", gender="",
+                        related=None):
+        """构建指定模式的请求消息"""
+        messages = self.prompt_builder.build(
+            mode, chat_history, nickname, relation, additional_info, gender, related
+        )
+        if self.config.debug_mode:
+            print(messages[1]["content"] + messages[2]["content"])
+        return messages
+    
+    def get_prompt_cache_hit_ratio(self, mode):
+        """获取指定模式的服务端上下文缓存命中率，无记录时返回None"""
+        return self.prompt_cache_stats.hit_ratio(mode)
+    
+    def _postprocess(self, mode, result):
+        """将模型输出转换为界面所需的结果格式"""
+        if mode == INSIGHTS_MODE:
+            return self._parse_insights(result)
+        if mode == "analyze":
+            return result
+        return self._parse_predictions(result)
+    
+    def _validate(self, mode, result):
+        """写入缓存前检查输出格式，合并模式的输出必须是合法JSON"""
+        if mode == INSIGHTS_MODE:
+            json.loads(result)
+    
+    def _failure_result(self, mode, error, chat_history=None):
+        """生成请求失败时返回给界面的结果，预测结果优先使用本地模型的候选"""
+        if self.config.debug_mode:
+            print(f"API请求失败: {error}")
+        if mode == INSIGHTS_MODE:
+            result = {m: self._failure_text(m, error, as_list=m != "analyze") for m in MODES}
+            result["predict"] = self._local_predictions(mode, chat_history) or result["predict"]
+            return result
+        if mode == "predict":
+            local = self._local_predictions(mode, chat_history)
+            if local:
+                return local
+        return self._failure_text(mode, error, as_list=mode != "analyze")
+    
+    def _local_predictions(self, mode, chat_history):
+        """使用本地模型预测对方的回复，没有可用候选时返回空列表"""
+        if self.reply_model is None or not chat_history:
+            return []
+        candidates = self.reply_model.predict(conversation_text(chat_history), LIST_ITEM_COUNT)
+        self.last_fallback[mode] = bool(candidates)
+        return candidates
+    
+    def _failure_text(self, mode, error, as_list):
+        """生成单个模式的失败提示"""
+        message = FAILURE_MESSAGES[mode]
+        text = f"{message}: {str(error)}" if self.config.debug_mode else f"{message}，请稍后再试"
+        return [text] if as_list else text
+    
+    def _request_key(self, mode, chat_history, nickname, relation, additional_info, gender):
+        """生成规范化的请求键，用于响应缓存与请求合并"""
+        return ResponseCache.make_key(
+            mode, self.router.model(mode, DEFAULT_MODEL), chat_history, nickname, relation, gender, additional_info
+        )
+    
+    def _lookup_cache(self, mode, key):
+        """查询缓存，命中时返回模型输出文本"""
+        start_time = time.time()
+        cached = self.cache.get(key) if self.cache else None
+        self.last_cache_hit[mode] = cached is not None
+        self.last_near_distance[mode] = None
+        if cached is not None:
+            self.last_ttft[mode] = time.time() - start_time
+        return cached
+    
+    def _near_group(self, mode, nickname, relation, additional_info, gender):
+        """相似对话的分组键，只有模式与设置都相同的请求才能复用结果"""
+        return ResponseCache.make_key(
+            mode, self.router.model(mode, DEFAULT_MODEL), [], nickname, relation, gender, additional_info
+        )
+    
+    def _lookup_near(self, mode, key, chat_history, nickname, relation, additional_info, gender):
+        """查找相似对话的缓存结果，命中时按配置在后台刷新当前对话的结果"""
+        if self.near_duplicates is None or not chat_history:
+            return None
+        start_time = time.time()
+        group = self._near_group(mode, nickname, relation, additional_info, gender)
+        found = self.near_duplicates.find(group, conversation_text(chat_history))
+        if found is None:
+            return None
+        near_key, distance = found
+        cached = self.cache.get(near_key)
+        if cached is None:
+            return None
+        self.last_cache_hit[mode] = True
+        self.last_near_distance[mode] = distance
+        self.last_ttft[mode] = time.time() - start_time
+        if self.config.debug_mode:
+            print(f"{mode}复用相似对话的结果，指纹差异{distance}位")
+        if self.config.near_duplicate_refresh and not self.single_flight.is_inflight(key):
+            self.near_duplicates.refreshes += 1
+            threading.Thread(target=self._refresh, daemon=True, args=(
+                mode, key, chat_history, nickname, relation, additional_info, gender
+            )).start()
+        return cached
+    
+    def _refresh(self, mode, key, chat_history, nickname, relation, additional_info, gender):
+        """在后台请求当前对话的结果，下次请求即可精确命中缓存"""
         try:
-            # 调用API
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=False
+            self.single_flight.do(key, lambda: self._fetch(
+                mode, key, chat_history, nickname, relation, additional_info, gender, None
+            ))
+        except Exception as e:
+            if self.config.debug_mode:
+                print(f"后台刷新{mode}结果失败: {e}")
+    
+    def _register_near(self, mode, key, chat_history, nickname, relation, additional_info, gender):
+        """登记成功请求的对话指纹，供之后的相似对话复用"""
+        if self.near_duplicates is not None and chat_history:
+            group = self._near_group(mode, nickname, relation, additional_info, gender)
+            self.near_duplicates.add(group, conversation_text(chat_history), key)
+    
+    def get_near_duplicate_stats(self):
+        """获取相似对话复用的统计，未启用时返回None"""
+        return self.near_duplicates.get_stats() if self.near_duplicates else None
+    
+    def _store_cache(self, key, result):
+        """将成功的模型输出写入缓存"""
+        if self.cache and result:
+            self.cache.set(key, result)
+    
+    def get_cache_stats(self):
+        """获取响应缓存的命中统计，未启用缓存时返回None"""
+        return self.cache.get_stats() if self.cache else None
+    
+    def get_single_flight_stats(self):
+        """获取相同请求合并的统计"""
+        return self.single_flight.get_stats()
+    
+    def get_policy_stats(self):
+        """获取重试、对冲与熔断的统计"""
+        return self.policy.get_stats()
+    
+    def _fetch(self, mode, key, chat_history, nickname, relation, additional_info, gender, on_delta,
+               cancel_token=None):
+        """按请求策略发送请求，成功的结果写入缓存"""
+        # 请求前先按预算裁剪上下文，再构建消息
+        with span("retrieve"):
+            related = self._related_exchanges(chat_history, nickname)
+        with span("prompt"):
+            history = self._fit_history(mode, chat_history)
+            messages = self._build_messages(
+                mode, history, nickname, relation, additional_info, gender, related
+            )
+        
+        def _attempt(deadline, claim, attempt_token):
+            # 每次尝试（包括重试与对冲）都占用一个令牌；对冲落后或超时的尝试由attempt_token取消
+            if attempt_token is not None:
+                attempt_token.raise_if_cancelled()
+            with span("queue"):
+                self._wait_for_rate_limit(mode, attempt_token)
+            try:
+                result = self._request(mode, messages, on_delta, deadline, claim, attempt_token)
+            except Exception as e:
+                self._report_outcome(e)
+                raise
+            self._report_outcome()
+            return result
+        
+        # 包括限流排队、重试与对冲，整体计入调用方记录的request阶段
+        result = self.policy.execute(mode, _attempt, cancel_token)
+        self._validate(mode, result)
+        self._store_cache(key, result)
+        self._register_near(mode, key, chat_history, nickname, relation, additional_info, gender)
+        return result
+    
+    def is_cached(self, mode, chat_history, nickname="", relation="朋友", additional_info="", gender=""):
+        """判断请求结果是否已在缓存中或正在请求，不计入命中统计"""
+        key = self._request_key(mode, chat_history, nickname, relation, additional_info, gender)
+        if self.single_flight.is_inflight(key):
+            return True
+        return self.cache is not None and key in self.cache
+    
+    def fetch(self, mode, chat_history, nickname="", relation="朋友", additional_info="", gender="", on_delta=None,
+              cancel_token=None):
+        """获取模型的原始输出文本，依次经过缓存与请求合并，失败时抛出异常
+        
+        cancel_token被取消时中断请求并抛出RequestCancelled。
+        """
+        key = self._request_key(mode, chat_history, nickname, relation, additional_info, gender)
+        cached = self._lookup_cache(mode, key)
+        if cached is None:
+            cached = self._lookup_near(mode, key, chat_history, nickname, relation, additional_info, gender)
+        if cached is not None:
+            return cached
+        
+        executed = []
+        
+        def _run():
+            executed.append(True)
+            return self._fetch(
+                mode, key, chat_history, nickname, relation, additional_info, gender, on_delta, cancel_token
             )
+        
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            # 相同请求正在进行时共享其结果
+            try:
+                return self.single_flight.do(key, _run, cancel_token)
+            except RequestCancelled:
+                # 共享的请求被其发起者取消时重新请求，自己发起的请求被取消时直接退出
+                if executed:
+                    raise
+    
+    def _run_mode(self, mode, chat_history, nickname, relation, additional_info, gender, on_delta,
+                  cancel_token=None):
+        """执行单个模式的完整请求流程，取消时抛出RequestCancelled而不返回失败结果"""
+        try:
+            # 调用API
+            self.last_fallback[mode] = False
+            result = self.fetch(mode, chat_history, nickname, relation, additional_info, gender, on_delta,
+                                cancel_token)
             
             # 解析结果
-            result = response.choices[0].message.content
-            return self._parse_predictions(result)
+            with span("parse"):
+                return self._postprocess(mode, result)
             
+        except RequestCancelled:
+            raise
         except Exception as e:
-            if self.config.debug_mode:
-                print(f"API请求失败: {e}")
-            return [f"生成建议失败: {str(e)}"] if self.config.debug_mode else ["生成建议失败，请稍后再试"]
+            return self._failure_result(mode, e, chat_history)
+    
+    def predict_replies(self, chat_history, nickname="", relation="朋友", additional_info="", gender="", on_delta=None,
+                        cancel_token=None):
+        """预测对方可能的回复"""
+        return self._run_mode("predict", chat_history, nickname, relation, additional_info, gender, on_delta,
+                              cancel_token)
     
-    def analyze_conversation(self, chat_history, nickname="", relation="朋友", additional_info="", gender=""):
+    def suggest_replies(self, chat_history, nickname="", relation="朋友", additional_info="", gender="", on_delta=None,
+                        cancel_token=None):
+        """生成建议回复"""
+        return self._run_mode("suggest", chat_history, nickname, relation, additional_info, gender, on_delta,
+                              cancel_token)
+    
+    def analyze_conversation(self, chat_history, nickname="", relation="朋友", additional_info="", gender="",
+                             on_delta=None, cancel_token=None):
         """分析对话内容"""
-        self._wait_for_rate_limit()
-        
-        # 构建系统提示
-        system_prompt = "你是一个专业的对话分析师。根据提供的聊天历史，根据对话内容分析双方的情绪，以及潜台词，并提供洞察。"
-        
-        # 构建用户提示
-        if nickname:
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt = f"以下是{nickname}与一位{relation_text}的聊天记录：\n\n"
-        else:
-            gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
-            relation_text = f"{gender_text}{relation}" if gender else relation
-            user_prompt = f"以下是我与一位{relation_text}的聊天记录：\n\n"
-        # 添加聊天历史
-        for message in chat_history:
-            user_prompt += f"{message}\n"
-        
-        
-        if additional_info:
-            user_prompt += f"\n补充信息：{additional_info}\n"
-        
-        user_prompt += "\n请分析这段对话，提供有价值的洞察，包括但不限于：\n1. 对话的主要话题和情感基调\n2. 对方可能的想法和意图\n3. 对话中的潜在问题或机会\n4. 改善沟通的建议"
-        print(user_prompt)
+        return self._run_mode("analyze", chat_history, nickname, relation, additional_info, gender, on_delta,
+                              cancel_token)
+    
+    def get_all_insights(self, chat_history, nickname="", relation="朋友", additional_info="", gender="",
+                         on_delta=None, cancel_token=None):
+        """一次请求同时获取预测、建议与分析，聊天记录只发送一次
+        
+        返回以predict、suggest、analyze为键的字典，格式与三个单独方法的返回值一致。
+        """
+        return self._run_mode(INSIGHTS_MODE, chat_history, nickname, relation, additional_info, gender, on_delta,
+                              cancel_token)
+    
+    async def _arequest(self, mode, messages, on_delta=None, deadline=None, claim=None):
+        """异步发送请求并返回完整文本"""
+        start_time = time.time()
+        timeout = max(0.1, deadline - time.monotonic()) if deadline else None
+        client = self.async_client.with_options(timeout=timeout) if timeout else self.async_client
+        
+        if not self.config.stream_output:
+            response = await client.chat.completions.create(
+                messages=messages,
+                stream=False,
+                **self._completion_options(mode)
+            )
+            if claim and not claim():
+                raise HedgeLost()
+            self.last_ttft[mode] = time.time() - start_time
+            self.prompt_cache_stats.record(mode, response.usage)
+            return response.choices[0].message.content
+        
+        stream = await client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._completion_options(mode)
+        )
+        result = ""
+        parser = self._make_list_parser(mode)
+        draining = False
         try:
-            # 调用API
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=False
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self.prompt_cache_stats.record(mode, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not result:
+                    if claim and not claim():
+                        raise HedgeLost()
+                    first_time = time.time()
+                    self.last_ttft[mode] = first_time - start_time
+                if deadline and time.monotonic() > deadline:
+                    raise DeadlineExceeded("请求超过截止时间")
+                result += delta
+                if on_delta:
+                    on_delta(delta, result)
+                if parser is not None:
+                    parser.feed(delta)
+                    if parser.done:
+                        draining = True
+                        break
+        finally:
+            if not draining:
+                await stream.close()
+        if draining:
+            # 保留任务的引用，避免读取用量的任务在完成前被回收
+            task = asyncio.ensure_future(self._adrain_usage(mode, stream))
+            self._drains.add(task)
+            task.add_done_callback(self._drains.discard)
+        if result:
+            # 记录从首字到结束的生成耗时，供路由调整输出上限
+            self.router.record(mode, time.time() - first_time)
+        return result
+    
+    async def _afetch(self, mode, key, chat_history, nickname, relation, additional_info, gender, on_delta):
+        """按请求策略异步发送请求，成功的结果写入缓存"""
+        # 请求前先按预算裁剪上下文，再构建消息
+        with span("retrieve"):
+            related = self._related_exchanges(chat_history, nickname)
+        with span("prompt"):
+            history = self._fit_history(mode, chat_history)
+            messages = self._build_messages(
+                mode, history, nickname, relation, additional_info, gender, related
             )
-            
-            # 获取结果
-            result = response.choices[0].message.content
+        
+        async def _attempt(deadline, claim):
+            await self._await_rate_limit(mode)
+            try:
+                result = await self._arequest(mode, messages, on_delta, deadline, claim)
+            except Exception as e:
+                self._report_outcome(e)
+                raise
+            self._report_outcome()
             return result
-            
+        
+        result = await self.policy.execute_async(mode, _attempt)
+        self._validate(mode, result)
+        self._store_cache(key, result)
+        self._register_near(mode, key, chat_history, nickname, relation, additional_info, gender)
+        return result
+    
+    async def afetch(self, mode, chat_history, nickname="", relation="朋友", additional_info="", gender="", on_delta=None):
+        """fetch的协程版本，获取模型的原始输出文本，失败时抛出异常"""
+        key = self._request_key(mode, chat_history, nickname, relation, additional_info, gender)
+        cached = self._lookup_cache(mode, key)
+        if cached is None:
+            cached = self._lookup_near(mode, key, chat_history, nickname, relation, additional_info, gender)
+        if cached is not None:
+            return cached
+        
+        executed = []
+        
+        def _run():
+            executed.append(True)
+            return self._afetch(mode, key, chat_history, nickname, relation, additional_info, gender, on_delta)
+        
+        while True:
+            try:
+                return await self.single_flight.do_async(key, _run)
+            except RequestCancelled:
+                # 共享的请求被其发起者取消时重新请求，当前协程自身被取消时收到的是CancelledError
+                if executed:
+                    raise
+    
+    def parse_output(self, mode, text):
+        """将模型的原始输出解析为对应模式的结果"""
+        return self._postprocess(mode, text)
+    
+    async def _arun_mode(self, mode, chat_history, nickname, relation, additional_info, gender,
+                         on_result=None, on_delta=None):
+        """异步执行单个模式，完成后立即回调结果"""
+        mode_delta = (lambda delta, text: on_delta(mode, delta, text)) if on_delta else None
+        try:
+            self.last_fallback[mode] = False
+            text = await self.afetch(mode, chat_history, nickname, relation, additional_info, gender, mode_delta)
+            result = self._postprocess(mode, text)
         except Exception as e:
-            if self.config.debug_mode:
-                print(f"API请求失败: {e}")
-            return f"分析失败: {str(e)}" if self.config.debug_mode else "分析失败，请稍后再试"
+            result = self._failure_result(mode, e, chat_history)
+        
+        if on_result:
+            on_result(mode, result)
+        return mode, result
+    
+    async def run_all(self, chat_history, nickname="", relation="朋友", additional_info="", gender="",
+                      on_result=None, on_delta=None):
+        """并发请求预测、建议与分析
+        
+        on_result(mode, result)在每个模式完成时调用，
+        on_delta(mode, delta, text)在流式模式下推送各模式的增量文本。
+        """
+        results = await asyncio.gather(*(
+            self._arun_mode(mode, chat_history, nickname, relation, additional_info, gender,
+                            on_result, on_delta)
+            for mode in MODES
+        ))
+        return dict(results)
+    
+    def run_all_sync(self, *args, cancel_token=None, **kwargs):
+        """在后台事件循环中执行run_all并阻塞等待结果，供工作线程调用
+        
+        cancel_token被取消时取消事件循环中的任务，排队、等待响应与读取中的请求都会立即中断。
+        """
+        future = asyncio.run_coroutine_threadsafe(self.run_all(*args, **kwargs), self._get_event_loop())
+        if cancel_token is not None:
+            cancel_token.add_callback(future.cancel)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelled("请求已取消")
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(future.cancel)
+    
+    def warm_up(self, only_if_idle=False):
+        """在后台预热同步与异步客户端的连接，only_if_idle为True时仅在连接可能已过期时预热"""
+        if only_if_idle and not self.http_pool.is_idle():
+            return
+        threading.Thread(target=self.http_pool.warm_up, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.http_pool.warm_up_async(), self._get_event_loop())
+    
+    def get_connection_stats(self):
+        """获取连接复用统计"""
+        return self.http_pool.get_stats()
+    
+    def _get_event_loop(self):
+        """获取后台事件循环，首次调用时启动
+
+        异步客户端的连接池绑定在事件循环上，因此所有异步请求共用同一个长期运行的循环。
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+    
+    def _parse_insights(self, content):
+        """解析合并模式返回的JSON对象，拆分为三部分结果"""
+        data = json.loads(content)
+        
+        def _as_list(value):
+            if isinstance(value, list):
+                return [str(item).strip() for item in value if str(item).strip()]
+            return self._parse_predictions(str(value or ""))
+        
+        analysis = data.get("analysis", "")
+        if not isinstance(analysis, str):
+            analysis = json.dumps(analysis, ensure_ascii=False, indent=2)
+        return {
+            "predict": _as_list(data.get("predictions")),
+            "suggest": _as_list(data.get("suggestions")),
+            "analyze": analysis,
+        }
     
     def _parse_predictions(self, content):
         """解析预测结果，提取出预测的回复列表"""
-        if not content:
-            return []
-        
-        # 尝试解析格式化的回复（如：1. xxx\n2. xxx）
-        lines = content.split('\n')
-        predictions = []
-        
-        for line in lines:
-            line = line.strip()
-            # 匹配格式为"数字. 内容"的行
-            if line and (line[0].isdigit() and line[1:].startswith('. ')):
-                # 提取预测内容（去掉序号）
-                prediction = line[line.find('.')+1:].strip()
-                if prediction:
-                    predictions.append(prediction)
-        
-        # 如果没有找到格式化的回复，则直接按行分割
-        if not predictions:
-            predictions = [line.strip() for line in lines if line.strip()]
-            # 限制最多5条预测
-            predictions = predictions[:5]
-        
-        return predictions
\ No newline at end of file
+        return parse_list(content, LIST_ITEM_COUNT)
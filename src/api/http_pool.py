@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP连接池模块
+
+为同步与异步API客户端提供共享的长连接池，可配置连接数、保活时间、超时与HTTP/2，
+支持在后台预热连接，并统计新建连接与复用连接的次数。
+"""
+
+import time
+import threading
+
+import httpx
+
+# HTTP/2需要额外安装h2
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpPool:
+    """共享HTTP连接池"""
+
+    def __init__(self, config):
+        """根据配置创建同步与异步HTTP客户端"""
+        self.config = config
+        self.base_url = config.api_base_url
+        self.keepalive_expiry = config.http_keepalive_expiry
+        http2 = config.http2 and HTTP2_AVAILABLE
+        if config.http2 and not HTTP2_AVAILABLE and config.debug_mode:
+            print("未安装h2，HTTP/2已禁用")
+
+        limits = httpx.Limits(
+            max_connections=config.http_max_connections,
+            max_keepalive_connections=config.http_max_keepalive,
+            keepalive_expiry=config.http_keepalive_expiry
+        )
+        timeout = httpx.Timeout(config.http_read_timeout, connect=config.http_connect_timeout)
+
+        self.client = httpx.Client(
+            limits=limits, timeout=timeout, http2=http2,
+            event_hooks={"request": [self._on_request]}
+        )
+        self.async_client = httpx.AsyncClient(
+            limits=limits, timeout=timeout, http2=http2,
+            event_hooks={"request": [self._on_async_request]}
+        )
+
+        # 连接统计
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.last_activity = 0.0
+        self.last_warm_up = None
+
+    def _record_request(self):
+        """记录一次请求"""
+        with self._lock:
+            self.requests += 1
+            self.last_activity = time.monotonic()
+
+    def _record_event(self, event_name):
+        """根据底层连接事件统计新建连接"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def _on_request(self, request):
+        """同步请求钩子：登记请求并挂载连接事件追踪"""
+        self._record_request()
+        request.extensions["trace"] = self._trace
+
+    async def _on_async_request(self, request):
+        """异步请求钩子：登记请求并挂载连接事件追踪"""
+        self._record_request()
+        request.extensions["trace"] = self._atrace
+
+    def _trace(self, event_name, info):
+        """同步连接事件回调"""
+        self._record_event(event_name)
+
+    async def _atrace(self, event_name, info):
+        """异步连接事件回调"""
+        self._record_event(event_name)
+
+    def is_idle(self):
+        """连接是否可能已因空闲过期"""
+        return time.monotonic() - self.last_activity > self.keepalive_expiry / 2
+
+    def warm_up(self):
+        """向API服务器发送一个轻量请求，提前完成DNS、TCP与TLS握手"""
+        start_time = time.monotonic()
+        try:
+            self.client.head(self.base_url)
+        except httpx.HTTPError as e:
+            if self.config.debug_mode:
+                print(f"预热连接失败: {e}")
+            return None
+        self.last_warm_up = time.monotonic() - start_time
+        return self.last_warm_up
+
+    async def warm_up_async(self):
+        """预热异步客户端的连接"""
+        try:
+            await self.async_client.head(self.base_url)
+        except httpx.HTTPError as e:
+            if self.config.debug_mode:
+                print(f"预热连接失败: {e}")
+
+    def get_stats(self):
+        """获取连接复用统计"""
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused": reused,
+                "reuse_ratio": reused / self.requests if self.requests else None,
+                "last_warm_up": self.last_warm_up,
+            }
+
+    def close(self):
+        """关闭同步客户端的连接"""
+        self.client.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型路由模块
+
+按模式选择模型、最大输出token数与温度，并统计各路由最近的生成耗时。
+生成耗时持续超过目标时逐步缩小输出上限，明显低于目标时再逐步恢复到配置值。
+"""
+
+import threading
+
+from src.utils.metrics import LatencyWindow
+
+# 每次调整输出上限的比例
+SHRINK_FACTOR = 0.8
+GROW_FACTOR = 1.1
+# p95低于目标的该比例时才恢复输出上限
+GROW_BELOW_RATIO = 0.5
+# 输出JSON对象的模式不缩小输出上限，被截断的JSON无法解析
+FIXED_OUTPUT_MODES = ("insights",)
+
+
+class ModelRouter:
+    """按模式路由请求参数并根据生成耗时调整输出上限"""
+
+    def __init__(self, config):
+        """根据配置中的路由表初始化"""
+        self.routes = config.model_routes
+        self.adaptive = config.route_adaptive
+        self.min_samples = config.route_min_samples
+        self.min_tokens_ratio = config.route_min_tokens_ratio
+        self.debug_mode = config.debug_mode
+        self.latency = LatencyWindow(max(20, self.min_samples))
+        # 各模式当前的输出上限
+        self._max_tokens = {mode: route["max_tokens"] for mode, route in self.routes.items()}
+        self._pending = {}
+        self.adjustments = {}
+        self._lock = threading.Lock()
+
+    def options(self, mode):
+        """获取模式的请求参数，未配置路由的模式返回空字典"""
+        route = self.routes.get(mode)
+        if route is None:
+            return {}
+        with self._lock:
+            max_tokens = self._max_tokens[mode]
+        return {"model": route["model"], "max_tokens": max_tokens, "temperature": route["temperature"]}
+
+    def model(self, mode, default=None):
+        """获取模式使用的模型"""
+        route = self.routes.get(mode)
+        return route["model"] if route else default
+
+    def record(self, mode, generation_time):
+        """记录一次请求从首字到结束的耗时（秒），样本足够时检查是否需要调整输出上限"""
+        route = self.routes.get(mode)
+        if route is None:
+            return
+        self.latency.record(mode, generation_time)
+        if not self.adaptive or mode in FIXED_OUTPUT_MODES:
+            return
+
+        with self._lock:
+            self._pending[mode] = self._pending.get(mode, 0) + 1
+            if self._pending[mode] < self.min_samples:
+                return
+            p95 = self.latency.percentile(mode, 95)
+            target = route["latency_target"]
+            current = self._max_tokens[mode]
+            if p95 > target:
+                floor = max(1, int(route["max_tokens"] * self.min_tokens_ratio))
+                new_value = max(floor, int(current * SHRINK_FACTOR))
+            elif p95 < target * GROW_BELOW_RATIO:
+                new_value = min(route["max_tokens"], int(current * GROW_FACTOR) + 1)
+            else:
+                return
+            if new_value == current:
+                return
+            self._max_tokens[mode] = new_value
+            self.adjustments[mode] = self.adjustments.get(mode, 0) + 1
+            # 调整后重新积累样本，旧样本不再代表当前的输出上限
+            self._pending[mode] = 0
+            self.latency.clear(mode)
+
+        if self.debug_mode:
+            print(f"{mode}生成耗时p95 {p95:.2f}秒，目标{target:.2f}秒，输出上限调整为{new_value}")
+
+    def get_stats(self):
+        """获取各路由的当前参数与生成耗时统计"""
+        stats = {}
+        for mode, route in self.routes.items():
+            summary = self.latency.summary(mode)
+            with self._lock:
+                max_tokens = self._max_tokens[mode]
+            stats[mode] = {
+                "model": route["model"],
+                "max_tokens": max_tokens,
+                "configured_max_tokens": route["max_tokens"],
+                "latency_target": route["latency_target"],
+                "generation_p50": summary["p50"],
+                "generation_p95": summary["p95"],
+                "adjustments": self.adjustments.get(mode, 0),
+            }
+        return stats
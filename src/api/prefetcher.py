@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+预取模块
+
+后台检测到聊天内容变化后，提前计算预测（可选建议）结果并写入响应缓存，
+用户随后点击按钮时即可直接命中缓存。内容再次变化时通过取消令牌中断过期的预取，
+排队与读取中的请求都会立即结束，并通过独立的令牌桶限制预取占用的请求额度。
+"""
+
+import threading
+
+from src.utils.rate_limiter import TokenBucket
+from src.utils.cancellation import CancelToken, RequestCancelled
+
+
+class SpeculativePrefetcher:
+    """后台预取器"""
+
+    def __init__(self, api_client, config, persona_provider):
+        """初始化预取器
+
+        api_client: DeepSeekAPI实例，预取结果写入其响应缓存
+        persona_provider: 返回(nickname, relation, additional_info, gender)的函数，
+                          通常为用户最近一次使用的设置
+        """
+        self.api_client = api_client
+        self.config = config
+        self.persona_provider = persona_provider
+        self.modes = config.speculative_modes
+        self.delay = config.speculative_delay_ms / 1000
+        # 预取只能使用总请求额度的一部分
+        budget_rate = config.rate_limit_rps * config.speculative_budget_percent / 100
+        self.budget = TokenBucket(budget_rate, 1) if budget_rate > 0 else None
+
+        # 当前预取的取消令牌，内容变化时取消
+        self._token = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self):
+        """预取是否可用：需要开启配置、有预算且启用了响应缓存"""
+        return self.config.speculative_prefetch and self.budget is not None and self.api_client.cache is not None
+
+    def on_content_changed(self, chat_history):
+        """聊天内容变化时调用，取消旧的预取并启动新的预取"""
+        token = CancelToken()
+        with self._lock:
+            previous, self._token = self._token, token
+        if previous is not None:
+            previous.cancel()
+        if not self.enabled or not chat_history:
+            return
+        threading.Thread(
+            target=self._run, args=(token, list(chat_history)), daemon=True
+        ).start()
+
+    def cancel(self):
+        """取消所有进行中的预取"""
+        with self._lock:
+            token, self._token = self._token, None
+        if token is not None:
+            token.cancel()
+
+    def _run(self, token, chat_history):
+        """在后台执行预取"""
+        # 稍作等待，让用户当前点击触发的请求优先发出
+        if token.wait(self.delay):
+            self.cancelled += 1
+            return
+        nickname, relation, additional_info, gender = self.persona_provider()
+
+        for mode in self.modes:
+            if token.cancelled:
+                self.cancelled += 1
+                return
+            if self.api_client.is_cached(mode, chat_history, nickname, relation, additional_info, gender):
+                continue
+            if not self.budget.try_acquire():
+                self.skipped += 1
+                continue
+
+            self.started += 1
+            try:
+                # 内容变化时中断排队、等待响应与读取
+                self.api_client.fetch(
+                    mode, chat_history, nickname, relation, additional_info, gender,
+                    cancel_token=token
+                )
+                self.completed += 1
+            except RequestCancelled:
+                self.cancelled += 1
+                return
+            except Exception as e:
+                if self.config.debug_mode:
+                    print(f"预取失败: {e}")
+
+    def get_stats(self):
+        """获取预取统计"""
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+        }
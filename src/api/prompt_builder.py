@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+提示构建模块
+
+按固定顺序组装请求消息：所有模式共用的系统提示、用户设定、聊天记录，
+最后才是各模式不同的任务说明。这样同一段对话的不同请求、以及对话追加新消息后的请求
+都拥有逐字节相同的前缀，可以命中服务端的上下文缓存。
+"""
+
+import threading
+
+# 所有模式共用的系统提示，修改会使已有的上下文缓存全部失效
+SHARED_SYSTEM_PROMPT = (
+    "你是一个专业的聊天对话助手，擅长根据聊天历史预测对方接下来的回复、"
+    "为用户生成合适的回复内容，并分析对话双方的情绪、潜台词与意图。"
+    "请严格按照最后一条消息中的任务要求作答。"
+)
+
+# 各模式的任务说明，放在消息末尾
+TASK_PROMPTS = {
+    "predict": "请预测对方接下来最可能回复的5句话，使用自然的口语表达，避免重复句式，可以使用Emoji表情。"
+               "每句话单独一行，格式为“序号. 内容”。",
+    "suggest": "请为我生成5条合适的回复内容，使用自然的口语表达，避免重复句式，可以使用Emoji表情。"
+               "每条回复单独一行，格式为“序号. 内容”。",
+    "analyze": "请分析这段对话，提供有价值的洞察，包括但不限于：\n1. 对话的主要话题和情感基调\n"
+               "2. 对方可能的想法和意图\n3. 对话中的潜在问题或机会\n4. 改善沟通的建议",
+    "insights": "请一次完成以下三项任务，并只输出一个JSON对象：\n"
+                "1. predictions：预测对方接下来最可能回复的5句话\n"
+                "2. suggestions：为我生成5条合适的回复内容\n"
+                "3. analysis：分析这段对话的话题与情感基调、对方的想法和意图、潜在问题或机会，"
+                "并给出改善沟通的建议，使用Markdown格式\n"
+                "回复使用自然的口语表达，避免重复句式，可以使用Emoji表情。JSON格式示例：\n"
+                '{"predictions": ["...", "..."], "suggestions": ["...", "..."], "analysis": "..."}',
+}
+
+
+class PromptBuilder:
+    """请求消息构建类"""
+
+    def build_persona(self, nickname="", relation="朋友", additional_info="", gender=""):
+        """构建用户设定部分，同一会话内保持不变"""
+        gender_text = f"{'男' if gender == '男' else '女'}性" if gender else ""
+        relation_text = f"{gender_text}{relation}" if gender else relation
+
+        persona = f"我的昵称是：{nickname}\n" if nickname else ""
+        persona += f"聊天对象是我的一位{relation_text}。\n"
+        if additional_info:
+            persona += f"补充信息：{additional_info}\n"
+        return persona
+
+    def build_context(self, chat_history, nickname="", relation="朋友", additional_info="", gender="",
+                      related=None):
+        """构建用户设定与聊天记录，聊天记录按时间顺序追加在末尾
+
+        related为检索到的相关过往对话片段，放在聊天记录之后，不影响前面部分的缓存。
+        """
+        context = self.build_persona(nickname, relation, additional_info, gender)
+        context += "\n以下是聊天记录：\n\n"
+        for message in chat_history:
+            context += f"{message}\n"
+        if related:
+            context += "\n以下是与当前话题相关的过往对话，仅供参考：\n\n"
+            for exchange in related:
+                context += "\n".join(f"{speaker or '对方'}：{content}" for speaker, content in exchange)
+                context += "\n---\n"
+        return context
+
+    def build(self, mode, chat_history, nickname="", relation="朋友", additional_info="", gender="", related=None):
+        """构建指定模式的完整请求消息"""
+        return [
+            {"role": "system", "content": SHARED_SYSTEM_PROMPT},
+            {"role": "user", "content": self.build_context(
+                chat_history, nickname, relation, additional_info, gender, related
+            )},
+            {"role": "user", "content": TASK_PROMPTS[mode]},
+        ]
+
+
+class PromptCacheStats:
+    """统计各模式的服务端上下文缓存命中情况"""
+
+    def __init__(self):
+        """初始化统计"""
+        # mode -> [命中token数, 未命中token数]
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, usage):
+        """从响应的usage中读取缓存命中与未命中的token数"""
+        if usage is None:
+            return
+        hit = getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        miss = getattr(usage, "prompt_cache_miss_tokens", None) or 0
+        with self._lock:
+            counts = self._tokens.setdefault(mode, [0, 0])
+            counts[0] += hit
+            counts[1] += miss
+
+    def hit_ratio(self, mode):
+        """获取指定模式的缓存命中率，无记录时返回None"""
+        with self._lock:
+            hit, miss = self._tokens.get(mode, (0, 0))
+        total = hit + miss
+        return hit / total if total else None
+
+    def get_stats(self):
+        """获取所有模式的缓存命中统计"""
+        with self._lock:
+            return {
+                mode: {
+                    "hit_tokens": hit,
+                    "miss_tokens": miss,
+                    "hit_ratio": hit / (hit + miss) if hit + miss else None,
+                }
+                for mode, (hit, miss) in self._tokens.items()
+            }
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求策略模块
+
+为每次API调用提供按模式的截止时间、带抖动的指数退避重试、
+基于观测延迟的对冲请求（超过p95仍未响应时补发一次，取先返回者），
+以及在服务持续异常时快速失败的熔断器。
+"""
+
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.utils.metrics import LatencyWindow
+from src.utils.tracing import current_trace, bind_trace
+from src.utils.cancellation import CancelToken
+
+
+class DeadlineExceeded(Exception):
+    """请求超过截止时间"""
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，暂停向服务发送请求"""
+
+
+class HedgeLost(Exception):
+    """对冲请求中落后的一方被放弃"""
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后放行一次试探请求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """初始化熔断器"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """当前状态：closed、open或half_open"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """判断是否允许发送请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # 冷却结束后只放行一个试探请求
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        """记录一次成功，关闭熔断器"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self):
+        """请求以与服务健康无关的原因结束时，释放试探名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或试探失败时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class RequestPolicy:
+    """请求执行策略
+
+    attempt(deadline, claim, cancel_token)执行一次请求：deadline为time.monotonic()下的截止时间，
+    claim()在产出第一个结果前调用，返回False时说明对冲的另一方已领先，应立即放弃；
+    cancel_token在调用方取消、对冲落后或超过截止时间时被取消，请求应尽快退出。
+    协程版本的attempt(deadline, claim)直接通过取消任务中断。
+    """
+
+    def __init__(self, config, retryable_errors=()):
+        """初始化策略，retryable_errors为可重试的异常类型"""
+        self.deadlines = config.request_deadlines
+        self.max_retries = config.request_max_retries
+        self.backoff_base = config.retry_backoff_base_ms / 1000
+        self.backoff_max = config.retry_backoff_max_ms / 1000
+        self.hedge_enabled = config.hedge_enabled
+        self.hedge_percentile = config.hedge_percentile
+        self.hedge_min_samples = config.hedge_min_samples
+        self.retryable_errors = tuple(retryable_errors) + (DeadlineExceeded,)
+        self.breaker = CircuitBreaker(config.circuit_failure_threshold, config.circuit_reset_seconds)
+        # 各模式从发出请求到产出第一个结果的延迟
+        self.latency = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+        # 统计信息
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fast_failures = 0
+
+    def _hedge_delay(self, mode):
+        """获取补发对冲请求前的等待时间，样本不足或未启用时返回None"""
+        if not self.hedge_enabled or self.latency.count(mode) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(mode, self.hedge_percentile)
+
+    def _backoff(self, retry):
+        """计算第retry次重试前的等待时间（指数退避加随机抖动）"""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** retry))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _check_breaker(self):
+        """熔断器打开时直接失败"""
+        if not self.breaker.allow():
+            self.fast_failures += 1
+            raise CircuitOpenError("服务暂时不可用，已暂停请求")
+
+    def _make_claim(self, mode, state, index, start_time):
+        """创建对冲请求的领先判定函数，第一个调用者胜出并记录延迟"""
+        def claim():
+            with state["lock"]:
+                if state["winner"] is None:
+                    state["winner"] = index
+                    self.latency.record(mode, time.monotonic() - start_time)
+                    if index > 0:
+                        self.hedge_wins += 1
+                return state["winner"] == index
+        return claim
+
+    def _new_state(self):
+        """创建一轮请求的共享状态"""
+        return {"winner": None, "lock": threading.Lock()}
+
+    def _should_retry(self, error, retry, deadline):
+        """判断失败后是否还应重试"""
+        if not isinstance(error, self.retryable_errors):
+            return False
+        return retry < self.max_retries and time.monotonic() < deadline
+
+    def execute(self, mode, attempt, cancel_token=None):
+        """在当前线程中按策略执行请求，返回attempt的结果，cancel_token为调用方的取消令牌"""
+        deadline = time.monotonic() + self.deadlines.get(mode, 60)
+        retry = 0
+        while True:
+            self._check_breaker()
+            try:
+                result = self._run_round(mode, attempt, deadline, cancel_token)
+            except Exception as e:
+                if isinstance(e, self.retryable_errors):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if not self._should_retry(e, retry, deadline):
+                    raise
+                time.sleep(min(self._backoff(retry), max(0.0, deadline - time.monotonic())))
+                retry += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                # 被中断（如KeyboardInterrupt）与服务健康无关，释放试探名额
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _run_round(self, mode, attempt, deadline, cancel_token=None):
+        """执行一轮请求，必要时补发对冲请求"""
+        state = self._new_state()
+        start_time = time.monotonic()
+        hedge_delay = self._hedge_delay(mode)
+        if hedge_delay is None:
+            result = attempt(deadline, self._make_claim(mode, state, 0, start_time), cancel_token)
+            self._make_claim(mode, state, 0, start_time)()
+            return result
+
+        # 每个尝试使用自己的取消令牌，调用方取消时一并取消
+        trace = current_trace()
+        futures = {}
+
+        def submit(index, claim_start):
+            token = CancelToken()
+            if cancel_token is not None:
+                cancel_token.add_callback(token.cancel)
+            future = self._executor.submit(
+                self._run_attempt, trace, attempt, deadline, self._make_claim(mode, state, index, claim_start), token
+            )
+            futures[future] = (index, token)
+
+        submit(0, start_time)
+        try:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done and state["winner"] is None and time.monotonic() < deadline:
+                # 主请求超过p95仍未响应，补发一次
+                self.hedges += 1
+                submit(1, time.monotonic())
+
+            error = None
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("请求超过截止时间")
+                for future in done:
+                    try:
+                        result = future.result()
+                    except HedgeLost:
+                        continue
+                    except Exception as e:
+                        error = e
+                        continue
+                    # 非流式请求在完成时才判定领先
+                    if self._make_claim(mode, state, futures[future][0], start_time)():
+                        return result
+            raise error or DeadlineExceeded("请求超过截止时间")
+        finally:
+            # 落后或超时的尝试立即取消：排队中的退还令牌，流式请求关闭连接
+            for future, (_, token) in futures.items():
+                if not future.done():
+                    future.cancel()
+                    token.cancel()
+                if cancel_token is not None:
+                    cancel_token.remove_callback(token.cancel)
+
+    @staticmethod
+    def _run_attempt(trace, attempt, deadline, claim, token):
+        """在工作线程中执行一次尝试，阶段耗时记录到发起者的追踪上"""
+        with bind_trace(trace):
+            return attempt(deadline, claim, token)
+
+    async def execute_async(self, mode, attempt):
+        """协程版本的execute，attempt(deadline, claim)返回协程"""
+        deadline = time.monotonic() + self.deadlines.get(mode, 60)
+        retry = 0
+        while True:
+            self._check_breaker()
+            try:
+                result = await self._run_round_async(mode, attempt, deadline)
+            except Exception as e:
+                if isinstance(e, self.retryable_errors):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if not self._should_retry(e, retry, deadline):
+                    raise
+                await asyncio.sleep(min(self._backoff(retry), max(0.0, deadline - time.monotonic())))
+                retry += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                # 被取消（CancelledError不是Exception的子类）与服务健康无关，释放试探名额
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _run_round_async(self, mode, attempt, deadline):
+        """协程版本的_run_round"""
+        state = self._new_state()
+        start_time = time.monotonic()
+        hedge_delay = self._hedge_delay(mode)
+        if hedge_delay is None:
+            try:
+                result = await asyncio.wait_for(
+                    attempt(deadline, self._make_claim(mode, state, 0, start_time)),
+                    max(0.0, deadline - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("请求超过截止时间")
+            self._make_claim(mode, state, 0, start_time)()
+            return result
+
+        tasks = {asyncio.ensure_future(attempt(deadline, self._make_claim(mode, state, 0, start_time))): 0}
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done and state["winner"] is None and time.monotonic() < deadline:
+            self.hedges += 1
+            hedge = asyncio.ensure_future(attempt(deadline, self._make_claim(mode, state, 1, time.monotonic())))
+            tasks[hedge] = 1
+
+        error = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise DeadlineExceeded("请求超过截止时间")
+                for task in done:
+                    try:
+                        result = task.result()
+                    except HedgeLost:
+                        continue
+                    except Exception as e:
+                        error = e
+                        continue
+                    if self._make_claim(mode, state, tasks[task], start_time)():
+                        return result
+            raise error or DeadlineExceeded("请求超过截止时间")
+        finally:
+            # 协程可以直接取消，落后的一方立即关闭连接
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self):
+        """获取策略统计"""
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fast_failures": self.fast_failures,
+            "circuit": self.breaker.state,
+        }
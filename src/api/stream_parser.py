@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式结果解析模块
+
+在流式输出的过程中逐段解析预测与建议列表，每条内容完整后立即产出，
+得到所需条数后即可结束读取。支持“序号. 内容”（序号可为多位数）、
+项目符号列表以及JSON字符串数组三种格式。
+"""
+
+import re
+import json
+
+# 带序号或项目符号的列表行，如“1. xxx”“12、xxx”“3) xxx”“- xxx”；项目符号后必须有空白，
+# 以免将“**标题**”“---”等Markdown标记当作列表项
+LIST_ITEM_PATTERN = re.compile(r"^\s*(?:\d+\s*[.、．)）]\s*|[-*•]\s+)(.+?)\s*$")
+# 只由-、*、_与空白组成的分隔线，如“---”“* * *”
+RULE_PATTERN = re.compile(r"^\s*[-*_][-*_\s]*$")
+
+
+class IncrementalListParser:
+    """增量列表解析器"""
+
+    def __init__(self, max_items=5):
+        """初始化解析器，max_items为需要的条目数，达到后done为True"""
+        self.max_items = max_items
+        self.items = []
+        self._buffer = ""
+        self._lines = []
+        # 输出格式：None表示尚未确定，"json"或"lines"
+        self._format = None
+        # JSON数组解析状态
+        self._json_pos = 0
+        self._string_start = None
+        self._escaped = False
+        self._json_closed = False
+
+    @property
+    def done(self):
+        """是否已得到足够的条目，或JSON数组已结束"""
+        if self.max_items is not None and len(self.items) >= self.max_items:
+            return True
+        return self._json_closed
+
+    def feed(self, delta):
+        """输入一段增量文本，返回新完成的条目列表"""
+        if self.done:
+            return []
+        self._buffer += delta
+        if self._format is None:
+            self._detect_format()
+        if self._format == "json":
+            return self._feed_json()
+        if self._format == "lines":
+            return self._feed_lines()
+        return []
+
+    def finish(self):
+        """输入结束时调用，处理最后一行并返回新增条目；未找到列表格式时按行截取"""
+        if self._format is None and self._buffer.strip():
+            self._format = "lines"
+        new_items = []
+        if self._format == "lines":
+            new_items = self._feed_lines()
+            if self._buffer:
+                new_items += self._take_line(self._buffer)
+                self._buffer = ""
+
+        if not self.items and self._format == "lines":
+            # 没有任何序号行时，直接取前几行非空内容
+            fallback = [line.strip() for line in self._lines if line.strip()]
+            self.items = fallback[:self.max_items] if self.max_items else fallback
+            return list(self.items)
+        return new_items
+
+    def _detect_format(self):
+        """根据第一个有效字符判断输出格式，跳过Markdown代码块标记"""
+        text = self._buffer.lstrip()
+        if not text:
+            return
+        if text.startswith("```"):
+            if "\n" not in text:
+                return
+            # 去掉代码块起始行
+            text = text[text.index("\n") + 1:].lstrip()
+            if not text:
+                self._buffer = ""
+                return
+        if text.startswith("["):
+            self._format = "json"
+            self._buffer = text
+            self._json_pos = 1
+        else:
+            self._format = "lines"
+
+    def _feed_lines(self):
+        """处理已完整的行"""
+        new_items = []
+        while "\n" in self._buffer and not self.done:
+            line, self._buffer = self._buffer.split("\n", 1)
+            new_items.extend(self._take_line(line))
+        return new_items
+
+    def _take_line(self, line):
+        """解析一行，是列表项时记录并返回"""
+        self._lines.append(line)
+        match = LIST_ITEM_PATTERN.match(line)
+        if not match or self.done or RULE_PATTERN.match(line):
+            return []
+        item = match.group(1).strip().strip("\"“”")
+        if not item:
+            return []
+        self.items.append(item)
+        return [item]
+
+    def _feed_json(self):
+        """逐字符扫描JSON数组，每个字符串元素闭合后立即解码"""
+        new_items = []
+        buffer = self._buffer
+        pos = self._json_pos
+        while pos < len(buffer) and not self.done:
+            char = buffer[pos]
+            if self._string_start is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    literal = buffer[self._string_start:pos + 1]
+                    self._string_start = None
+                    try:
+                        item = json.loads(literal).strip()
+                    except ValueError:
+                        item = ""
+                    if item:
+                        self.items.append(item)
+                        new_items.append(item)
+            elif char == '"':
+                self._string_start = pos
+            elif char == "]":
+                self._json_closed = True
+            pos += 1
+        self._json_pos = pos
+        return new_items
+
+
+def parse_list(content, max_items=5):
+    """解析完整的输出文本，返回条目列表"""
+    parser = IncrementalListParser(max_items)
+    parser.feed(content or "")
+    parser.finish()
+    return parser.items
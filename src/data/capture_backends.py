@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+聊天内容捕获后端模块
+
+WeChatCapture只负责去重与聊天历史管理，读取窗口文本由可替换的后端完成：
+- win32：激活微信窗口，全选复制后读取剪贴板（仅Windows）
+- file：读取由其他程序写入的文本文件
+- stdin：从标准输入读取，每段捕获以单独一行“---”结束
+- replay：按录制时的间隔（或加速）回放录制的捕获会话，用于压测与性能回归
+录制的会话为JSONL文件，每行为{"t": 距开始的秒数, "text": 捕获的文本}。
+"""
+
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+from src.utils.tracing import span
+
+# 会话文件与标准输入中分隔两次捕获的行
+CAPTURE_SEPARATOR = "---"
+# 等待窗口激活与复制完成时的轮询间隔（秒），从最小值起逐次翻倍
+POLL_INITIAL_INTERVAL = 0.001
+POLL_MAX_INTERVAL = 0.016
+
+
+class CaptureBackend:
+    """捕获后端基类"""
+
+    name = "base"
+    # 读取不会切换窗口或占用剪贴板，可以在后台轮询
+    passive = False
+
+    def read_text(self):
+        """读取当前聊天窗口的文本，没有可用内容时返回None，失败时抛出异常"""
+        raise NotImplementedError
+
+    def is_foreground(self):
+        """聊天窗口当前是否处于前台"""
+        return False
+
+    def window_title(self):
+        """聊天窗口的标题，无法获取时返回空字符串"""
+        return ""
+
+
+def wait_until(predicate, timeout, initial_interval=POLL_INITIAL_INTERVAL, max_interval=POLL_MAX_INTERVAL):
+    """轮询predicate直到返回真值或超时，间隔从initial_interval起逐次翻倍
+
+    返回predicate的真值结果，超时返回None。
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    while True:
+        result = predicate()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+class Win32WindowProvider:
+    """通过pywin32操作窗口与剪贴板，仅在创建时导入Windows接口"""
+
+    def __init__(self):
+        """导入Windows接口"""
+        import win32gui
+        import win32con
+        import win32clipboard
+        import pyperclip
+        self.win32gui = win32gui
+        self.win32con = win32con
+        self.win32clipboard = win32clipboard
+        self.pyperclip = pyperclip
+
+    def find_window(self):
+        """查找微信窗口，返回窗口句柄，找不到时返回None"""
+        win32gui = self.win32gui
+
+        def callback(hwnd, extra):
+            if win32gui.IsWindowVisible(hwnd) and win32gui.IsWindowEnabled(hwnd):
+                window_text = win32gui.GetWindowText(hwnd)
+                if "微信" in window_text:
+                    extra.append(hwnd)
+            return True
+
+        hwnd_list = []
+        win32gui.EnumWindows(callback, hwnd_list)
+        # 找到微信主窗口
+        return hwnd_list[0] if hwnd_list else None
+
+    def foreground_window(self):
+        """当前前台窗口的句柄"""
+        return self.win32gui.GetForegroundWindow()
+
+    def window_title(self, hwnd):
+        """窗口标题"""
+        return self.win32gui.GetWindowText(hwnd)
+
+    def set_foreground(self, hwnd):
+        """激活窗口"""
+        self.win32gui.SetForegroundWindow(hwnd)
+
+    def _send_keys(self, hwnd, *keys):
+        """向窗口发送组合键"""
+        for key in keys:
+            self.win32gui.SendMessage(hwnd, self.win32con.WM_KEYDOWN, key, 0)
+        for key in reversed(keys):
+            self.win32gui.SendMessage(hwnd, self.win32con.WM_KEYUP, key, 0)
+
+    def select_all(self, hwnd):
+        """模拟Ctrl+A全选"""
+        self._send_keys(hwnd, self.win32con.VK_CONTROL, ord('A'))
+
+    def copy(self, hwnd):
+        """模拟Ctrl+C复制"""
+        self._send_keys(hwnd, self.win32con.VK_CONTROL, ord('C'))
+
+    def cancel_selection(self, hwnd):
+        """按ESC取消选择"""
+        self._send_keys(hwnd, self.win32con.VK_ESCAPE)
+
+    def clipboard_sequence(self):
+        """剪贴板序列号，剪贴板内容每次变化时递增"""
+        return self.win32clipboard.GetClipboardSequenceNumber()
+
+    def read_clipboard(self):
+        """读取剪贴板文本，剪贴板被其他程序占用时抛出异常"""
+        win32clipboard, win32con = self.win32clipboard, self.win32con
+        win32clipboard.OpenClipboard()
+        try:
+            if win32clipboard.IsClipboardFormatAvailable(win32con.CF_TEXT):
+                return win32clipboard.GetClipboardData(win32con.CF_TEXT).decode('gbk')
+            return self.pyperclip.paste()
+        finally:
+            win32clipboard.CloseClipboard()
+
+
+class SimulatedWindowProvider:
+    """模拟的微信窗口与剪贴板，窗口激活与复制分别在设定的延迟后生效
+
+    与Win32WindowProvider接口一致，用于在非Windows环境验证与测量等待逻辑。
+    """
+
+    WECHAT_HWND = 1
+
+    def __init__(self, text="", focus_delay=0.03, copy_delay=0.05):
+        """初始化模拟窗口，text为复制得到的聊天内容"""
+        self.text = text
+        self.focus_delay = focus_delay
+        self.copy_delay = copy_delay
+        self._foreground = 0
+        self._focus_at = None
+        self._copy_at = None
+        self._sequence = 0
+        self._clipboard = ""
+        self._selected = False
+
+    def _update(self):
+        """使到期的激活与复制生效"""
+        now = time.monotonic()
+        if self._focus_at is not None and now >= self._focus_at:
+            self._foreground, self._focus_at = self.WECHAT_HWND, None
+        if self._copy_at is not None and now >= self._copy_at:
+            self._clipboard, self._copy_at = self.text, None
+            self._sequence += 1
+
+    def find_window(self):
+        """模拟窗口总是存在"""
+        return self.WECHAT_HWND
+
+    def foreground_window(self):
+        """当前前台窗口的句柄"""
+        self._update()
+        return self._foreground
+
+    def window_title(self, hwnd):
+        """窗口标题"""
+        return "微信" if hwnd == self.WECHAT_HWND else ""
+
+    def set_foreground(self, hwnd):
+        """激活窗口，微信窗口在focus_delay后才真正处于前台"""
+        if hwnd == self.WECHAT_HWND:
+            self._focus_at = time.monotonic() + self.focus_delay
+        else:
+            self._foreground = hwnd
+
+    def select_all(self, hwnd):
+        """全选"""
+        self._selected = True
+
+    def copy(self, hwnd):
+        """复制，剪贴板在copy_delay后才更新"""
+        if self._selected:
+            self._copy_at = time.monotonic() + self.copy_delay
+
+    def cancel_selection(self, hwnd):
+        """取消选择"""
+        self._selected = False
+
+    def clipboard_sequence(self):
+        """剪贴板序列号"""
+        self._update()
+        return self._sequence
+
+    def read_clipboard(self):
+        """读取剪贴板文本"""
+        self._update()
+        return self._clipboard
+
+
+class Win32ClipboardBackend(CaptureBackend):
+    """通过模拟全选复制读取微信窗口文本
+
+    不再固定等待：激活窗口后轮询前台窗口，复制后轮询剪贴板序列号与内容，
+    分别以focus_timeout与copy_timeout为上限。provider默认为Win32WindowProvider，
+    可以替换为SimulatedWindowProvider等实现。
+    """
+
+    name = "win32"
+
+    def __init__(self, provider=None, focus_timeout=0.3, copy_timeout=1.0):
+        """初始化后端，超时时间单位为秒"""
+        self.provider = provider or Win32WindowProvider()
+        self.focus_timeout = focus_timeout
+        self.copy_timeout = copy_timeout
+        # 微信窗口句柄
+        self.wechat_hwnd = None
+        # 最近一次捕获中等待窗口激活与复制完成的耗时（秒），超时时为None
+        self.last_timings = {}
+
+    def find_wechat_window(self):
+        """查找微信窗口"""
+        self.wechat_hwnd = self.provider.find_window()
+        return self.wechat_hwnd is not None
+
+    def is_foreground(self):
+        """判断微信窗口当前是否处于前台"""
+        try:
+            hwnd = self.provider.foreground_window()
+            if self.wechat_hwnd and hwnd == self.wechat_hwnd:
+                return True
+            return "微信" in self.provider.window_title(hwnd)
+        except Exception:
+            return False
+
+    def window_title(self):
+        """微信窗口的标题，单独打开的聊天窗口以聊天对象命名"""
+        if not self.wechat_hwnd:
+            return ""
+        return self.provider.window_title(self.wechat_hwnd)
+
+    def _read_new_clipboard(self, sequence):
+        """剪贴板序列号变化且内容可读时返回内容
+
+        复制时剪贴板可能先被清空再写入，读取失败或内容为空时继续等待。
+        """
+        if self.provider.clipboard_sequence() == sequence:
+            return None
+        try:
+            return self.provider.read_clipboard() or None
+        except Exception:
+            return None
+
+    def read_text(self):
+        """激活微信窗口，全选复制后读取剪贴板，找不到窗口或复制超时时返回None"""
+        if not self.wechat_hwnd and not self.find_wechat_window():
+            return None
+        provider, hwnd = self.provider, self.wechat_hwnd
+        self.last_timings = {}
+
+        # 保存当前活动窗口句柄，以便操作后恢复
+        current_hwnd = provider.foreground_window()
+
+        try:
+            # 激活微信窗口，等待其真正处于前台；超时后仍继续，按键消息直接发送给窗口
+            with span("capture_focus"):
+                start_time = time.perf_counter()
+                provider.set_foreground(hwnd)
+                if wait_until(lambda: provider.foreground_window() == hwnd, self.focus_timeout):
+                    self.last_timings["focus"] = time.perf_counter() - start_time
+                else:
+                    self.last_timings["focus"] = None
+
+            # 全选并复制，等待剪贴板序列号变化且内容可读
+            with span("capture_copy"):
+                start_time = time.perf_counter()
+                sequence = provider.clipboard_sequence()
+                provider.select_all(hwnd)
+                provider.copy(hwnd)
+                chat_content = wait_until(lambda: self._read_new_clipboard(sequence), self.copy_timeout)
+                self.last_timings["copy"] = time.perf_counter() - start_time if chat_content else None
+
+            provider.cancel_selection(hwnd)
+        finally:
+            # 将焦点返回给原来的窗口
+            try:
+                if current_hwnd and current_hwnd != hwnd:
+                    provider.set_foreground(current_hwnd)
+            except Exception:
+                pass  # 忽略恢复焦点时的错误
+
+        if chat_content is None:
+            # 剪贴板中仍是之前的内容，不能当作聊天记录
+            raise TimeoutError(f"等待复制完成超时（{self.copy_timeout:.2f}秒）")
+        return chat_content
+
+
+class FileBackend(CaptureBackend):
+    """读取文本文件的全部内容作为一次捕获，文件不存在时返回None"""
+
+    name = "file"
+    passive = True
+
+    def __init__(self, path):
+        """初始化后端，path为由其他程序持续更新的文本文件"""
+        self.path = Path(path)
+
+    def read_text(self):
+        """读取文件内容"""
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+
+class StdinBackend(CaptureBackend):
+    """在后台线程中读取标准输入，每读到一段完整的捕获就替换当前内容"""
+
+    name = "stdin"
+    passive = True
+
+    def __init__(self, stream=None):
+        """启动读取线程"""
+        self.stream = stream or sys.stdin
+        self._latest = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        """按分隔行切分输入，输入结束时剩余的内容也作为一次捕获"""
+        lines = []
+        for line in self.stream:
+            if line.strip() == CAPTURE_SEPARATOR:
+                self._publish(lines)
+                lines = []
+            else:
+                lines.append(line)
+        self._publish(lines)
+
+    def _publish(self, lines):
+        """保存一段捕获"""
+        text = "".join(lines).strip("\n")
+        if text:
+            with self._lock:
+                self._latest = text
+
+    def read_text(self):
+        """返回最近读到的一段捕获"""
+        with self._lock:
+            return self._latest
+
+
+def load_session(path):
+    """读取录制的会话，返回按时间排序的[(秒数, 文本)]列表"""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                events.append((float(record["t"]), record["text"]))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+class SessionRecorder:
+    """将每次内容有变化的捕获追加写入会话文件，供回放使用"""
+
+    def __init__(self, path):
+        """初始化录制器，path的上级目录不存在时自动创建"""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._start = None
+        self._lock = threading.Lock()
+
+    def record(self, text):
+        """追加一次捕获，时间从第一次录制开始计算"""
+        with self._lock:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            line = json.dumps({"t": round(now - self._start, 3), "text": text}, ensure_ascii=False)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class ReplayBackend(CaptureBackend):
+    """回放录制的捕获会话
+
+    speed为回放倍速，1为按原始间隔，大于1时加速，0表示不等待。
+    由界面读取时按经过的时间返回当时的内容（speed为0时每次读取前进一条）；
+    由基准工具调用play()驱动时，依次推进到每次捕获。
+    """
+
+    name = "replay"
+    passive = True
+
+    def __init__(self, events, speed=1.0):
+        """初始化后端，events为[(秒数, 文本)]列表"""
+        if not events:
+            raise ValueError("回放会话为空")
+        self.events = list(events)
+        self.speed = speed
+        self._cursor = -1
+        self._start = None
+        self._driven = False
+        # 由于处理耗时，实际推进时间比录制时间晚的最大值（秒）
+        self.max_lag = 0.0
+
+    @classmethod
+    def from_file(cls, path, speed=1.0):
+        """从会话文件创建回放后端"""
+        return cls(load_session(path), speed)
+
+    def _due_index(self):
+        """按经过的时间计算当前应显示的捕获序号"""
+        if self._start is None:
+            self._start = time.monotonic()
+        if self.speed <= 0:
+            return min(self._cursor + 1, len(self.events) - 1)
+        elapsed = (time.monotonic() - self._start) * self.speed + self.events[0][0]
+        index = self._cursor
+        while index + 1 < len(self.events) and self.events[index + 1][0] <= elapsed:
+            index += 1
+        return max(index, 0)
+
+    def read_text(self):
+        """返回当前的捕获内容"""
+        if not self._driven:
+            self._cursor = self._due_index()
+        return self.events[max(self._cursor, 0)][1]
+
+    def play(self):
+        """按录制时的间隔依次推进到每次捕获，产出(序号, 推进延迟秒数)
+
+        上一次捕获的处理超过录制间隔时不再等待，延迟记录在max_lag中。
+        """
+        self._driven = True
+        start = time.monotonic()
+        base = self.events[0][0]
+        for index, (offset, _) in enumerate(self.events):
+            lag = 0.0
+            if self.speed > 0:
+                wait = start + (offset - base) / self.speed - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                else:
+                    lag = -wait
+                    self.max_lag = max(self.max_lag, lag)
+            self._cursor = index
+            yield index, lag
+
+
+def create_backend(config):
+    """根据配置创建捕获后端"""
+    backend = config.capture_backend
+    if backend == "win32":
+        return Win32ClipboardBackend(
+            focus_timeout=config.capture_focus_timeout_ms / 1000,
+            copy_timeout=config.capture_copy_timeout_ms / 1000
+        )
+    if backend == "file":
+        return FileBackend(config.capture_file)
+    if backend == "stdin":
+        return StdinBackend()
+    if backend == "replay":
+        return ReplayBackend.from_file(config.capture_replay_path, config.capture_replay_speed)
+    raise ValueError(f"未知的捕获后端: {backend}")
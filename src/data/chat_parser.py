@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+聊天文本解析模块
+
+将从微信复制的聊天文本拆分为单条消息，并识别聊天对象。
+"""
+
+import re
+from collections import Counter
+
+# 带时间的发送者行，如“小明 09:01”“小明 2024/10/1 09:01:05”
+HEADER_PATTERN = re.compile(
+    r"^(?P<name>\S.*?)\s+(?P<time>(?:\d{4}[/年-]\d{1,2}[/月-]\d{1,2}日?\s+)?\d{1,2}:\d{2}(?::\d{2})?)$"
+)
+# 只有发送者的行，如“小明：”
+NAME_ONLY_PATTERN = re.compile(r"^(?P<name>\S.{0,30}?)[:：]$")
+
+
+def split_messages(text):
+    """将捕获的聊天文本拆分为(发送者行, 发送者, 内容)列表，无法识别发送者时发送者为None"""
+    messages = []
+    header = None
+    name = None
+    lines = []
+
+    def _flush():
+        content = " ".join(line.strip() for line in lines if line.strip())
+        if content:
+            messages.append((header, name, content))
+
+    found_header = False
+    for line in (text or "").splitlines():
+        match = HEADER_PATTERN.match(line.strip()) or NAME_ONLY_PATTERN.match(line.strip())
+        if match:
+            found_header = True
+            _flush()
+            header, name, lines = line.strip(), match.group("name").strip(), []
+        else:
+            lines.append(line)
+    _flush()
+
+    if not found_header:
+        # 没有发送者信息时每行作为一条消息
+        return [(None, None, line.strip()) for line in (text or "").splitlines() if line.strip()]
+    return messages
+
+
+def split_blocks(text):
+    """将捕获的聊天文本按消息拆分为原始文本块（发送者行与其后的内容行），没有发送者信息时每行为一块"""
+    blocks = []
+    lines = []
+    found_header = False
+    for line in (text or "").splitlines():
+        # 去掉首尾空白，同一条消息在不同次捕获中的文本保持一致
+        line = line.strip()
+        if HEADER_PATTERN.match(line) or NAME_ONLY_PATTERN.match(line):
+            found_header = True
+            if lines:
+                blocks.append("\n".join(lines))
+            lines = [line]
+        elif line:
+            lines.append(line)
+    if lines:
+        blocks.append("\n".join(lines))
+
+    if not found_header:
+        return [line.strip() for line in (text or "").splitlines() if line.strip()]
+    return blocks
+
+
+def parse_block(block):
+    """将split_blocks得到的文本块解析为(发送者, 时间, 内容)，没有发送者行时发送者与时间为None"""
+    first, _, rest = block.partition("\n")
+    match = HEADER_PATTERN.match(first)
+    if match:
+        return match.group("name").strip(), match.group("time"), rest
+    match = NAME_ONLY_PATTERN.match(first)
+    if match:
+        return match.group("name").strip(), None, rest
+    return None, None, block
+
+
+def conversation_text(chat_history):
+    """将聊天历史中的消息合并为一段聊天文本"""
+    return "\n".join(chat_history)
+
+
+def detect_contact(messages, self_name=""):
+    """根据消息的发送者推断聊天对象，取出现最多的非自己的发送者，无法判断时返回空字符串"""
+    counts = Counter(name for _, name, _ in messages if name and name != self_name)
+    if not counts:
+        return ""
+    return counts.most_common(1)[0][0]
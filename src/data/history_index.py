@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+聊天记录存储与检索模块
+
+将每次捕获新增的消息按聊天对象保存到本地SQLite数据库（WAL模式），并写入FTS5全文索引。
+构建提示时只检索与当前话题最相关的几段过往对话，而不是发送全部历史；
+程序重新启动或切换聊天对象时，也从这里加载该对象最近的消息作为上下文。
+中文没有分词，索引与查询都使用字符二元组，按BM25排序。
+同一条消息按哈希去重，哈希包含该消息之前的内容，真正重复发送的相同消息不会被合并；
+每个聊天对象只保留最近的若干条消息，超过保留天数的消息在启动时清理。
+"""
+
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+from src.data.chat_parser import split_messages, detect_contact
+
+# 查询最多使用的二元组数量，过长的查询只取前面的部分
+MAX_QUERY_TERMS = 24
+# 去掉空白与标点后再切分二元组
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+# 每写入多少条消息检查一次保留上限
+TRIM_INTERVAL = 200
+# 计算消息哈希时最多回看的消息条数，连续重复超过该条数的相同消息会被合并
+DIGEST_CONTEXT = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    contact TEXT NOT NULL,
+    speaker TEXT,
+    sent_at TEXT,
+    content TEXT NOT NULL,
+    digest INTEGER NOT NULL UNIQUE,
+    captured_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_contact ON messages (contact, id);
+CREATE INDEX IF NOT EXISTS messages_captured ON messages (captured_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    contact_key, tokens, content='', detail='column'
+);
+"""
+
+
+def bigram_tokens(text):
+    """将文本切分为字符二元组，单字内容使用单字本身"""
+    tokens = []
+    for part in NON_WORD_PATTERN.split(text.lower()):
+        if len(part) == 1:
+            tokens.append(part)
+        tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+def contact_key(contact):
+    """将聊天对象名称转换为可以在FTS5中精确匹配的标记"""
+    return "c" + hashlib.blake2b(contact.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _digest(contact, rendered, before, repeat):
+    """计算消息的稳定哈希，before为连续重复之前的一条消息，repeat为之前连续出现相同消息的次数"""
+    value = hashlib.blake2b(f"{contact}\x1f{before}\x1f{repeat}\x1f{rendered}".encode("utf-8"), digest_size=8)
+    # SQLite的INTEGER为有符号64位
+    return int.from_bytes(value.digest(), "big", signed=True)
+
+
+def message_digests(contact, messages, previous=()):
+    """计算messages中各消息的哈希，previous为聊天中紧邻其前的消息
+
+    重复捕获的同一条消息哈希不变，先后发送的两条相同消息哈希不同。
+    """
+    rendered = [message.render() for message in previous][-DIGEST_CONTEXT:]
+    offset = len(rendered)
+    rendered.extend(message.render() for message in messages)
+    digests = []
+    for index in range(offset, len(rendered)):
+        repeat = 0
+        while repeat < min(index, DIGEST_CONTEXT) and rendered[index - 1 - repeat] == rendered[index]:
+            repeat += 1
+        before = rendered[index - 1 - repeat] if index > repeat else ""
+        digests.append(_digest(contact, rendered[index], before, repeat))
+    return digests
+
+
+class HistoryIndex:
+    """按聊天对象保存的聊天记录及其全文索引"""
+
+    def __init__(self, path, max_messages=20000, retention_days=365):
+        """打开或创建数据库，max_messages为每个聊天对象保留的消息数，retention_days为0时不按时间清理"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_messages = max_messages
+        self.retention_days = retention_days
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # 各聊天对象自上次检查保留上限以来写入的消息数
+        self._pending_trim = {}
+        self.last_query_time = None
+        self.expire()
+
+    def _migrate(self):
+        """为旧版本的数据库补充消息时间列"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(messages)")]
+        if columns and "sent_at" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE messages ADD COLUMN sent_at TEXT")
+
+    def add_messages(self, contact, messages, previous=()):
+        """在一个事务中写入消息记录（ChatMessage），已保存的消息会被忽略，返回新增的消息数
+
+        previous为聊天中紧邻这些消息之前的消息，用于区分重复发送的相同消息。
+        """
+        key = contact_key(contact)
+        now = time.time()
+        added = 0
+        digests = message_digests(contact, messages, previous)
+        with self._lock, self._conn:
+            for message, digest in zip(messages, digests):
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO messages (contact, speaker, sent_at, content, digest, captured_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (contact, message.sender, message.timestamp, message.text, digest, now)
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO messages_fts (rowid, contact_key, tokens) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, key, " ".join(bigram_tokens(message.text)))
+                    )
+                    added += 1
+            pending = self._pending_trim.get(contact, 0) + added
+            if pending >= TRIM_INTERVAL:
+                self._trim(contact)
+                pending = 0
+            self._pending_trim[contact] = pending
+        return added
+
+    def _delete(self, rows):
+        """删除(id, 聊天对象, 内容)记录及其索引，调用方需持有锁并处于事务中
+
+        无内容的FTS5表删除时需要提供写入时的值。
+        """
+        for message_id, contact, content in rows:
+            self._conn.execute(
+                "INSERT INTO messages_fts (messages_fts, rowid, contact_key, tokens) VALUES ('delete', ?, ?, ?)",
+                (message_id, contact_key(contact), " ".join(bigram_tokens(content)))
+            )
+        self._conn.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+
+    def _trim(self, contact):
+        """删除该聊天对象超过保留上限的旧消息，调用方需持有锁并处于事务中"""
+        rows = self._conn.execute(
+            "SELECT id, contact, content FROM messages WHERE contact = ? AND id <= ("
+            "SELECT id FROM messages WHERE contact = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (contact, contact, self.max_messages)
+        ).fetchall()
+        self._delete(rows)
+
+    def expire(self):
+        """删除超过保留天数的消息，并按保留上限裁剪所有聊天对象"""
+        with self._lock, self._conn:
+            if self.retention_days > 0:
+                self._delete(self._conn.execute(
+                    "SELECT id, contact, content FROM messages WHERE captured_at < ?",
+                    (time.time() - self.retention_days * 86400,)
+                ).fetchall())
+            contacts = self._conn.execute(
+                "SELECT contact FROM messages GROUP BY contact HAVING COUNT(*) > ?", (self.max_messages,)
+            ).fetchall()
+            for (contact,) in contacts:
+                self._trim(contact)
+
+    def recent(self, contact, limit):
+        """按时间顺序返回该聊天对象最近的limit条消息，每项为(发送者, 时间, 内容)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT speaker, sent_at, content FROM messages WHERE contact = ? ORDER BY id DESC LIMIT ?",
+                (contact, limit)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def last_contact(self):
+        """最近一次写入消息的聊天对象，没有记录时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT contact FROM messages ORDER BY id DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def search(self, query, contact="", limit=3, exclude=()):
+        """检索与query最相关的过往消息，每条结果附带紧随其后的一条消息
+
+        返回[(发送者, 内容), (发送者, 内容)]形式的对话片段列表，exclude中的内容不会作为结果。
+        """
+        terms = list(dict.fromkeys(bigram_tokens(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        match = "contact_key:{} AND tokens:({})".format(
+            contact_key(contact), " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        )
+        exclude = set(exclude)
+        start_time = time.perf_counter()
+        exchanges = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit + len(exclude))
+            ).fetchall()
+            for (message_id,) in rows:
+                hit = self._conn.execute(
+                    "SELECT speaker, replace(content, char(10), ' ') FROM messages WHERE id = ?", (message_id,)
+                ).fetchone()
+                if hit is None or hit[1] in exclude:
+                    continue
+                reply = self._conn.execute(
+                    "SELECT speaker, replace(content, char(10), ' ') FROM messages "
+                    "WHERE contact = ? AND id > ? ORDER BY id LIMIT 1",
+                    (contact, message_id)
+                ).fetchone()
+                exchanges.append([hit] + ([reply] if reply and reply[1] not in exclude else []))
+                if len(exchanges) >= limit:
+                    break
+        self.last_query_time = time.perf_counter() - start_time
+        return exchanges
+
+    def related_exchanges(self, text, self_name="", limit=3, query_messages=2, contact=None):
+        """根据一次捕获的最后几条消息检索相关的过往对话，当前捕获中已有的消息不会重复返回
+
+        contact为写入时使用的聊天对象，未提供时根据消息的发送者推断。
+        """
+        messages = split_messages(text)
+        if not messages:
+            return []
+        if contact is None:
+            contact = detect_contact(messages, self_name)
+        query = " ".join(content for _, _, content in messages[-query_messages:])
+        return self.search(query, contact, limit, exclude=[content for _, _, content in messages])
+
+    def count(self, contact=None):
+        """统计已索引的消息数"""
+        with self._lock:
+            if contact is None:
+                return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE contact = ?", (contact,)
+            ).fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
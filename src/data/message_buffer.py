@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+聊天消息缓冲模块
+
+将捕获到的消息解析为紧凑的消息记录（发送者、时间、内容），保存在按总字节数限制的环形缓冲中。
+单次捕获再大，缓冲占用的内存也不会超过上限；构建提示时可以按token预算或条数选取完整的消息窗口。
+"""
+
+from collections import deque, Counter
+from itertools import islice
+
+from src.data.chat_parser import parse_block
+from src.utils.token_budget import estimate_tokens, CJK_TOKENS_PER_CHAR
+
+
+class ChatMessage:
+    """一条聊天消息"""
+
+    __slots__ = ("sender", "timestamp", "text", "digest", "size", "tokens")
+
+    def __init__(self, sender, timestamp, text, digest):
+        """创建消息记录，digest为原始文本块的哈希，用于在后续捕获中定位该消息"""
+        self.sender = sender
+        self.timestamp = timestamp
+        self.text = text
+        self.digest = digest
+        rendered = self.render()
+        # 占用的字节数（UTF-8），以及在提示中占用的token数（含换行）
+        self.size = len(rendered.encode("utf-8"))
+        self.tokens = estimate_tokens(rendered) + 1
+
+    @classmethod
+    def from_block(cls, block, digest):
+        """由split_blocks得到的文本块创建消息记录"""
+        sender, timestamp, text = parse_block(block)
+        return cls(sender, timestamp, text, digest)
+
+    def header(self):
+        """发送者行，没有发送者时返回None"""
+        if self.sender is None:
+            return None
+        if self.timestamp is None:
+            return f"{self.sender}："
+        return f"{self.sender} {self.timestamp}"
+
+    def render(self):
+        """还原为聊天文本中的消息块"""
+        header = self.header()
+        if header is None:
+            return self.text
+        return f"{header}\n{self.text}" if self.text else header
+
+    def truncated(self, max_bytes):
+        """返回内容只保留末尾部分、总字节数不超过max_bytes的副本"""
+        text = self.text.encode("utf-8")
+        keep = max_bytes - (self.size - len(text))
+        tail = text[-keep:] if keep > 0 else b""
+        # 截断处可能落在多字节字符中间，丢弃不完整的字符
+        return ChatMessage(self.sender, self.timestamp, tail.decode("utf-8", errors="ignore"), self.digest)
+
+    def truncated_tokens(self, max_tokens):
+        """返回内容只保留末尾部分、token数不超过max_tokens的副本"""
+        overhead = self.tokens - estimate_tokens(self.text)
+        # 按每个字符最多占用的token数计算可以保留的字符数
+        keep = int((max_tokens - overhead) / CJK_TOKENS_PER_CHAR)
+        return ChatMessage(self.sender, self.timestamp, self.text[-keep:] if keep > 0 else "", self.digest)
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return f"ChatMessage({self.sender!r}, {self.timestamp!r}, {self.text[:20]!r})"
+
+
+class MessageBuffer:
+    """按总字节数限制的消息环形缓冲，超出上限时丢弃最旧的消息"""
+
+    def __init__(self, max_bytes):
+        """初始化缓冲，max_bytes为所有消息的字节数上限"""
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._messages = deque()
+        # 缓冲中各消息哈希出现的次数
+        self._known = Counter()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __contains__(self, digest):
+        """缓冲中是否有该哈希的消息"""
+        return digest in self._known
+
+    def append(self, message):
+        """追加一条消息，返回因超出上限而丢弃的消息数
+
+        单条消息超过上限时只保留其内容的末尾部分。
+        """
+        if message.size > self.max_bytes:
+            message = message.truncated(self.max_bytes)
+        self._messages.append(message)
+        self._known[message.digest] += 1
+        self.nbytes += message.size
+
+        evicted = 0
+        # 最新的消息总是保留
+        while self.nbytes > self.max_bytes and len(self._messages) > 1:
+            old = self._messages.popleft()
+            self.nbytes -= old.size
+            self._known[old.digest] -= 1
+            if not self._known[old.digest]:
+                del self._known[old.digest]
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        """清空缓冲"""
+        self._messages.clear()
+        self._known.clear()
+        self.nbytes = 0
+
+    def last(self, count):
+        """按时间顺序返回最新的count条消息"""
+        if count <= 0:
+            return []
+        messages = list(islice(reversed(self._messages), count))
+        messages.reverse()
+        return messages
+
+    def digests(self, count):
+        """按时间顺序返回最新的count条消息的哈希"""
+        return [message.digest for message in self.last(count)]
+
+    def window(self, max_tokens=None, max_messages=None):
+        """从最新的消息向前选取不超过token预算与条数的完整消息，按时间顺序返回
+
+        最新的一条消息总会被选取，超出预算时只保留其内容的末尾部分。
+        """
+        selected = []
+        remaining = max_tokens
+        for message in reversed(self._messages):
+            if max_messages is not None and len(selected) >= max_messages:
+                break
+            if remaining is not None:
+                if message.tokens > remaining:
+                    if not selected:
+                        selected.append(message.truncated_tokens(remaining))
+                    break
+                remaining -= message.tokens
+            selected.append(message)
+        selected.reverse()
+        return selected
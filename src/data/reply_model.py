@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地回复预测模块
+
+从捕获到的聊天记录中增量学习“上一条消息 → 对方回复”的对应关系，
+以上一条消息的字符二元组为索引，在本地毫秒级给出候选回复。
+用于点击后立即显示，以及离线或被限流时代替模型的预测结果。
+模型以gzip压缩的JSON快照保存在本地，新学到的消息对由后台线程追加写入日志文件，
+日志积累到一定数量或候选被裁剪后再在后台合并为新的快照，学习本身不写文件。
+"""
+
+import os
+import re
+import gzip
+import json
+import math
+import hashlib
+import threading
+from collections import deque
+
+from src.data.chat_parser import split_messages
+
+# 图片、表情等非文本消息，如“[图片]”
+PLACEHOLDER_PATTERN = re.compile(r"^\[[^\]]{1,10}\]$")
+
+# 记录的回复最大长度，过长的内容不适合作为候选
+MAX_REPLY_LENGTH = 40
+# 保留的已学习消息对数量，用于跳过重复捕获的内容
+SEEN_LIMIT = 20000
+# 学到新内容后等待多久在后台写入日志（秒），期间学到的内容合并写入
+SAVE_DELAY = 2
+# 日志超过该条数时合并为新的快照
+COMPACT_PAIRS = 2000
+MODEL_VERSION = 1
+
+
+def char_ngrams(text):
+    """提取字符二元组，单字内容使用单字本身"""
+    text = re.sub(r"\s+", "", text)
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _pair_hash(*parts):
+    """计算稳定的消息对哈希"""
+    digest = hashlib.blake2b("\x1f".join(part or "" for part in parts).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+class ReplyModel:
+    """基于字符二元组的本地回复预测模型"""
+
+    def __init__(self, path, max_utterances=5000):
+        """初始化模型，path为模型快照路径，存在时自动加载快照与其后的日志"""
+        self.path = path
+        self.log_path = path.with_suffix(".log")
+        self.max_utterances = max_utterances
+        # 候选回复及其出现次数
+        self._utterances = []
+        self._counts = []
+        self._ids = {}
+        # 二元组 -> {回复序号: 次数}
+        self._index = {}
+        self._seen = deque()
+        self._seen_set = set()
+        # 尚未写入日志的消息对(上一条消息, 回复, 哈希)，以及日志中已有的条数
+        self._pending = []
+        self._log_lines = 0
+        self._compact_needed = False
+        self._save_timer = None
+        self._lock = threading.Lock()
+        # 保证同一时间只有一个线程写文件
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        """已学习的候选回复数"""
+        return len(self._utterances)
+
+    def learn(self, text, self_name=""):
+        """从一次捕获的聊天文本中学习对方的回复，返回新增的消息对数"""
+        messages = split_messages(text)
+        added = 0
+        with self._lock:
+            for (_, _, previous), (header, name, reply) in zip(messages, messages[1:]):
+                # 只学习对方的消息
+                if self_name and name == self_name:
+                    continue
+                if len(reply) > MAX_REPLY_LENGTH or PLACEHOLDER_PATTERN.match(reply):
+                    continue
+                # 重叠的捕获内容只学习一次
+                key = _pair_hash(previous, header, reply)
+                if key in self._seen_set:
+                    continue
+                self._remember(key)
+                self._add_pair(previous, reply)
+                self._pending.append((previous, reply, key))
+                added += 1
+            if added:
+                if len(self._utterances) > self.max_utterances:
+                    self._prune()
+                self._schedule_save()
+        return added
+
+    def _schedule_save(self):
+        """在后台延迟写入新学到的内容，调用方需持有锁"""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _remember(self, key):
+        """记录已学习的消息对"""
+        self._seen.append(key)
+        self._seen_set.add(key)
+        if len(self._seen) > SEEN_LIMIT:
+            self._seen_set.discard(self._seen.popleft())
+
+    def _add_pair(self, previous, reply):
+        """累加一条消息对"""
+        reply_id = self._ids.get(reply)
+        if reply_id is None:
+            reply_id = self._ids[reply] = len(self._utterances)
+            self._utterances.append(reply)
+            self._counts.append(0)
+        self._counts[reply_id] += 1
+        for gram in set(char_ngrams(previous)):
+            postings = self._index.setdefault(gram, {})
+            postings[reply_id] = postings.get(reply_id, 0) + 1
+
+    def _prune(self):
+        """候选过多时只保留出现次数最多的一部分，并重建索引"""
+        keep = sorted(range(len(self._utterances)), key=lambda i: self._counts[i], reverse=True)
+        keep = sorted(keep[:int(self.max_utterances * 0.8)])
+        remap = {old: new for new, old in enumerate(keep)}
+        self._utterances = [self._utterances[i] for i in keep]
+        self._counts = [self._counts[i] for i in keep]
+        self._ids = {text: i for i, text in enumerate(self._utterances)}
+        index = {}
+        for gram, postings in self._index.items():
+            postings = {remap[i]: count for i, count in postings.items() if i in remap}
+            if postings:
+                index[gram] = postings
+        self._index = index
+        # 日志中的内容可能已被裁剪，下次保存时重写快照
+        self._compact_needed = True
+
+    def predict(self, text, k=5):
+        """根据聊天文本的最后一条消息返回最多k条候选回复，没有可用候选时返回空列表"""
+        messages = split_messages(text)
+        if not messages:
+            return []
+        last = messages[-1][2]
+        with self._lock:
+            if not self._utterances:
+                return []
+            scores = {}
+            for gram in set(char_ngrams(last)):
+                postings = self._index.get(gram)
+                if not postings:
+                    continue
+                # 出现在越多上下文中的二元组区分度越低
+                weight = 1 / math.sqrt(len(postings))
+                for reply_id, count in postings.items():
+                    scores[reply_id] = scores.get(reply_id, 0.0) + count * weight
+            ranked = sorted(scores, key=lambda i: (scores[i], self._counts[i]), reverse=True)
+            candidates = [self._utterances[i] for i in ranked if self._utterances[i] != last]
+            if len(candidates) < k:
+                # 匹配不足时用最常见的回复补齐
+                common = sorted(range(len(self._utterances)), key=lambda i: self._counts[i], reverse=True)
+                for i in common:
+                    if len(candidates) >= k:
+                        break
+                    if self._utterances[i] not in candidates and self._utterances[i] != last:
+                        candidates.append(self._utterances[i])
+        return candidates[:k]
+
+    def load(self):
+        """加载模型快照并重放其后的日志，文件不存在或损坏时使用空模型"""
+        self._load_snapshot()
+        self._replay_log()
+
+    def _load_snapshot(self):
+        """从快照文件加载"""
+        if not self.path.exists():
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"加载本地回复模型失败: {e}")
+            return
+        if data.get("version") != MODEL_VERSION:
+            return
+        self._utterances = [text for text, _ in data["utterances"]]
+        self._counts = [count for _, count in data["utterances"]]
+        self._ids = {text: i for i, text in enumerate(self._utterances)}
+        self._index = {
+            gram: {int(i): count for i, count in postings.items()}
+            for gram, postings in data["index"].items()
+        }
+        self._seen = deque(data.get("seen", []))
+        self._seen_set = set(self._seen)
+
+    def _replay_log(self):
+        """重放快照之后追加的消息对，快照中已有的消息对会被跳过"""
+        if not self.log_path.exists():
+            return
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        previous, reply, key = json.loads(line)
+                    except ValueError:
+                        # 写入中断时最后一行可能不完整
+                        continue
+                    self._log_lines += 1
+                    if key in self._seen_set:
+                        continue
+                    self._remember(key)
+                    self._add_pair(previous, reply)
+        except OSError as e:
+            print(f"加载本地回复模型日志失败: {e}")
+        if len(self._utterances) > self.max_utterances:
+            self._prune()
+
+    def save(self):
+        """将新学到的消息对追加写入日志，日志过长或候选被裁剪时改为写入新的快照"""
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None
+                pending, self._pending = self._pending, []
+                if not pending and not self._compact_needed:
+                    return
+                compact = self._compact_needed or self._log_lines + len(pending) >= COMPACT_PAIRS
+                if compact:
+                    # 只在锁内复制状态，序列化与压缩在锁外进行
+                    snapshot = {
+                        "version": MODEL_VERSION,
+                        "utterances": [[text, count] for text, count in zip(self._utterances, self._counts)],
+                        "index": {gram: dict(postings) for gram, postings in self._index.items()},
+                        "seen": list(self._seen),
+                    }
+                    self._compact_needed = False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                if compact:
+                    self._write_snapshot(snapshot)
+                else:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        for pair in pending:
+                            f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+                    self._log_lines += len(pending)
+            except OSError as e:
+                print(f"保存本地回复模型失败: {e}")
+                # 未写入的内容仍在内存中，下次保存时写入完整的快照
+                with self._lock:
+                    self._compact_needed = True
+
+    def _write_snapshot(self, snapshot):
+        """写入新的快照并清空日志，先写临时文件再替换"""
+        temp_path = self.path.with_suffix(".tmp")
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")))
+        os.replace(temp_path, self.path)
+        # 快照已包含日志中的全部内容
+        with open(self.log_path, "w", encoding="utf-8"):
+            pass
+        self._log_lines = 0
+
+    def close(self):
+        """取消延迟写入并立即保存"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+        self.save()
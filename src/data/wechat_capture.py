@@ -5,142 +5,278 @@
 微信数据捕获模块
 
 负责实时捕获微信桌面端当前激活窗口的聊天内容，
-并提供对话上下文管理功能。
+并提供对话上下文管理功能。读取窗口文本的方式由capture_backends中的后端决定。
+
+每次捕获得到的是整个窗口的文本，其中大部分消息上一次已经见过。捕获按消息切分后，
+用滚动哈希在本次捕获中查找聊天历史末尾几条消息的位置，只把之后新出现的消息加入历史，
+聊天历史因此按消息增长，而不是按窗口大小乘以捕获次数增长。
+新消息解析为消息记录后保存在按字节数限制的缓冲中（见message_buffer）。
+配置了聊天记录存储（HistoryIndex）时，新消息同时按聊天对象保存并写入全文索引，
+启用CONVERSATION_STORE_ENABLED时，启动或切换聊天对象后先加载该对象最近的消息。
 """
 
 import time
-import win32gui
-import win32con
-import win32clipboard
-import pyperclip
-from PIL import ImageGrab
-from collections import deque
+import threading
+
+from src.data.capture_backends import create_backend, SessionRecorder
+from src.data.chat_parser import split_blocks, detect_contact
+from src.data.message_buffer import ChatMessage, MessageBuffer
+from src.data.history_index import DIGEST_CONTEXT
+from src.utils.metrics import LatencyWindow
+
+# 在新捕获中定位已有消息时使用的末尾消息条数
+ANCHOR_SIZE = 3
+# 滚动哈希的底数与模数
+ROLLING_BASE = 1000003
+ROLLING_MOD = (1 << 61) - 1
+
+
+def find_last_run(sequence, pattern):
+    """用滚动哈希查找pattern在sequence中最后一次连续出现的起始位置，没有时返回None"""
+    size = len(pattern)
+    if size == 0 or size > len(sequence):
+        return None
+    target = 0
+    current = 0
+    for index in range(size):
+        target = (target * ROLLING_BASE + pattern[index]) % ROLLING_MOD
+        current = (current * ROLLING_BASE + sequence[index]) % ROLLING_MOD
+    high = pow(ROLLING_BASE, size - 1, ROLLING_MOD)
+    found = None
+    for start in range(len(sequence) - size + 1):
+        if start:
+            current = ((current - sequence[start - 1] * high) * ROLLING_BASE
+                       + sequence[start + size - 1]) % ROLLING_MOD
+        # 哈希相同时再逐项比较，排除碰撞
+        if current == target and sequence[start:start + size] == pattern:
+            found = start
+    return found
+
+
+def _block_hash(block):
+    """消息文本块的64位哈希，作为滚动哈希的元素"""
+    return hash(block) & 0xFFFFFFFFFFFFFFFF
+
+
+def _stored_message(sender, timestamp, text):
+    """由存储中的记录创建消息，哈希按还原后的文本块计算，与之后捕获到的同一条消息一致"""
+    message = ChatMessage(sender, timestamp, text, 0)
+    message.digest = _block_hash(message.render())
+    return message
 
 class WeChatCapture:
     """微信聊天内容捕获类"""
     
-    def __init__(self, config):
-        """初始化微信捕获器"""
+    def __init__(self, config, backend=None, store=None):
+        """初始化微信捕获器，backend为读取窗口文本的后端，默认按配置创建；store为聊天记录存储（HistoryIndex），可为None"""
         self.config = config
-        # 使用双端队列存储聊天历史
-        self.chat_history = deque(maxlen=config.max_history_length)
+        self.backend = backend or create_backend(config)
+        self.store = store
+        # 用户自己的昵称，识别聊天对象时排除
+        self.self_name = ""
+        # 当前聊天对象，按消息发送者识别，无法识别时使用窗口标题
+        self.contact = ""
+        # 聊天历史，每项为一条消息记录，总字节数不超过max_history_kb
+        self.messages = MessageBuffer(config.max_history_kb * 1024)
+        # 返回给调用方的聊天历史不超过各模式中最大的输入预算，更早的消息不会进入提示
+        self.context_tokens = max(config.input_token_budgets.values())
         # 上次捕获的内容，用于去重
         self.last_captured = ""
-        # 微信窗口句柄
-        self.wechat_hwnd = None
-    
-    def find_wechat_window(self):
-        """查找微信窗口"""
-        def callback(hwnd, extra):
-            if win32gui.IsWindowVisible(hwnd) and win32gui.IsWindowEnabled(hwnd):
-                window_text = win32gui.GetWindowText(hwnd)
-                if "微信" in window_text:
-                    extra.append(hwnd)
-            return True
-        
-        hwnd_list = []
-        win32gui.EnumWindows(callback, hwnd_list)
-        
-        if hwnd_list:
-            # 找到微信主窗口
-            self.wechat_hwnd = hwnd_list[0]
-            return True
-        return False
+        # 最近一次捕获新增的消息记录
+        self.last_delta = []
+        # 聊天内容变化时的回调函数列表
+        self.change_listeners = []
+        # 配置了录制路径时，将每次变化的捕获写入会话文件供回放
+        self.recorder = SessionRecorder(config.capture_record_path) if config.capture_record_path else None
+        # 读取窗口文本的耗时，以及后端报告的各等待阶段耗时
+        self.latency = LatencyWindow()
+        # 点击触发的捕获与后台检测不同时进行
+        self._capture_lock = threading.Lock()
+    
+    def add_change_listener(self, callback):
+        """注册聊天内容变化的回调，参数为最新的聊天历史"""
+        self.change_listeners.append(callback)
+    
+    def _notify_change(self, chat_history):
+        """通知所有监听者聊天内容已变化"""
+        for callback in self.change_listeners:
+            try:
+                callback(chat_history)
+            except Exception as e:
+                if self.config.debug_mode:
+                    print(f"聊天内容变化回调执行失败: {e}")
+    
+    def is_wechat_foreground(self):
+        """判断微信窗口当前是否处于前台"""
+        return self.backend.is_foreground()
     
     def capture_chat_content(self):
         """捕获当前聊天内容"""
-        if not self.wechat_hwnd:
-            if not self.find_wechat_window():
-                # 如果找不到微信窗口但有历史记录，返回现有历史
-                if self.chat_history:
-                    return list(self.chat_history)
-                return None
-        
-        # 保存当前活动窗口句柄，以便操作后恢复
-        current_hwnd = win32gui.GetForegroundWindow()
-        
+        with self._capture_lock:
+            return self._capture()
+    
+    def poll(self):
+        """在后台检测聊天内容是否变化，变化时通知监听者；正在捕获时直接返回"""
+        if not self._capture_lock.acquire(blocking=False):
+            return
         try:
-            # 激活微信窗口
-            win32gui.SetForegroundWindow(self.wechat_hwnd)
-            time.sleep(0.1)  # 等待窗口激活
-            
-            # 模拟Ctrl+A全选
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYDOWN, win32con.VK_CONTROL, 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYDOWN, ord('A'), 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYUP, ord('A'), 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYUP, win32con.VK_CONTROL, 0)
-            
-            # 模拟Ctrl+C复制
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYDOWN, win32con.VK_CONTROL, 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYDOWN, ord('C'), 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYUP, ord('C'), 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYUP, win32con.VK_CONTROL, 0)
-            
-            time.sleep(0.1)  # 等待复制完成
-            
-            # 获取剪贴板内容
-            win32clipboard.OpenClipboard()
-            try:
-                if win32clipboard.IsClipboardFormatAvailable(win32con.CF_TEXT):
-                    chat_content = win32clipboard.GetClipboardData(win32con.CF_TEXT)
-                    chat_content = chat_content.decode('gbk')
-                else:
-                    chat_content = pyperclip.paste()
-            finally:
-                win32clipboard.CloseClipboard()
-            
-            # 按ESC取消选择
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYDOWN, win32con.VK_ESCAPE, 0)
-            win32gui.SendMessage(self.wechat_hwnd, win32con.WM_KEYUP, win32con.VK_ESCAPE, 0)
-            
-            # 将焦点返回给原来的窗口
-            try:
-                if current_hwnd and current_hwnd != self.wechat_hwnd:
-                    win32gui.SetForegroundWindow(current_hwnd)
-            except Exception:
-                pass  # 忽略恢复焦点时的错误
-            
-            # 检查内容是否有变化
-            if chat_content == self.last_captured:
-                # 即使内容没有变化，也返回当前的聊天历史
-                if self.chat_history:
-                    return list(self.chat_history)
-                return None
-            
-            self.last_captured = chat_content
-            processed_content = self.process_chat_content(chat_content)
-            
-            # 如果处理后没有内容但有历史记录，返回现有历史
-            if not processed_content and self.chat_history:
-                return list(self.chat_history)
-                
-            return processed_content
-            
+            self._capture()
+        finally:
+            self._capture_lock.release()
+    
+    def _capture(self):
+        """读取并处理聊天内容，调用方需持有捕获锁"""
+        start_time = time.perf_counter()
+        try:
+            chat_content = self.backend.read_text()
         except Exception as e:
             if self.config.debug_mode:
                 print(f"捕获聊天内容失败: {e}")
-            # 发生异常时，如果有历史记录，返回现有历史
-            if self.chat_history:
-                return list(self.chat_history)
-            return None
+            chat_content = None
+        else:
+            self._record_latency(time.perf_counter() - start_time)
+        
+        # 没有读取到内容或内容没有变化时，返回现有的聊天历史
+        if chat_content is None or chat_content == self.last_captured:
+            return self.get_chat_history() or None
+        
+        self.last_captured = chat_content
+        if self.recorder is not None:
+            self.recorder.record(chat_content)
+        processed_content = self.process_chat_content(chat_content)
+        if processed_content:
+            self._notify_change(processed_content)
+        
+        # 如果处理后没有内容但有历史记录，返回现有历史
+        if not processed_content and self.messages:
+            return self.get_chat_history()
+            
+        return processed_content
+    
+    def _record_latency(self, elapsed):
+        """记录一次成功读取的耗时"""
+        self.latency.record("read", elapsed)
+        for stage, seconds in getattr(self.backend, "last_timings", {}).items():
+            if seconds is not None:
+                self.latency.record(stage, seconds)
+        if self.config.debug_mode:
+            print(f"读取聊天内容耗时 {elapsed * 1000:.0f}毫秒")
+    
+    def get_capture_stats(self):
+        """获取读取耗时与各等待阶段耗时的p50/p95/p99（秒）"""
+        return {
+            stage: self.latency.summary(stage)
+            for stage in ("read", "focus", "copy") if self.latency.count(stage)
+        }
     
     def process_chat_content(self, content):
-        """处理捕获的聊天内容"""
+        """处理捕获的聊天内容，只将新出现的消息加入聊天历史，没有新消息时返回None"""
         if not content or len(content.strip()) == 0:
             return None
-        print("捕获到的聊天内容："+content)
         
-        # 直接将完整内容添加到聊天历史中
-        if content not in self.chat_history:
-            self.chat_history.append(content)
+        blocks = split_blocks(content)
+        hashes = [_block_hash(block) for block in blocks]
+        start = self._delta_start(hashes)
+        reset = not self.messages
+        self.last_delta = [
+            ChatMessage.from_block(block, block_hash) for block, block_hash in zip(blocks[start:], hashes[start:])
+        ]
+        if not self.last_delta:
+            return None
+        if self.config.debug_mode:
+            print("捕获到的新消息：" + "\n".join(message.render() for message in self.last_delta))
         
-        return list(self.chat_history)
+        for message in self.last_delta:
+            self.messages.append(message)
+        if self.store is not None:
+            self._persist(reset)
+        return self.get_chat_history()
+    
+    def _persist(self, reset):
+        """保存新增的消息；聊天历史从本次捕获重新开始时，先加载该聊天对象之前保存的消息"""
+        contact = self._detect_contact()
+        try:
+            if reset and contact and self.config.conversation_store_enabled:
+                self._prepend(self.store.recent(contact, self.config.conversation_store_restore))
+            # 新消息之前的若干条消息，用于区分重复发送的相同消息
+            count = len(self.last_delta)
+            previous = self.messages.last(count + DIGEST_CONTEXT)[:-count]
+            self.store.add_messages(contact, self.last_delta, previous)
+        except Exception as e:
+            if self.config.debug_mode:
+                print(f"保存聊天记录失败: {e}")
+        self.contact = contact
+    
+    def _detect_contact(self):
+        """根据最近消息的发送者识别聊天对象，无法识别时使用窗口标题"""
+        recent = self.messages.last(20)
+        contact = detect_contact([(None, message.sender, None) for message in recent], self.self_name)
+        if contact:
+            return contact
+        try:
+            return self.backend.window_title()
+        except Exception:
+            return ""
+    
+    def _prepend(self, rows):
+        """将存储中的(发送者, 时间, 内容)记录作为更早的消息加入聊天历史，已有的消息不会重复加入"""
+        current = list(self.messages)
+        keys = [(message.sender, message.timestamp, message.text) for message in current]
+        rows = [tuple(row) for row in rows]
+        # 存储的末尾与聊天历史的开头重叠时只去掉重叠部分，重复发送的相同消息得以保留
+        for size in range(min(len(rows), len(keys)), 0, -1):
+            if rows[-size:] == keys[:size]:
+                rows = rows[:-size]
+                break
+        else:
+            seen = set(keys)
+            rows = [row for row in rows if row not in seen]
+        older = [_stored_message(*row) for row in rows]
+        if not older:
+            return
+        self.messages.clear()
+        for message in older + current:
+            self.messages.append(message)
+    
+    def load_recent(self, contact=None):
+        """从存储中加载聊天对象最近的消息，默认为最近一次保存消息的聊天对象，返回加载的消息数"""
+        if self.store is None or not self.config.conversation_store_enabled:
+            return 0
+        contact = contact if contact is not None else self.store.last_contact()
+        if contact is None:
+            return 0
+        before = len(self.messages)
+        self._prepend(self.store.recent(contact, self.config.conversation_store_restore))
+        self.contact = contact
+        return len(self.messages) - before
+    
+    def _delta_start(self, hashes):
+        """计算本次捕获中新消息的起始位置"""
+        if not self.messages:
+            return 0
+        # 在本次捕获中查找聊天历史末尾的几条消息，其后的均为新消息
+        anchor = self.messages.digests(ANCHOR_SIZE)
+        position = find_last_run(hashes, anchor)
+        if position is not None:
+            return position + len(anchor)
+        # 末尾的消息不在本次捕获中（如被撤回），从最后一条已知消息之后开始
+        for index in range(len(hashes) - 1, -1, -1):
+            if hashes[index] in self.messages:
+                return index + 1
+        # 与聊天历史没有任何重叠（切换了聊天对象或间隔过久），以本次捕获重新开始
+        self.messages.clear()
+        return 0
     
     def get_chat_history(self):
-        """获取当前聊天历史"""
-        return list(self.chat_history)
+        """获取当前聊天历史，只包含最大输入预算内最新的完整消息"""
+        return self.get_chat_window(self.context_tokens)
+    
+    def get_chat_window(self, max_tokens=None, max_messages=None):
+        """获取不超过token预算与条数的最新消息，每项为一条消息的文本"""
+        return [message.render() for message in self.messages.window(max_tokens, max_messages)]
     
     def clear_history(self):
         """清空聊天历史"""
-        self.chat_history.clear()
-        self.last_captured = ""
\ No newline at end of file
+        self.messages.clear()
+        self.last_captured = ""
+        self.last_delta = []
\ No newline at end of file
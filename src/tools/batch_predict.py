@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线批量预测工具
+
+读取导出的聊天记录语料，使用与界面相同的DeepSeekAPI提示逻辑批量请求，
+结果逐行写入JSONL，并统计吞吐量与延迟分位数，中断后可以继续运行。
+
+用法：
+    python -m src.tools.batch_predict corpus.jsonl -o results.jsonl --modes predict,suggest --concurrency 4
+
+语料格式：
+    JSONL：每行一个对象，包含chat_history（字符串列表）或text（字符串），
+           可选id、nickname、relation、gender、additional_info
+    文本：对话之间用单独一行“---”分隔，每段作为一条聊天历史
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.utils.config import Config
+from src.utils.metrics import percentile
+from src.utils.token_budget import estimate_tokens
+from src.api.deepseek_api import DeepSeekAPI, MODES, INSIGHTS_MODE
+
+
+def load_corpus(path):
+    """读取语料，返回对话记录列表"""
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    records = []
+    if path.suffix == ".jsonl":
+        for index, line in enumerate(content.splitlines()):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            history = item.get("chat_history")
+            if history is None:
+                history = [item.get("text", "")]
+            records.append({
+                "id": str(item.get("id", index)),
+                "chat_history": history,
+                "nickname": item.get("nickname", ""),
+                "relation": item.get("relation", "朋友"),
+                "gender": item.get("gender", ""),
+                "additional_info": item.get("additional_info", ""),
+            })
+    else:
+        blocks = [block.strip() for block in content.split("\n---\n")]
+        for index, block in enumerate(blocks):
+            if block:
+                records.append({
+                    "id": str(index), "chat_history": [block], "nickname": "",
+                    "relation": "朋友", "gender": "", "additional_info": "",
+                })
+    return records
+
+
+def load_completed(output_path):
+    """读取已有的输出文件，返回已成功完成的(id, mode)集合"""
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if not item.get("error"):
+                completed.add((item["id"], item["mode"]))
+    return completed
+
+
+class BatchRunner:
+    """批量预测执行器"""
+
+    def __init__(self, api_client, output_path, concurrency=4):
+        """初始化执行器"""
+        self.api_client = api_client
+        self.output_path = output_path
+        self.concurrency = concurrency
+        # 在run中创建，Python 3.10之前的信号量会绑定到创建时的事件循环
+        self.semaphore = None
+        self.latencies = []
+        self.output_tokens = 0
+        self.errors = 0
+        self._output = None
+
+    async def _run_one(self, record, mode):
+        """执行一条请求并立即写出结果"""
+        async with self.semaphore:
+            start_time = time.monotonic()
+            error = None
+            output = ""
+            result = None
+            try:
+                output = await self.api_client.afetch(
+                    mode, record["chat_history"], record["nickname"], record["relation"],
+                    record["additional_info"], record["gender"]
+                )
+                result = self.api_client.parse_output(mode, output)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latency = time.monotonic() - start_time
+
+        if error:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+            self.output_tokens += estimate_tokens(output)
+
+        line = json.dumps({
+            "id": record["id"], "mode": mode, "latency": round(latency, 4),
+            "result": result, "output": output, "error": error,
+        }, ensure_ascii=False)
+        self._output.write(line + "\n")
+        self._output.flush()
+
+    async def run(self, jobs):
+        """并发执行所有请求，返回统计结果"""
+        start_time = time.monotonic()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        with open(self.output_path, "a", encoding="utf-8") as self._output:
+            await asyncio.gather(*(self._run_one(record, mode) for record, mode in jobs))
+        elapsed = time.monotonic() - start_time
+        return self.summary(len(jobs), elapsed)
+
+    def summary(self, total, elapsed):
+        """汇总吞吐量与延迟分位数"""
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "elapsed": round(elapsed, 3),
+            "requests_per_second": round(total / elapsed, 3) if elapsed else None,
+            "output_tokens_per_second": round(self.output_tokens / elapsed, 1) if elapsed else None,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p95": percentile(self.latencies, 95),
+            "latency_p99": percentile(self.latencies, 99),
+        }
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="离线批量预测")
+    parser.add_argument("input", help="语料文件（.jsonl或文本）")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="结果输出文件（JSONL）")
+    parser.add_argument("--modes", default="predict",
+                        help=f"请求模式，多个用逗号分隔，可选：{','.join(MODES + (INSIGHTS_MODE,))}")
+    parser.add_argument("--concurrency", type=int, default=4, help="最大并发请求数")
+    parser.add_argument("--limit", type=int, default=None, help="只处理前N条对话")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有结果，从头开始")
+    parser.add_argument("--use-cache", action="store_true", help="使用响应缓存（评估提示修改时不要开启）")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    config = Config()
+    config.cache_enabled = args.use_cache
+    api_client = DeepSeekAPI(config)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    records = load_corpus(args.input)[:args.limit]
+    output_path = Path(args.output)
+    if args.no_resume and output_path.exists():
+        output_path.unlink()
+    completed = load_completed(output_path)
+
+    jobs = [(record, mode) for record in records for mode in modes
+            if (record["id"], mode) not in completed]
+    print(f"共{len(records) * len(modes)}个请求，已完成{len(records) * len(modes) - len(jobs)}个，"
+          f"本次执行{len(jobs)}个", file=sys.stderr)
+
+    runner = BatchRunner(api_client, output_path, args.concurrency)
+    stats = asyncio.run(runner.run(jobs))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0 if stats["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+端到端性能基准
+
+通过回放捕获后端驱动WeChatCapture，模拟微信聊天内容的逐步捕获（生成的会话或录制的会话），
+经DeepSeekAPI向本地模拟服务（或指定地址）发送请求，统计每个模式各阶段的p50/p95/p99延迟，
+结果保存为JSON并与上一次结果比较，发现性能退化时返回非零退出码。
+
+用法：
+    python -m src.tools.benchmark --iterations 20 --modes predict,suggest,analyze
+    python -m src.tools.benchmark --latency-ms 800 --error-rate 0.05 --label slow-network
+    python -m src.tools.benchmark --session session.jsonl --speed 4
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from src.utils.config import Config
+from src.utils.metrics import percentile
+from src.api.deepseek_api import DeepSeekAPI, MODES, INSIGHTS_MODE
+from src.data.wechat_capture import WeChatCapture
+from src.data.capture_backends import ReplayBackend
+from src.tools.stub_server import StubServer, add_stub_arguments, options_from_args
+
+# 统计的阶段，依次为：捕获处理、上下文裁剪与提示构建、限流排队、首字延迟、完整请求、结果解析、总耗时
+STAGES = ("capture", "prompt", "queue", "ttft", "request", "parse", "total")
+
+# 模拟对话的消息，循环使用
+SCRIPT_LINES = [
+    ("小明", "周末有空吗？一起去爬山吧"),
+    ("我", "好啊，去哪座山？"),
+    ("小明", "香山怎么样，听说红叶开始红了🍁"),
+    ("我", "可以，几点出发？"),
+    ("小明", "早上八点地铁站见？太晚了人多"),
+    ("我", "行，我带点吃的"),
+    ("小明", "我带水和相机，要不要叫上小红"),
+    ("我", "叫吧，人多热闹"),
+]
+
+
+def generate_captures(count, start_time=None):
+    """生成逐步增长的微信聊天内容，每次模拟复制到的窗口文本"""
+    start_time = start_time or datetime(2024, 10, 1, 9, 0)
+    lines = []
+    captures = []
+    for index in range(count):
+        sender, text = SCRIPT_LINES[index % len(SCRIPT_LINES)]
+        minute = start_time.minute + index
+        timestamp = f"{start_time.hour + minute // 60:02d}:{minute % 60:02d}"
+        lines.append(f"{sender} {timestamp}\n{text}（{index}）")
+        captures.append("\n".join(lines))
+    return captures
+
+
+def generate_session(count, interval=1.0):
+    """生成回放用的会话，每隔interval秒捕获一次逐步增长的聊天内容"""
+    return [(index * interval, text) for index, text in enumerate(generate_captures(count))]
+
+
+class Benchmark:
+    """端到端基准执行器"""
+
+    def __init__(self, api_client, config, modes):
+        """初始化执行器"""
+        self.api_client = api_client
+        self.config = config
+        self.modes = modes
+        # mode -> stage -> 毫秒列表
+        self.samples = {mode: {stage: [] for stage in STAGES} for mode in modes}
+        self.errors = {mode: 0 for mode in modes}
+
+    def run_once(self, mode, history, record=True):
+        """执行一次完整的请求流程并记录各阶段耗时"""
+        api = self.api_client
+        timings = {}
+        start_time = time.perf_counter()
+
+        stage_start = time.perf_counter()
+        fitted, _, _ = api.budgeter.fit(history, self.config.input_token_budgets.get(mode))
+        api.prompt_builder.build(mode, fitted)
+        timings["prompt"] = time.perf_counter() - stage_start
+
+        first_delta = []
+
+        def _on_delta(delta, text):
+            if not first_delta:
+                first_delta.append(time.perf_counter())
+
+        stage_start = time.perf_counter()
+        try:
+            output = api.fetch(mode, history, on_delta=_on_delta)
+        except Exception as e:
+            if record:
+                self.errors[mode] += 1
+            if self.config.debug_mode:
+                print(f"{mode}请求失败: {type(e).__name__}: {e}")
+            return
+        timings["request"] = time.perf_counter() - stage_start
+        timings["queue"] = api.get_queue_wait(mode) or 0.0
+        if first_delta:
+            timings["ttft"] = first_delta[0] - stage_start
+
+        stage_start = time.perf_counter()
+        api.parse_output(mode, output)
+        timings["parse"] = time.perf_counter() - stage_start
+        timings["total"] = time.perf_counter() - start_time
+
+        if record:
+            for stage, seconds in timings.items():
+                self.samples[mode][stage].append(seconds * 1000)
+        return timings
+
+    def run(self, backend, warmup=1):
+        """回放捕获会话，每次捕获后请求所有模式，前warmup次不计入统计"""
+        capture = WeChatCapture(self.config, backend)
+        for index, _ in backend.play():
+            record = index >= warmup
+            stage_start = time.perf_counter()
+            history = capture.capture_chat_content()
+            capture_ms = (time.perf_counter() - stage_start) * 1000
+            if not history:
+                continue
+            for mode in self.modes:
+                timings = self.run_once(mode, history, record)
+                if record and timings is not None:
+                    self.samples[mode]["capture"].append(capture_ms)
+                    self.samples[mode]["total"][-1] += capture_ms
+
+    def summary(self):
+        """汇总每个模式各阶段的分位数（毫秒）"""
+        results = {}
+        for mode, stages in self.samples.items():
+            results[mode] = {
+                stage: {
+                    "count": len(values),
+                    "p50": _round(percentile(values, 50)),
+                    "p95": _round(percentile(values, 95)),
+                    "p99": _round(percentile(values, 99)),
+                }
+                for stage, values in stages.items() if values
+            }
+            results[mode]["errors"] = self.errors[mode]
+        return results
+
+
+def _round(value):
+    """保留三位小数"""
+    return round(value, 3) if value is not None else None
+
+
+def git_revision():
+    """获取当前代码版本，不在git仓库中时返回None"""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def latest_result(results_dir, label=""):
+    """获取结果目录中标签相同的最近一次结果文件，没有时返回None
+
+    不同标签的结果通常来自不同的配置（如模拟的网络条件），不能互相比较。
+    """
+    for path in sorted(Path(results_dir).glob("*.json"), reverse=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if json.load(f).get("label", "") == label:
+                    return path
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def compare(current, previous, threshold=0.2, min_delta_ms=5.0):
+    """比较两次结果的p50与p95，返回退化项列表"""
+    regressions = []
+    for mode, stages in current.items():
+        for stage, stats in stages.items():
+            old = previous.get(mode, {}).get(stage)
+            if not isinstance(stats, dict) or not isinstance(old, dict):
+                continue
+            for key in ("p50", "p95"):
+                new_value, old_value = stats.get(key), old.get(key)
+                if new_value is None or old_value is None:
+                    continue
+                if new_value > old_value * (1 + threshold) and new_value - old_value > min_delta_ms:
+                    regressions.append({
+                        "mode": mode, "stage": stage, "metric": key,
+                        "previous": old_value, "current": new_value,
+                    })
+    return regressions
+
+
+def print_table(results):
+    """以表格形式输出结果"""
+    print(f"{'模式':<10}{'阶段':<10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for mode, stages in results.items():
+        for stage in STAGES:
+            stats = stages.get(stage)
+            if stats:
+                print(f"{mode:<10}{stage:<10}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+        if stages["errors"]:
+            print(f"{mode:<10}错误次数：{stages['errors']}")
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="端到端性能基准")
+    parser.add_argument("--iterations", type=int, default=20, help="模拟捕获的次数")
+    parser.add_argument("--session", default=None, help="回放录制的捕获会话（JSONL），不使用生成的对话")
+    parser.add_argument("--interval-ms", type=float, default=1000, help="生成的会话中两次捕获的间隔（毫秒）")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="回放倍速，1为按录制时的间隔，0为不等待（默认）")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热次数")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"请求模式，多个用逗号分隔，可选：{','.join(MODES + (INSIGHTS_MODE,))}")
+    parser.add_argument("--base-url", default=None, help="使用指定的API地址，不启动本地模拟服务")
+    parser.add_argument("--results-dir", default="benchmarks", help="结果保存目录")
+    parser.add_argument("--baseline", default=None, help="用于比较的结果文件，默认为标签相同的上一次结果")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定为退化的增长比例")
+    parser.add_argument("--label", default="", help="结果文件名的附加标签")
+    parser.add_argument("--no-save", action="store_true", help="不保存本次结果")
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    config = Config()
+    # 测量的是请求链路本身，不使用响应缓存与预测性预取
+    config.cache_enabled = False
+    config.speculative_prefetch = False
+    config.capture_record_path = ""
+
+    if args.session:
+        backend = ReplayBackend.from_file(args.session, args.speed)
+    else:
+        backend = ReplayBackend(
+            generate_session(args.iterations + args.warmup, args.interval_ms / 1000), args.speed
+        )
+
+    server = None
+    if args.base_url:
+        config.api_base_url = args.base_url
+    else:
+        server = StubServer(options_from_args(args)).start()
+        config.api_base_url = server.base_url
+        # 模拟服务不校验密钥，默认的占位密钥含中文无法作为请求头发送
+        config.api_key = "stub"
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    try:
+        api_client = DeepSeekAPI(config)
+        api_client.warm_up()
+        benchmark = Benchmark(api_client, config, modes)
+        benchmark.run(backend, args.warmup)
+    finally:
+        if server is not None:
+            server.stop()
+
+    results = benchmark.summary()
+    print_table(results)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "label": args.label,
+        "iterations": len(backend.events) - args.warmup,
+        "replay": {
+            "session": args.session or "generated",
+            "captures": len(backend.events),
+            "speed": args.speed,
+            "max_lag_ms": _round(backend.max_lag * 1000),
+        },
+        "base_url": args.base_url or "stub",
+        "stub": None if args.base_url else vars(options_from_args(args)),
+        "results": results,
+    }
+
+    baseline = Path(args.baseline) if args.baseline else latest_result(args.results_dir, args.label)
+    regressions = []
+    if baseline is not None and baseline.exists():
+        with open(baseline, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        regressions = compare(results, previous.get("results", {}), args.threshold)
+        report["baseline"] = baseline.name
+        print(f"\n与{baseline.name}比较：" + ("未发现退化" if not regressions else f"{len(regressions)}项退化"))
+        for item in regressions:
+            print(f"  {item['mode']}/{item['stage']} {item['metric']}: "
+                  f"{item['previous']:.1f}ms -> {item['current']:.1f}ms")
+    report["regressions"] = regressions
+
+    if not args.no_save:
+        results_dir = Path(args.results_dir)
+        results_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f"-{args.label}" if args.label else ""
+        path = results_dir / f"{datetime.now():%Y%m%d-%H%M%S}{suffix}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到{path}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟API服务
+
+实现与OpenAI兼容的/chat/completions接口（包括流式输出），
+可配置首字延迟、输出速度、错误率与429限流注入，
+用于在没有DeepSeek密钥和网络的情况下测量与压测。
+
+用法：
+    python -m src.tools.stub_server --port 8765 --latency-ms 300 --tokens-per-second 40
+然后设置 DEEPSEEK_BASE_URL=http://127.0.0.1:8765
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from src.utils.token_budget import estimate_tokens
+
+# 模拟的回复内容
+STUB_REPLIES = ["好呀，那就这么定了😊", "哈哈，你说得对", "我晚点再跟你说", "真的吗？太好了！", "嗯嗯，没问题"]
+STUB_ANALYSIS = (
+    "### 话题与情感基调\n对话轻松友好，双方互动积极。\n\n"
+    "### 对方的想法和意图\n对方希望继续保持联系。\n\n"
+    "### 建议\n可以主动提出具体的时间安排。"
+)
+
+
+class StubOptions:
+    """模拟服务的行为配置"""
+
+    def __init__(self, latency_ms=300, tokens_per_second=50, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, trailing_text=True):
+        """初始化配置
+
+        latency_ms: 返回第一个数据前的等待时间（毫秒）
+        tokens_per_second: 输出速度
+        error_rate: 返回500错误的概率
+        rate_limit_rate: 返回429的概率
+        retry_after: 429响应中Retry-After的秒数
+        trailing_text: 列表后是否附带一段说明文字
+        """
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.trailing_text = trailing_text
+
+
+def build_reply(messages, json_output, trailing_text):
+    """根据请求内容生成模拟回复"""
+    task = messages[-1]["content"] if messages else ""
+    if json_output:
+        return json.dumps({
+            "predictions": STUB_REPLIES, "suggestions": STUB_REPLIES, "analysis": STUB_ANALYSIS,
+        }, ensure_ascii=False)
+    if "分析" in task and "预测" not in task:
+        return STUB_ANALYSIS
+    reply = "".join(f"{index}. {text}\n" for index, text in enumerate(STUB_REPLIES, 1))
+    if trailing_text:
+        reply += "\n以上回复可以根据实际情况调整语气，希望对你有帮助。" * 3
+    return reply
+
+
+def split_tokens(text):
+    """将文本切分为近似一个token大小的片段"""
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟服务的请求处理"""
+
+    protocol_version = "HTTP/1.1"
+    options = StubOptions()
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        """不输出访问日志"""
+
+    def _count(self, key):
+        """累加统计"""
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _send_json(self, status, payload, headers=None):
+        """发送JSON响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        """连接预热请求"""
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        """模型列表"""
+        self._send_json(200, {"object": "list", "data": [{"id": "deepseek-chat", "object": "model"}]})
+
+    def do_POST(self):
+        """处理chat/completions请求"""
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        self._count("requests")
+        options = self.options
+        if random.random() < options.rate_limit_rate:
+            self._count("rate_limited")
+            self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                            {"Retry-After": str(options.retry_after)})
+            return
+        if random.random() < options.error_rate:
+            self._count("errors")
+            self._send_json(500, {"error": {"message": "internal error", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        json_output = (request.get("response_format") or {}).get("type") == "json_object"
+        reply = build_reply(messages, json_output, options.trailing_text)
+        # 按max_tokens截断输出
+        finish_reason = "stop"
+        tokens = split_tokens(reply)
+        max_tokens = request.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            reply = "".join(tokens[:max_tokens])
+            finish_reason = "length"
+        prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(reply),
+            "total_tokens": prompt_tokens + estimate_tokens(reply),
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": prompt_tokens,
+        }
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model", "deepseek-chat")}
+
+        time.sleep(options.latency_ms / 1000)
+        if request.get("stream"):
+            self._stream(base, reply, usage, finish_reason,
+                         (request.get("stream_options") or {}).get("include_usage"))
+            return
+
+        # 非流式：按输出速度等待整个回复生成完毕
+        time.sleep(len(split_tokens(reply)) / options.tokens_per_second)
+        self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+            "index": 0, "finish_reason": finish_reason,
+            "message": {"role": "assistant", "content": reply},
+        }]))
+
+    def _stream(self, base, reply, usage, finish_reason, include_usage):
+        """以SSE格式逐段输出回复"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def _send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        interval = 1 / self.options.tokens_per_second
+        try:
+            for piece in split_tokens(reply):
+                _send(dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "delta": {"content": piece}, "finish_reason": None,
+                }]))
+                time.sleep(interval)
+            _send(dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "delta": {}, "finish_reason": finish_reason,
+            }]))
+            if include_usage:
+                _send(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束读取
+            pass
+
+
+class StubServer:
+    """在后台线程中运行的模拟服务"""
+
+    def __init__(self, options=None, host="127.0.0.1", port=0):
+        """创建服务，port为0时自动选择空闲端口"""
+        handler = type("ConfiguredStubHandler", (StubHandler,), {
+            "options": options or StubOptions(),
+            "stats": {"requests": 0, "errors": 0, "rate_limited": 0},
+            "stats_lock": threading.Lock(),
+        })
+        self.handler = handler
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """服务地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        """服务端统计"""
+        return dict(self.handler.stats)
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_stub_arguments(parser):
+    """添加模拟服务的命令行参数"""
+    parser.add_argument("--latency-ms", type=float, default=300, help="首字延迟（毫秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="输出速度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--retry-after", type=float, default=1, help="429响应的Retry-After秒数")
+
+
+def options_from_args(args):
+    """根据命令行参数创建配置"""
+    return StubOptions(
+        latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after
+    )
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容API服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = StubServer(options_from_args(args), args.host, args.port)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,10 +15,36 @@ from PyQt5.QtCore import Qt, QPoint, QMetaObject, Q_ARG, Q_RETURN_ARG
 from PyQt5.QtCore import pyqtSlot
 from PyQt5.QtGui import QColor, QFont, QPalette, QIcon
 import threading
+import time
 
 # 导入自定义模块
 from src.data.wechat_capture import WeChatCapture
+from src.data.reply_model import ReplyModel
+from src.data.history_index import HistoryIndex
+from src.data.chat_parser import conversation_text
 from src.api.deepseek_api import DeepSeekAPI
+from src.api.prefetcher import SpeculativePrefetcher
+from src.api.stream_parser import IncrementalListParser
+from src.utils.tracing import MetricsRecorder, start_trace, end_trace, span
+from src.utils.cancellation import CancelToken, RequestCancelled
+
+# 各操作的结果标题、请求中、完成与失败时的提示
+ACTION_TEXTS = {
+    "predict": ("预测结果", "正在预测回复...", "预测完成", "预测失败"),
+    "suggest": ("建议回复", "正在生成建议回复...", "建议生成完成", "生成建议失败"),
+    "analyze": ("对话分析结果", "正在分析对话...", "分析完成", "分析失败"),
+    "run_all": (None, "正在并发请求...", "全部完成", "请求失败"),
+}
+
+# 全部模式下各部分的标题
+RUN_ALL_TITLES = {"predict": "预测结果", "suggest": "建议回复", "analyze": "对话分析结果"}
+
+
+def list_markdown(items):
+    """将条目列表转换为Markdown列表，不是列表时返回空字符串"""
+    if not isinstance(items, list):
+        return ""
+    return "".join(f"- {item}\n" for item in items)
 
 class MainWindow(QMainWindow):
     """主窗口类"""
@@ -27,9 +53,57 @@ class MainWindow(QMainWindow):
         super().__init__(None, Qt.WindowStaysOnTopHint | Qt.FramelessWindowHint)
         self.config = config
         
-        # 初始化微信捕获器和API客户端
-        self.wechat_capture = WeChatCapture(config)
-        self.api_client = DeepSeekAPI(config)
+        # 按聊天对象保存的聊天记录及其全文索引，用于检索过往对话与重新启动后恢复上下文
+        self.history_index = None
+        if config.retrieval_enabled or config.conversation_store_enabled:
+            self.history_index = HistoryIndex(
+                config.history_index_path, config.history_max_messages, config.history_retention_days
+            )
+        
+        # 初始化微信捕获器和API客户端，捕获到的新消息由捕获器按聊天对象写入记录
+        self.wechat_capture = WeChatCapture(config, store=self.history_index)
+        # 本地回复预测模型，从捕获的聊天内容中持续学习
+        self.reply_model = None
+        if config.local_predictor_enabled:
+            self.reply_model = ReplyModel(config.local_predictor_path, config.local_predictor_max_utterances)
+            self.wechat_capture.add_change_listener(self._learn_replies)
+        # 检索时使用与写入时相同的聊天对象
+        self.api_client = DeepSeekAPI(
+            config, self.reply_model, self.history_index, lambda: self.wechat_capture.contact
+        )
+        
+        # 用户最近一次使用的设置，供后台预取使用
+        user_config = config.user_config or {}
+        self.last_user_input = (
+            user_config.get("nickname", ""),
+            user_config.get("default_relation", "朋友"),
+            user_config.get("additional_info", ""),
+            ""
+        )
+        self.wechat_capture.self_name = self.last_user_input[0]
+        # 加载最近一次聊天对象的消息，第一次点击时即使未能捕获也有上下文
+        restored = self.wechat_capture.load_recent()
+        if restored and config.debug_mode:
+            print(f"已加载{self.wechat_capture.contact}的{restored}条聊天记录")
+        
+        # 检测到新的聊天内容时在后台预取结果
+        self.prefetcher = SpeculativePrefetcher(
+            self.api_client, config, lambda: self.last_user_input
+        )
+        self.wechat_capture.add_change_listener(self.prefetcher.on_content_changed)
+        
+        # 微信窗口上一次检查时是否处于前台
+        self.wechat_focused = False
+        
+        # 当前操作的取消令牌，发起新操作、点击停止或关闭窗口时取消
+        self.active_token = None
+        
+        # 每次操作的阶段耗时写入本地指标文件
+        self.metrics = None
+        if config.metrics_enabled:
+            self.metrics = MetricsRecorder(
+                config.metrics_path, config.metrics_max_kb * 1024, config.metrics_backups
+            )
         
         # 窗口拖动相关变量
         self.draggable = True
@@ -330,22 +404,47 @@ class MainWindow(QMainWindow):
         self.analyze_btn = QPushButton("对话分析")
         self.analyze_btn.setStyleSheet(button_style)
         
+        self.run_all_btn = QPushButton("全部")
+        self.run_all_btn.setStyleSheet(button_style)
+        
         buttons_layout.addWidget(self.predict_btn)
         buttons_layout.addWidget(self.suggest_btn)
         buttons_layout.addWidget(self.analyze_btn)
+        buttons_layout.addWidget(self.run_all_btn)
         
         layout.addLayout(buttons_layout)
         
-        # 状态显示
+        # 状态显示，操作进行中时右侧显示停止按钮
+        status_layout = QHBoxLayout()
         self.status_label = QLabel("就绪")
         self.status_label.setStyleSheet("color: #666; font-style: italic;")
         self.status_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(self.status_label)
+        status_layout.addWidget(self.status_label)
+        
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.setStyleSheet("""
+            QPushButton {
+                background-color: rgba(255, 100, 100, 200);
+                color: white;
+                border: none;
+                border-radius: 5px;
+                padding: 4px 8px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: rgba(255, 100, 100, 230);
+            }
+        """)
+        self.stop_btn.hide()
+        status_layout.addWidget(self.stop_btn)
+        layout.addLayout(status_layout)
         
         # 绑定按钮事件
         self.predict_btn.clicked.connect(self.on_predict)
         self.suggest_btn.clicked.connect(self.on_suggest)
         self.analyze_btn.clicked.connect(self.on_analyze)
+        self.run_all_btn.clicked.connect(self.on_run_all)
+        self.stop_btn.clicked.connect(self.on_stop)
         
         # 绑定关系下拉框变化事件
         self.relation_combo.currentTextChanged.connect(self.on_relation_changed)
@@ -386,6 +485,26 @@ class MainWindow(QMainWindow):
                 return False
         return False
     
+    def _recent_text(self, context):
+        """最近一次捕获新增的消息，连同其前面的context条消息合并为聊天文本"""
+        count = len(self.wechat_capture.last_delta) + context
+        return conversation_text(self.wechat_capture.get_chat_window(max_messages=count))
+    
+    def _learn_replies(self, chat_history):
+        """用新增的消息更新本地回复模型，附带前一条消息以学习第一条新消息"""
+        self.reply_model.learn(self._recent_text(1), self.last_user_input[0])
+    
+    def check_wechat_focus(self):
+        """微信窗口获得焦点时，若连接已空闲过久则在后台重新预热；开启预取时在后台检测聊天内容变化"""
+        focused = self.wechat_capture.is_wechat_foreground()
+        gained = focused and not self.wechat_focused
+        if gained:
+            self.api_client.warm_up(only_if_idle=True)
+        self.wechat_focused = focused
+        # 不影响用户操作的后端每次都检查；需要复制窗口文本的后端只在微信刚获得焦点时读取一次
+        if self.prefetcher.enabled and (self.wechat_capture.backend.passive or gained):
+            threading.Thread(target=self.wechat_capture.poll, daemon=True).start()
+    
     def on_relation_changed(self, text):
         """关系下拉框变化事件处理"""
         if text == "其他":
@@ -434,29 +553,141 @@ class MainWindow(QMainWindow):
             result[2] = additional_info
             result[3] = gender
         
+        self.last_user_input = (result[0], result[1], result[2], result[3])
+        self.wechat_capture.self_name = result[0]
         return result[0], result[1], result[2], result[3]
     
-    def on_predict(self):
-        """预测按钮点击事件"""
-        self.status_label.setText("正在捕获聊天内容...")
-        self.predict_btn.setEnabled(False)
+    def _make_stream_renderer(self, content, as_list=False, cancel_token=None):
+        """创建流式渲染回调，将增量文本逐步显示到结果区域
+        
+        as_list为True时按条目显示，每条回复完整后立即出现；操作取消后不再刷新。
+        """
+        last_render = [0.0]
+        parser = IncrementalListParser(None) if as_list else None
+        
+        def _on_delta(delta, text):
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            if parser is not None:
+                if not parser.feed(delta):
+                    return
+                text = list_markdown(parser.items)
+            else:
+                # 限制刷新频率，避免频繁重绘
+                now = time.time()
+                if now - last_render[0] < 0.05:
+                    return
+                last_render[0] = now
+            QMetaObject.invokeMethod(self.result_list, "setMarkdown",
+                Qt.QueuedConnection,
+                Q_ARG(str, content + text))
         
-        # 在新线程中执行，避免UI卡顿
-        threading.Thread(target=self._do_predict, daemon=True).start()
+        return _on_delta
     
-    def _do_predict(self):
-        """执行预测操作"""
+    def _format_ttft(self, mode):
+        """格式化首字延迟，用于状态栏显示"""
+        if self.api_client.last_fallback.get(mode):
+            return "（请求失败，显示本地预测）"
+        ttft = self.api_client.get_ttft(mode)
+        if ttft is None:
+            return ""
+        if self.api_client.last_cache_hit.get(mode):
+            distance = self.api_client.last_near_distance.get(mode)
+            if distance is not None:
+                return f"（相似对话缓存 {ttft * 1000:.0f}毫秒，差异{distance}位）"
+            return f"（缓存 {ttft * 1000:.0f}毫秒）"
+        parts = []
+        queue_wait = self.api_client.get_queue_wait(mode)
+        if queue_wait:
+            parts.append(f"排队 {queue_wait:.2f}秒")
+        parts.append(f"首字 {ttft:.2f}秒")
+        hit_ratio = self.api_client.get_prompt_cache_hit_ratio(mode)
+        if self.config.debug_mode and hit_ratio is not None:
+            parts.append(f"前缀缓存 {hit_ratio:.0%}")
+        token_counts = self.api_client.get_token_counts(mode)
+        if self.config.debug_mode and token_counts:
+            parts.append(f"输入 {token_counts[0]}→{token_counts[1]} tokens")
+        return f"（{'，'.join(parts)}）"
+    
+    def _finish_trace(self, trace, error=None):
+        """结束本次操作的追踪并写入指标文件，调试模式下返回状态栏显示的耗时分布"""
+        if trace.total is None:
+            trace.finish(error)
+            end_trace()
+            if self.metrics is not None:
+                self.metrics.record(trace)
+        if self.config.debug_mode:
+            return f"｜{trace.format_breakdown()}"
+        return ""
+    
+    def _start_job(self, target):
+        """取消进行中的操作，并在新线程中执行target(cancel_token)，避免UI卡顿"""
+        if self.active_token is not None:
+            self.active_token.cancel()
+        cancel_token = CancelToken()
+        self.active_token = cancel_token
+        self.stop_btn.show()
+        threading.Thread(target=target, args=(cancel_token,), daemon=True).start()
+    
+    @pyqtSlot(object)
+    def on_job_finished(self, cancel_token):
+        """操作结束时在主线程中调用，仍是当前操作时隐藏停止按钮"""
+        if self.active_token is cancel_token:
+            self.active_token = None
+            self.stop_btn.hide()
+    
+    def _end_job(self, cancel_token):
+        """在工作线程中通知操作结束"""
+        QMetaObject.invokeMethod(self, "on_job_finished",
+            Qt.QueuedConnection,
+            Q_ARG(object, cancel_token))
+    
+    def on_stop(self):
+        """停止按钮点击事件，中断进行中的请求"""
+        if self.active_token is not None:
+            self.active_token.cancel()
+            self.active_token = None
+        self.stop_btn.hide()
+        self.status_label.setText("已停止")
+    
+    def closeEvent(self, event):
+        """关闭窗口时取消进行中的操作与预取，释放连接与限流额度，并保存本地模型、关闭聊天记录数据库
+
+        退出时的清理只在这里进行。
+        """
+        if self.active_token is not None:
+            self.active_token.cancel()
+            self.active_token = None
+        self.prefetcher.cancel()
+        if self.reply_model is not None:
+            self.reply_model.close()
+        if self.history_index is not None:
+            self.history_index.close()
+        super().closeEvent(event)
+    
+    def _set_status(self, text):
+        """在工作线程中更新状态栏"""
+        QMetaObject.invokeMethod(self.status_label, "setText",
+            Qt.QueuedConnection,
+            Q_ARG(str, text))
+    
+    def _run_action(self, cancel_token, action, button, request, renderer, preview=None):
+        """各按钮操作的共同流程：捕获聊天内容、获取用户输入、发送请求并显示结果
+        
+        request(chat_history, user_input, content)发送请求并返回结果，整体记为request阶段；
+        renderer(content, result)返回结果区域最终显示的内容；preview(chat_history, content)在请求前调用。
+        content为捕获的聊天内容加上结果标题，user_input为(nickname, relation, additional_info, gender)。
+        """
+        title, running_text, done_text, failure_text = ACTION_TEXTS[action]
+        trace = start_trace(action)
         try:
             # 捕获聊天内容
-            chat_history = self.wechat_capture.capture_chat_content()
+            with span("capture"):
+                chat_history = self.wechat_capture.capture_chat_content()
+            cancel_token.raise_if_cancelled()
             
             if not chat_history:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, "未能捕获聊天内容，请确保微信窗口处于活动状态"))
-                QMetaObject.invokeMethod(self.predict_btn, "setEnabled",
-                    Qt.QueuedConnection,
-                    Q_ARG(bool, True))
+                self._set_status("未能捕获聊天内容，请确保微信窗口处于活动状态")
                 return
             
             # 在主线程中更新UI
@@ -466,211 +697,182 @@ class MainWindow(QMainWindow):
             content = "### 捕获的聊天内容\n\n"
             for message in chat_history:
                 content += f"{message}\n"
-            content += "\n### 预测结果\n\n"
+            if title:
+                content += f"\n### {title}\n\n"
             
             # 获取用户输入（需要在主线程中执行）
             try:
                 # 使用线程安全的方法获取用户输入
-                nickname, relation, additional_info, gender = self._get_user_input_thread_safe()
+                with span("input"):
+                    user_input = self._get_user_input_thread_safe()
                 
                 # 保存用户配置
-                self.config.save_user_config(nickname=nickname, relation=relation)
+                with span("save_config"):
+                    self.config.save_user_config(nickname=user_input[0], relation=user_input[1])
             except Exception as e:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, f"获取用户输入失败: {str(e)}"))
-                QMetaObject.invokeMethod(self.predict_btn, "setEnabled",
-                    Qt.QueuedConnection,
-                    Q_ARG(bool, True))
+                self._set_status(f"获取用户输入失败: {str(e)}")
                 return
             
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "正在预测回复..."))
-            
-            # 调用API预测回复
-            predictions = self.api_client.predict_replies(
-                chat_history, nickname, relation, additional_info, gender
-            )
+            cancel_token.raise_if_cancelled()
+            if preview is not None:
+                preview(chat_history, content)
+            self._set_status(running_text)
             
-            # 显示结果
-            for prediction in predictions:
-                content += f"- {prediction}\n"
+            # 包括检索、排队、重试与解析，并发请求整体计为一个阶段
+            start_time = time.time()
+            with span("request"):
+                result = request(chat_history, user_input, content)
+            elapsed = time.time() - start_time
+            cancel_token.raise_if_cancelled()
             
-            # 在主线程中更新UI
-            QMetaObject.invokeMethod(self.result_list, "setMarkdown",
-                Qt.QueuedConnection,
-                Q_ARG(str, content))
+            # 在主线程中更新UI，等待渲染完成以便计时
+            with span("render"):
+                QMetaObject.invokeMethod(self.result_list, "setMarkdown",
+                    Qt.BlockingQueuedConnection,
+                    Q_ARG(str, renderer(content, result)))
             
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "预测完成"))
+            note = self._format_ttft(action) or f"（{elapsed:.2f}秒）"
+            self._set_status(done_text + note + self._finish_trace(trace))
             
+        except RequestCancelled:
+            # 停止或被新的操作取代，状态栏已由新的操作更新
+            self._finish_trace(trace, "cancelled")
         except Exception as e:
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, f"预测失败: {str(e)}"))
+            self._finish_trace(trace, str(e))
+            self._set_status(f"{failure_text}: {str(e)}")
         finally:
-            QMetaObject.invokeMethod(self.predict_btn, "setEnabled",
+            self._finish_trace(trace)
+            self._end_job(cancel_token)
+            QMetaObject.invokeMethod(button, "setEnabled",
                 Qt.QueuedConnection,
                 Q_ARG(bool, True))
     
+    def _show_local_predictions(self, chat_history, content):
+        """先显示本地模型的候选，模型结果到达后替换"""
+        if self.reply_model is None:
+            return
+        with span("local"):
+            local_predictions = self.reply_model.predict(conversation_text(chat_history))
+        if local_predictions:
+            QMetaObject.invokeMethod(self.result_list, "setMarkdown",
+                Qt.QueuedConnection,
+                Q_ARG(str, content + list_markdown(local_predictions) + "\n*本地预测，等待模型结果...*\n"))
+    
+    def on_predict(self):
+        """预测按钮点击事件"""
+        self.status_label.setText("正在捕获聊天内容...")
+        self.predict_btn.setEnabled(False)
+        self._start_job(self._do_predict)
+    
+    def _do_predict(self, cancel_token):
+        """执行预测操作"""
+        def _request(chat_history, user_input, content):
+            return self.api_client.predict_replies(
+                chat_history, *user_input,
+                on_delta=self._make_stream_renderer(content, as_list=True, cancel_token=cancel_token),
+                cancel_token=cancel_token
+            )
+        
+        self._run_action(cancel_token, "predict", self.predict_btn, _request,
+                         lambda content, predictions: content + list_markdown(predictions),
+                         preview=self._show_local_predictions)
+    
     def on_suggest(self):
         """建议回复按钮点击事件"""
         self.status_label.setText("正在捕获聊天内容...")
         self.suggest_btn.setEnabled(False)
-        
-        # 在新线程中执行，避免UI卡顿
-        threading.Thread(target=self._do_suggest, daemon=True).start()
+        self._start_job(self._do_suggest)
     
-    def _do_suggest(self):
+    def _do_suggest(self, cancel_token):
         """执行建议回复操作"""
-        try:
-            # 捕获聊天内容
-            chat_history = self.wechat_capture.capture_chat_content()
-            
-            if not chat_history:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, "未能捕获聊天内容，请确保微信窗口处于活动状态"))
-                QMetaObject.invokeMethod(self.suggest_btn, "setEnabled",
-                    Qt.QueuedConnection,
-                    Q_ARG(bool, True))
-                return
-            
-            # 在主线程中更新UI
-            QMetaObject.invokeMethod(self.result_list, "clear",
-                Qt.QueuedConnection)
-            
-            content = "### 捕获的聊天内容\n\n"
-            for message in chat_history:
-                content += f"{message}\n"
-            content += "\n### 建议回复\n\n"
-            
-            # 获取用户输入（需要在主线程中执行）
-            try:
-                # 使用线程安全的方法获取用户输入
-                nickname, relation, additional_info, gender = self._get_user_input_thread_safe()
-                
-                # 保存用户配置
-                self.config.save_user_config(nickname=nickname, relation=relation)
-            except Exception as e:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, f"获取用户输入失败: {str(e)}"))
-                QMetaObject.invokeMethod(self.suggest_btn, "setEnabled",
-                    Qt.QueuedConnection,
-                    Q_ARG(bool, True))
-                return
-            
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "正在生成建议回复..."))
-            
-            # 调用API生成建议回复
-            try:
-                suggestions = self.api_client.suggest_replies(
-                    chat_history, nickname, relation, additional_info, gender
-                )
-                
-                # 显示结果
-                if suggestions and isinstance(suggestions, list):
-                    for suggestion in suggestions:
-                        content += f"- {suggestion}\n"
-                else:
-                    content += "- 暂无建议回复\n"
-            except Exception as e:
-                content += f"- 生成建议失败: {str(e)}\n"
-            
-            # 在主线程中更新UI
-            QMetaObject.invokeMethod(self.result_list, "setMarkdown",
-                Qt.QueuedConnection,
-                Q_ARG(str, content))
-            
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "建议生成完成"))
-            
-        except Exception as e:
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, f"生成建议失败: {str(e)}"))
-        finally:
-            QMetaObject.invokeMethod(self.suggest_btn, "setEnabled",
-                Qt.QueuedConnection,
-                Q_ARG(bool, True))
+        def _request(chat_history, user_input, content):
+            return self.api_client.suggest_replies(
+                chat_history, *user_input,
+                on_delta=self._make_stream_renderer(content, as_list=True, cancel_token=cancel_token),
+                cancel_token=cancel_token
+            )
+        
+        self._run_action(cancel_token, "suggest", self.suggest_btn, _request,
+                         lambda content, suggestions: content + (list_markdown(suggestions) or "- 暂无建议回复\n"))
     
     def on_analyze(self):
         """对话分析按钮点击事件"""
         self.status_label.setText("正在捕获聊天内容...")
         self.analyze_btn.setEnabled(False)
-        
-        # 在新线程中执行，避免UI卡顿
-        threading.Thread(target=self._do_analyze, daemon=True).start()
+        self._start_job(self._do_analyze)
     
-    def _do_analyze(self):
+    def _do_analyze(self, cancel_token):
         """执行对话分析操作"""
-        try:
-            # 捕获聊天内容
-            chat_history = self.wechat_capture.capture_chat_content()
-            
-            if not chat_history:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, "未能捕获聊天内容，请确保微信窗口处于活动状态"))
-                QMetaObject.invokeMethod(self.analyze_btn, "setEnabled",
-                    Qt.QueuedConnection,
-                    Q_ARG(bool, True))
-                return
-            
-            # 在主线程中更新UI
-            QMetaObject.invokeMethod(self.result_list, "clear",
-                Qt.QueuedConnection)
-            
-            content = "### 捕获的聊天内容\n\n"
-            for message in chat_history:
-                content += f"{message}\n"
-            content += "\n### 对话分析结果\n\n"
-            
-            # 获取用户输入（需要在主线程中执行）
-            try:
-                # 使用线程安全的方法获取用户输入
-                nickname, relation, additional_info, gender = self._get_user_input_thread_safe()
-                
-                # 保存用户配置
-                self.config.save_user_config(nickname=nickname, relation=relation)
-            except Exception as e:
-                QMetaObject.invokeMethod(self.status_label, "setText",
-                    Qt.QueuedConnection,
-                    Q_ARG(str, f"获取用户输入失败: {str(e)}"))
-                QMetaObject.invokeMethod(self.analyze_btn, "setEnabled",
+        def _request(chat_history, user_input, content):
+            return self.api_client.analyze_conversation(
+                chat_history, *user_input,
+                on_delta=self._make_stream_renderer(content, cancel_token=cancel_token),
+                cancel_token=cancel_token
+            )
+        
+        self._run_action(cancel_token, "analyze", self.analyze_btn, _request,
+                         lambda content, analysis: content + analysis)
+    
+    def on_run_all(self):
+        """全部按钮点击事件"""
+        self.status_label.setText("正在捕获聊天内容...")
+        self.run_all_btn.setEnabled(False)
+        self._start_job(self._do_run_all)
+    
+    def _do_run_all(self, cancel_token):
+        """只捕获一次聊天内容，并发执行预测、建议与分析"""
+        # 各部分的当前显示内容，回调都在同一个事件循环线程中执行
+        sections = {mode: "等待中..." for mode in RUN_ALL_TITLES}
+        last_render = [0.0]
+        
+        def _compose(header):
+            content = header
+            for mode, title in RUN_ALL_TITLES.items():
+                content += f"\n### {title}\n\n{sections[mode]}\n"
+            return content
+        
+        def _request(chat_history, user_input, header):
+            def _render(force=False):
+                if cancel_token.cancelled:
+                    return
+                now = time.time()
+                if not force and now - last_render[0] < 0.05:
+                    return
+                last_render[0] = now
+                QMetaObject.invokeMethod(self.result_list, "setMarkdown",
                     Qt.QueuedConnection,
-                    Q_ARG(bool, True))
-                return
+                    Q_ARG(str, _compose(header)))
             
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "正在分析对话..."))
+            # 预测与建议按条目显示
+            parsers = {mode: IncrementalListParser(None) for mode in ("predict", "suggest")}
             
-            # 调用API分析对话
-            analysis = self.api_client.analyze_conversation(
-                chat_history, nickname, relation, additional_info, gender
-            )
-            
-            # 在主线程中更新UI
-            QMetaObject.invokeMethod(self.result_list, "setMarkdown",
-                Qt.QueuedConnection,
-                Q_ARG(str, content + analysis))
+            def _on_delta(mode, delta, text):
+                parser = parsers.get(mode)
+                if parser is not None:
+                    if not parser.feed(delta):
+                        return
+                    text = list_markdown(parser.items)
+                sections[mode] = text
+                _render()
             
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, "分析完成"))
+            def _on_result(mode, result):
+                if isinstance(result, list):
+                    sections[mode] = list_markdown(result) or "- 暂无结果\n"
+                else:
+                    sections[mode] = result
+                _render(force=True)
             
-        except Exception as e:
-            QMetaObject.invokeMethod(self.status_label, "setText",
-                Qt.QueuedConnection,
-                Q_ARG(str, f"分析失败: {str(e)}"))
-        finally:
-            QMetaObject.invokeMethod(self.analyze_btn, "setEnabled",
-                Qt.QueuedConnection,
-                Q_ARG(bool, True))
\ No newline at end of file
+            if self.config.combined_insights:
+                # 一次请求获取三部分结果，JSON输出不适合逐字显示
+                insights = self.api_client.get_all_insights(chat_history, *user_input, cancel_token=cancel_token)
+                for mode in RUN_ALL_TITLES:
+                    _on_result(mode, insights[mode])
+            else:
+                # 并发请求在后台事件循环中执行
+                self.api_client.run_all_sync(
+                    chat_history, *user_input,
+                    on_result=_on_result, on_delta=_on_delta, cancel_token=cancel_token
+                )
+        
+        self._run_action(cancel_token, "run_all", self.run_all_btn, _request,
+                         lambda header, result: _compose(header))
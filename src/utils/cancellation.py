@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求取消模块
+
+界面的每次操作持有一个取消令牌。用户点击停止、发起新的操作或关闭窗口时取消令牌，
+进行中的请求在下一个检查点退出，已注册的回调（如关闭流式连接）立即执行，
+从而尽快释放连接与限流额度。
+"""
+
+import threading
+
+
+class RequestCancelled(Exception):
+    """请求已被取消"""
+
+
+class CancelToken:
+    """线程安全的取消令牌"""
+
+    def __init__(self):
+        """初始化令牌"""
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        """是否已取消"""
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消令牌并执行已注册的回调，重复调用无效"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"取消回调执行失败: {e}")
+
+    def raise_if_cancelled(self):
+        """已取消时抛出RequestCancelled"""
+        if self._event.is_set():
+            raise RequestCancelled("请求已取消")
+
+    def wait(self, timeout=None):
+        """等待取消或超时，已取消时返回True"""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback):
+        """注册取消时执行的回调，令牌已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """移除已注册的回调"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
@@ -8,6 +8,7 @@
 """
 
 import os
+import sys
 import json
 from pathlib import Path
 
@@ -23,10 +24,138 @@ class Config:
         # API配置
         self.api_key = os.getenv("DEEPSEEK_API_KEY", "你的API_KEY")
         self.api_base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+        # HTTP连接池配置
+        self.http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+        self.http_max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "5"))
+        self.http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        self.http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+        self.http2 = os.getenv("HTTP2", "False").lower() == "true"
+        # 是否以流式方式输出结果
+        self.stream_output = os.getenv("STREAM_OUTPUT", "True").lower() == "true"
+        # "全部"按钮是否用一次请求获取三部分结果
+        self.combined_insights = os.getenv("COMBINED_INSIGHTS", "False").lower() == "true"
         
-        # 聊天历史配置
-        self.max_history_length = int(os.getenv("MAX_HISTORY_LENGTH", "5"))
+        # 聊天历史配置，按消息保存，每次捕获只追加新出现的消息，总大小不超过该值（KB）
+        self.max_history_kb = int(os.getenv("MAX_HISTORY_KB", "64"))
         
+        # 捕获后端：win32（读取微信窗口，仅Windows）、file、stdin或replay
+        self.capture_backend = os.getenv(
+            "CAPTURE_BACKEND", "win32" if sys.platform == "win32" else "file"
+        ).lower()
+        self.capture_file = Path(os.path.expanduser(
+            os.getenv("CAPTURE_FILE", str(Path.home() / ".chat_predictor" / "capture.txt"))
+        ))
+        # 回放的会话文件与倍速（0表示每次捕获前进一条）
+        self.capture_replay_path = os.getenv("CAPTURE_REPLAY_PATH", "")
+        self.capture_replay_speed = float(os.getenv("CAPTURE_REPLAY_SPEED", "1"))
+        # win32后端等待窗口激活与复制完成的上限（毫秒），期间以逐渐变长的间隔轮询
+        self.capture_focus_timeout_ms = float(os.getenv("CAPTURE_FOCUS_TIMEOUT_MS", "300"))
+        self.capture_copy_timeout_ms = float(os.getenv("CAPTURE_COPY_TIMEOUT_MS", "1000"))
+        # 录制捕获会话的文件，为空时不录制
+        self.capture_record_path = os.getenv("CAPTURE_RECORD_PATH", "")
+        
+        # 各模式聊天历史的输入token预算
+        self.input_token_budgets = {
+            "predict": int(os.getenv("INPUT_TOKEN_BUDGET_PREDICT", "2000")),
+            "suggest": int(os.getenv("INPUT_TOKEN_BUDGET_SUGGEST", "2000")),
+            "analyze": int(os.getenv("INPUT_TOKEN_BUDGET_ANALYZE", "6000")),
+            "insights": int(os.getenv("INPUT_TOKEN_BUDGET_INSIGHTS", "6000")),
+        }
+        
+        # 各模式的模型路由：模型、最大输出token数、温度，以及生成耗时目标（秒，不含首字延迟）
+        self.model_routes = {
+            mode: {
+                "model": os.getenv(f"MODEL_{mode.upper()}", "deepseek-chat"),
+                "max_tokens": int(os.getenv(f"MAX_TOKENS_{mode.upper()}", max_tokens)),
+                "temperature": float(os.getenv(f"TEMPERATURE_{mode.upper()}", temperature)),
+                "latency_target": float(os.getenv(f"LATENCY_TARGET_{mode.upper()}", latency_target)),
+            }
+            for mode, max_tokens, temperature, latency_target in (
+                ("predict", "120", "1.3", "0.8"),
+                ("suggest", "160", "1.3", "1.0"),
+                ("analyze", "800", "1.0", "12"),
+            )
+        }
+        # “全部”一次返回包含三部分结果的JSON对象，被截断的JSON无法解析，
+        # 输出上限默认为三个模式之和再加上JSON结构的余量
+        self.model_routes["insights"] = {
+            "model": os.getenv("MODEL_INSIGHTS", "deepseek-chat"),
+            "max_tokens": int(os.getenv(
+                "MAX_TOKENS_INSIGHTS", sum(route["max_tokens"] for route in self.model_routes.values()) + 120
+            )),
+            "temperature": float(os.getenv("TEMPERATURE_INSIGHTS", "1.0")),
+            "latency_target": float(os.getenv("LATENCY_TARGET_INSIGHTS", "15")),
+        }
+        # 生成耗时超过目标时自动缩小输出上限，最多缩小到配置值的ROUTE_MIN_TOKENS_RATIO
+        self.route_adaptive = os.getenv("ROUTE_ADAPTIVE", "True").lower() == "true"
+        self.route_min_samples = int(os.getenv("ROUTE_MIN_SAMPLES", "5"))
+        self.route_min_tokens_ratio = float(os.getenv("ROUTE_MIN_TOKENS_RATIO", "0.4"))
+        
+        # 请求频率配置：每秒请求数与允许的突发请求数
+        self.rate_limit_rps = float(os.getenv("RATE_LIMIT_RPS", "1"))
+        self.rate_limit_burst = int(os.getenv("RATE_LIMIT_BURST", "3"))
+        
+        # 请求策略配置：各模式的截止时间（秒）、重试、对冲与熔断
+        self.request_deadlines = {
+            "predict": float(os.getenv("REQUEST_DEADLINE_PREDICT", "15")),
+            "suggest": float(os.getenv("REQUEST_DEADLINE_SUGGEST", "15")),
+            "analyze": float(os.getenv("REQUEST_DEADLINE_ANALYZE", "60")),
+            "insights": float(os.getenv("REQUEST_DEADLINE_INSIGHTS", "60")),
+        }
+        self.request_max_retries = int(os.getenv("REQUEST_MAX_RETRIES", "2"))
+        self.retry_backoff_base_ms = int(os.getenv("RETRY_BACKOFF_BASE_MS", "300"))
+        self.retry_backoff_max_ms = int(os.getenv("RETRY_BACKOFF_MAX_MS", "3000"))
+        self.hedge_enabled = os.getenv("HEDGE_ENABLED", "False").lower() == "true"
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+        self.circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.circuit_reset_seconds = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+        
+        # 预取配置：检测到新内容时在后台提前计算结果
+        self.speculative_prefetch = os.getenv("SPECULATIVE_PREFETCH", "False").lower() == "true"
+        self.speculative_modes = [
+            mode.strip() for mode in os.getenv("SPECULATIVE_MODES", "predict").split(",") if mode.strip()
+        ]
+        self.speculative_budget_percent = float(os.getenv("SPECULATIVE_BUDGET_PERCENT", "30"))
+        self.speculative_delay_ms = int(os.getenv("SPECULATIVE_DELAY_MS", "300"))
+        
+        # 响应缓存配置
+        self.cache_enabled = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+        self.cache_ttl = int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+        self.cache_memory_entries = int(os.getenv("CACHE_MEMORY_ENTRIES", "128"))
+        self.cache_disk_mb = int(os.getenv("CACHE_DISK_MB", "50"))
+        self.cache_dir = Path.home() / ".chat_predictor" / "cache"
+
+        # 相似对话复用配置：与之前的对话只差时间或滚动位置时直接复用结果
+        self.near_duplicate_enabled = os.getenv("NEAR_DUPLICATE_ENABLED", "True").lower() == "true"
+        self.near_duplicate_threshold = int(os.getenv("NEAR_DUPLICATE_THRESHOLD", "6"))
+        self.near_duplicate_refresh = os.getenv("NEAR_DUPLICATE_REFRESH", "True").lower() == "true"
+        self.near_duplicate_entries = int(os.getenv("NEAR_DUPLICATE_ENTRIES", "256"))
+        
+        # 本地回复预测配置：从捕获的聊天记录中学习，点击后立即显示，请求失败时代替模型结果
+        self.local_predictor_enabled = os.getenv("LOCAL_PREDICTOR_ENABLED", "True").lower() == "true"
+        self.local_predictor_max_utterances = int(os.getenv("LOCAL_PREDICTOR_MAX_UTTERANCES", "5000"))
+        self.local_predictor_path = Path.home() / ".chat_predictor" / "reply_model.json.gz"
+        
+        # 过往聊天记录检索配置：所有捕获的消息按聊天对象写入本地全文索引
+        self.retrieval_enabled = os.getenv("RETRIEVAL_ENABLED", "True").lower() == "true"
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+        self.history_index_path = Path.home() / ".chat_predictor" / "history.db"
+        # 保存的消息同时用于检索与恢复上下文：每个聊天对象保留的消息数，以及保留天数（0表示不按时间清理）
+        self.history_max_messages = int(os.getenv("HISTORY_MAX_MESSAGES", "20000"))
+        self.history_retention_days = int(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+        
+        # 上下文恢复配置：启动或切换聊天对象时从history.db加载该对象最近的消息
+        self.conversation_store_enabled = os.getenv("CONVERSATION_STORE_ENABLED", "True").lower() == "true"
+        self.conversation_store_restore = int(os.getenv("CONVERSATION_STORE_RESTORE", "100"))
+        
+        # 阶段耗时指标配置
+        self.metrics_enabled = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+        self.metrics_max_kb = int(os.getenv("METRICS_MAX_KB", "1024"))
+        self.metrics_backups = int(os.getenv("METRICS_BACKUPS", "3"))
+        self.metrics_path = Path.home() / ".chat_predictor" / "metrics" / "spans.jsonl"
+
         # 用户配置
         self.user_config_path = Path.home() / ".chat_predictor" / "user_config.json"
         self.user_config = self.load_user_config()
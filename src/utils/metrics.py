@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+延迟统计模块
+
+提供分位数计算与滑动窗口延迟统计。
+"""
+
+import math
+import threading
+from collections import deque
+
+
+def percentile(values, p):
+    """计算分位数（最近秩法），values为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyWindow:
+    """按键记录最近若干次延迟的滑动窗口"""
+
+    def __init__(self, size=100):
+        """初始化窗口，size为每个键保留的样本数"""
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, latency):
+        """记录一次延迟（秒）"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.size)
+            samples.append(latency)
+
+    def clear(self, key):
+        """清空键的样本"""
+        with self._lock:
+            self._samples.pop(key, None)
+
+    def count(self, key):
+        """获取键当前的样本数"""
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+    def percentile(self, key, p):
+        """获取键的延迟分位数，无样本时返回None"""
+        with self._lock:
+            values = list(self._samples.get(key, ()))
+        return percentile(values, p)
+
+    def summary(self, key):
+        """获取键的p50/p95/p99摘要"""
+        with self._lock:
+            values = list(self._samples.get(key, ()))
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
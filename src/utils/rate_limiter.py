@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求频率控制模块
+
+基于令牌桶算法控制API请求频率，支持突发容量，
+可同时用于工作线程和asyncio协程，并根据429响应自适应调整速率。
+"""
+
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+from src.utils.cancellation import RequestCancelled
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头，返回需要等待的秒数，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器"""
+
+    def __init__(self, rate, capacity, min_rate=None):
+        """初始化令牌桶
+
+        rate: 每秒补充的令牌数
+        capacity: 桶容量，即允许的突发请求数
+        min_rate: 遇到限流时速率下调的下限
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 8
+
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        # 服务端要求暂停请求的截止时间
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+        self.throttled_count = 0
+
+    def _refill(self, now):
+        """按经过的时间补充令牌"""
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+    def _reserve(self):
+        """预占一个令牌，返回需要等待的秒数
+
+        令牌不足时允许余额为负，相当于按到达顺序排队，
+        后来的请求需要等待更久。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._blocked_until - now)
+            self._record(wait)
+            return wait
+
+    def _record(self, wait):
+        """记录一次请求的排队时间"""
+        self.total_requests += 1
+        self.total_wait += wait
+        self.last_wait = wait
+
+    def _refund(self):
+        """排队期间被取消的请求归还预占的令牌"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def acquire(self, cancel_token=None):
+        """阻塞直到获得令牌，返回排队等待的秒数
+
+        cancel_token被取消时归还令牌并抛出RequestCancelled。
+        """
+        wait = self._reserve()
+        if wait > 0:
+            if cancel_token is None:
+                time.sleep(wait)
+            elif cancel_token.wait(wait):
+                self._refund()
+                raise RequestCancelled("请求已取消")
+        return wait
+
+    async def acquire_async(self):
+        """在协程中等待令牌，返回排队等待的秒数，任务被取消时归还令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._refund()
+                raise
+        return wait
+
+    def try_acquire(self):
+        """尝试立即获取令牌，成功返回True，不会等待"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens < 1 or now < self._blocked_until:
+                return False
+            self._tokens -= 1
+            self._record(0.0)
+            return True
+
+    def on_rate_limited(self, retry_after=None):
+        """收到429响应时调用：暂停到Retry-After指定的时间，并将速率减半"""
+        with self._lock:
+            now = time.monotonic()
+            self.throttled_count += 1
+            if retry_after is None:
+                retry_after = 1.0 / self.rate
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            self.rate = max(self.min_rate, self.rate / 2)
+            # 清空突发额度，恢复期间按新速率逐个放行
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        """请求成功时调用：速率逐步恢复到配置值"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def get_stats(self):
+        """获取限流统计信息"""
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "requests": self.total_requests,
+                "throttled": self.throttled_count,
+                "last_wait": self.last_wait,
+                "avg_wait": self.total_wait / self.total_requests if self.total_requests else 0.0,
+            }
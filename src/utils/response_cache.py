@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+响应缓存模块
+
+为API请求结果提供两级缓存：内存中的LRU缓存和磁盘上带过期时间的持久化缓存，
+相同的对话与设置再次请求时可直接返回结果，程序重启后依然有效。
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """两级响应缓存类（内存LRU + 磁盘TTL）"""
+
+    def __init__(self, cache_dir, max_memory_entries=128, ttl=86400, max_disk_bytes=50 * 1024 * 1024):
+        """初始化缓存
+
+        cache_dir: 磁盘缓存目录
+        max_memory_entries: 内存中最多保留的条目数
+        ttl: 缓存有效期（秒）
+        max_disk_bytes: 磁盘缓存占用的最大字节数
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+
+        # 内存缓存：key -> (创建时间, 值)，按最近使用顺序排列
+        self._memory = OrderedDict()
+        # 磁盘缓存索引：key -> (创建时间, 文件大小)
+        self._disk_index = {}
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        # 命中统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(mode, model, chat_history, nickname="", relation="", gender="", additional_info=""):
+        """根据请求参数生成缓存键"""
+        payload = json.dumps(
+            [mode, model, list(chat_history), nickname, relation, gender, additional_info],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        """获取缓存键对应的磁盘文件路径"""
+        return self.cache_dir / f"{key}.json"
+
+    def _load_disk_index(self):
+        """扫描磁盘缓存目录，建立索引并清理过期条目"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            now = time.time()
+            for path in self.cache_dir.glob("*.json"):
+                stat = path.stat()
+                if now - stat.st_mtime > self.ttl:
+                    path.unlink()
+                    continue
+                self._disk_index[path.stem] = (stat.st_mtime, stat.st_size)
+                self._disk_bytes += stat.st_size
+            self._evict_disk()
+        except Exception as e:
+            print(f"加载磁盘缓存失败: {e}")
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            # 先查内存缓存
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            # 再查磁盘缓存
+            if key in self._disk_index:
+                created, _ = self._disk_index[key]
+                if now - created <= self.ttl:
+                    try:
+                        with open(self._path(key), "r", encoding="utf-8") as f:
+                            value = json.load(f)["value"]
+                        self._remember(key, created, value)
+                        self.disk_hits += 1
+                        return value
+                    except Exception as e:
+                        print(f"读取磁盘缓存失败: {e}")
+                self._remove_disk(key)
+
+            self.misses += 1
+            return None
+
+    def __contains__(self, key):
+        """判断缓存中是否存在未过期的条目，不计入命中统计"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key) or self._disk_index.get(key)
+            return entry is not None and now - entry[0] <= self.ttl
+
+    def set(self, key, value):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+
+            try:
+                data = json.dumps({"created": now, "value": value}, ensure_ascii=False)
+                path = self._path(key)
+                # 先写临时文件再替换，避免中途退出留下损坏的缓存
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+                if key in self._disk_index:
+                    self._disk_bytes -= self._disk_index[key][1]
+                size = path.stat().st_size
+                self._disk_index[key] = (now, size)
+                self._disk_bytes += size
+                self._evict_disk()
+            except Exception as e:
+                print(f"写入磁盘缓存失败: {e}")
+
+    def _remember(self, key, created, value):
+        """写入内存缓存，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remove_disk(self, key):
+        """删除一个磁盘缓存条目"""
+        _, size = self._disk_index.pop(key, (0, 0))
+        self._disk_bytes -= size
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        """磁盘缓存超出大小限制时，按创建时间从旧到新删除"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        for key, _ in sorted(self._disk_index.items(), key=lambda item: item[1][0]):
+            self._remove_disk(key)
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._memory.clear()
+            for key in list(self._disk_index):
+                self._remove_disk(key)
+
+    def get_stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+            }
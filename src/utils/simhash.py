@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+相似对话检测模块
+
+对规范化后的聊天内容计算64位SimHash指纹。只差一行时间、或滚动位置相差一两条消息的对话
+指纹只有少量位不同，可以直接复用之前的结果，不必重新请求。
+"""
+
+import re
+import hashlib
+import threading
+from functools import lru_cache
+from collections import Counter, OrderedDict
+
+from src.data.chat_parser import split_messages
+
+FINGERPRINT_BITS = 64
+# 特征使用的字符片段长度
+SHINGLE_SIZE = 3
+
+
+def normalize_conversation(text):
+    """规范化聊天内容：去掉发送者行中的时间与多余空白，每条消息一行"""
+    lines = []
+    for _, name, content in split_messages(text):
+        content = re.sub(r"\s+", " ", content).strip().lower()
+        lines.append(f"{name}：{content}" if name else content)
+    return "\n".join(lines)
+
+
+def simhash(text):
+    """计算文本的64位SimHash指纹"""
+    if len(text) <= SHINGLE_SIZE:
+        shingles = [text] if text else []
+    else:
+        shingles = [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)]
+    # 按字节统计各取值出现的次数，避免对每个片段逐位累加
+    byte_counts = [Counter() for _ in range(FINGERPRINT_BITS // 8)]
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=FINGERPRINT_BITS // 8).digest()
+        for position, value in enumerate(digest):
+            byte_counts[position][value] += 1
+
+    fingerprint = 0
+    for position, counts in enumerate(byte_counts):
+        for bit in range(8):
+            ones = sum(count for value, count in counts.items() if value >> bit & 1)
+            # 多数片段该位为1时指纹的该位为1
+            if ones * 2 > len(shingles):
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+@lru_cache(maxsize=64)
+def conversation_fingerprint(text):
+    """计算聊天内容的指纹与规范化后的最后一条消息，同一段内容在各模式间只计算一次"""
+    normalized = normalize_conversation(text)
+    return simhash(normalized), normalized.rsplit("\n", 1)[-1]
+
+
+def hamming_distance(a, b):
+    """计算两个指纹不同的位数"""
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """按请求设置分组保存最近的对话指纹，查找差异不超过阈值的对话"""
+
+    def __init__(self, threshold=6, max_entries=256):
+        """初始化索引，threshold为允许的最大不同位数"""
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # (分组, 指纹) -> (最后一条消息, 请求键)，按最近使用顺序排列
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 命中统计
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._distance_total = 0
+
+    def add(self, group, text, key):
+        """登记一次成功请求的对话指纹"""
+        fingerprint, tail = conversation_fingerprint(text)
+        with self._lock:
+            self._entries[(group, fingerprint)] = (tail, key)
+            self._entries.move_to_end((group, fingerprint))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def find(self, group, text):
+        """查找相似的对话，返回(请求键, 不同位数)，没有时返回None
+
+        最后一条消息必须相同：对方发来新消息后即使整体相似也需要重新请求。
+        """
+        fingerprint, tail = conversation_fingerprint(text)
+        best = None
+        with self._lock:
+            for (entry_group, entry_fingerprint), (entry_tail, key) in self._entries.items():
+                if entry_group != group or entry_tail != tail:
+                    continue
+                distance = hamming_distance(fingerprint, entry_fingerprint)
+                if distance <= self.threshold and (best is None or distance < best[1]):
+                    best = (key, distance)
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._distance_total += best[1]
+        return best
+
+    def get_stats(self):
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "threshold": self.threshold,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else None,
+                "mean_distance": self._distance_total / self.hits if self.hits else None,
+                "refreshes": self.refreshes,
+            }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求合并模块
+
+相同的请求正在进行时，后到的调用不再重复发送，而是等待并共享同一个结果。
+工作线程与asyncio协程共用同一张在途请求表。
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from src.utils.cancellation import RequestCancelled
+
+# 等待在途请求时检查取消令牌的间隔（秒）
+WAIT_STEP = 0.05
+
+
+class SingleFlight:
+    """按键合并并发的相同请求"""
+
+    def __init__(self):
+        """初始化在途请求表"""
+        # key -> 在途请求的Future
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """加入在途请求，返回(Future, 是否由当前调用负责执行)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.executed += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        """结束在途请求，将结果或异常交给所有等待者"""
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def is_inflight(self, key):
+        """判断相同key的请求是否正在进行"""
+        with self._lock:
+            return key in self._inflight
+
+    def do(self, key, fn, cancel_token=None):
+        """执行fn并返回结果；相同key的请求正在进行时直接等待其结果
+
+        等待期间cancel_token被取消时抛出RequestCancelled，在途请求不受影响。
+        """
+        future, leader = self._join(key)
+        if not leader:
+            if cancel_token is None:
+                return future.result()
+            while True:
+                try:
+                    return future.result(timeout=WAIT_STEP)
+                except FutureTimeoutError:
+                    cancel_token.raise_if_cancelled()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key, coro_fn):
+        """协程版本的do，coro_fn返回要执行的协程"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            # 负责执行的协程被取消时，等待者收到RequestCancelled后可以自行重新请求
+            self._finish(key, future, error=RequestCancelled("请求已取消"))
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def get_stats(self):
+        """获取请求合并统计"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "inflight": len(self._inflight),
+            }
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上下文预算模块
+
+在本地估算文本的token数，并在请求前裁剪聊天历史，
+优先保留最新的内容，使输入长度不超过各模式的预算。
+"""
+
+import re
+import math
+
+# 中日韩字符及全角标点
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# DeepSeek分词器的经验比例：1个中文字符约0.6个token，1个英文字符约0.3个token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+
+def estimate_tokens(text):
+    """估算文本的token数"""
+    if not text:
+        return 0
+    cjk_count = len(text) - len(CJK_PATTERN.sub("", text))
+    other_count = len(text) - cjk_count
+    return math.ceil(cjk_count * CJK_TOKENS_PER_CHAR + other_count * OTHER_TOKENS_PER_CHAR)
+
+
+class TokenBudgeter:
+    """聊天历史的token预算裁剪器"""
+
+    def count(self, chat_history):
+        """估算聊天历史的总token数"""
+        return sum(estimate_tokens(message) + 1 for message in chat_history)
+
+    def fit(self, chat_history, budget):
+        """裁剪聊天历史使其不超过预算
+
+        从最新的记录开始向前保留，放不下的记录只保留其末尾的若干行，更早的记录全部丢弃。
+        返回(裁剪后的历史, 裁剪前token数, 裁剪后token数)。
+        """
+        history = list(chat_history)
+        before = self.count(history)
+        if budget is None or before <= budget:
+            return history, before, before
+
+        kept = []
+        remaining = budget
+        for message in reversed(history):
+            # 每条记录在提示中额外占用一个换行
+            tokens = estimate_tokens(message) + 1
+            if tokens <= remaining:
+                kept.append(message)
+                remaining -= tokens
+                continue
+
+            # 放不下整条记录时，从末尾按行保留
+            lines = []
+            remaining -= 1
+            for line in reversed(message.split("\n")):
+                line_tokens = estimate_tokens(line) + 1
+                if line_tokens > remaining:
+                    break
+                lines.append(line)
+                remaining -= line_tokens
+            if lines:
+                kept.append("\n".join(reversed(lines)))
+            elif not kept and remaining > 0:
+                # 连最新的一行都放不下时，按字符截取其末尾
+                tail = message[-int(remaining / CJK_TOKENS_PER_CHAR):]
+                kept.append(tail)
+            break
+
+        kept.reverse()
+        return kept, before, self.count(kept)
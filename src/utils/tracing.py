@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+阶段耗时追踪模块
+
+记录一次点击从捕获到显示结果各阶段的耗时。追踪绑定在当前线程上，
+API等下层模块通过span()记录阶段，当前线程没有追踪时不做任何事情。
+阶段可以嵌套：界面把整个请求记为request，检索、提示、排队与解析是其中的细分。
+结束的追踪写入按大小轮转的本地JSONL文件，便于之后分析。
+"""
+
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# 各阶段在状态栏中的显示名称
+SPAN_LABELS = {
+    "capture": "捕获",
+    "capture_focus": "激活",
+    "capture_copy": "复制",
+    "input": "输入",
+    "save_config": "保存",
+    "local": "本地",
+    "retrieve": "检索",
+    "queue": "排队",
+    "prompt": "提示",
+    "request": "请求",
+    "parse": "解析",
+    "render": "渲染",
+}
+
+_local = threading.local()
+
+
+class Trace:
+    """一次操作的阶段耗时记录"""
+
+    def __init__(self, action):
+        """开始追踪，action为操作名称，如predict"""
+        self.action = action
+        self.start_time = time.perf_counter()
+        self.timestamp = time.time()
+        # (阶段名, 相对开始时间的偏移秒数, 耗时秒数)
+        self.spans = []
+        self.total = None
+        self.error = None
+
+    @contextmanager
+    def span(self, name):
+        """记录一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append((name, start - self.start_time, end - start))
+
+    def finish(self, error=None):
+        """结束追踪并返回总耗时（秒）"""
+        if self.total is None:
+            self.total = time.perf_counter() - self.start_time
+            self.error = error
+        return self.total
+
+    def durations(self):
+        """按阶段汇总耗时（秒），同名阶段累加"""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def format_breakdown(self):
+        """格式化为状态栏显示的简要耗时分布"""
+        parts = [
+            f"{SPAN_LABELS.get(name, name)} {duration * 1000:.0f}"
+            for name, duration in self.durations().items()
+        ]
+        total = self.total if self.total is not None else time.perf_counter() - self.start_time
+        return f"{' · '.join(parts)} = {total * 1000:.0f}毫秒"
+
+    def to_dict(self):
+        """转换为写入指标文件的记录"""
+        return {
+            "ts": round(self.timestamp, 3),
+            "action": self.action,
+            "total_ms": round(self.total * 1000, 3) if self.total is not None else None,
+            "error": self.error,
+            "spans": [
+                {"name": name, "start_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for name, offset, duration in self.spans
+            ],
+        }
+
+
+def start_trace(action):
+    """在当前线程上开始一次追踪"""
+    trace = Trace(action)
+    _local.trace = trace
+    return trace
+
+
+def current_trace():
+    """获取当前线程的追踪，没有时返回None"""
+    return getattr(_local, "trace", None)
+
+
+def end_trace():
+    """解除当前线程上的追踪"""
+    _local.trace = None
+
+
+@contextmanager
+def bind_trace(trace):
+    """在当前线程上临时使用指定的追踪，工作线程中的阶段因此记录到发起者的追踪上"""
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name):
+    """在当前线程的追踪上记录一个阶段，没有追踪时不计时"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+class MetricsRecorder:
+    """将追踪结果追加写入按大小轮转的JSONL文件"""
+
+    def __init__(self, path, max_bytes=1024 * 1024, backup_count=3):
+        """初始化记录器，path为指标文件路径"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._logger = logging.getLogger(f"chat_predictor.metrics.{path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def record(self, trace):
+        """写入一条追踪记录"""
+        self._logger.info(json.dumps(trace.to_dict(), ensure_ascii=False))
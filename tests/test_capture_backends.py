@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""捕获后端测试"""
+
+import io
+import time
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.data.capture_backends import ReplayBackend, SessionRecorder, StdinBackend, FileBackend, CAPTURE_SEPARATOR
+
+EVENTS = [(0.0, "第一次"), (0.05, "第二次"), (0.1, "第三次")]
+
+
+class ReplayBackendTest(unittest.TestCase):
+    """录制会话的回放"""
+
+    def test_empty_session_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ReplayBackend([])
+
+    def test_step_mode_advances_one_event_per_read(self):
+        backend = ReplayBackend(EVENTS, speed=0)
+        self.assertEqual([backend.read_text() for _ in range(4)], ["第一次", "第二次", "第三次", "第三次"])
+
+    def test_play_follows_recorded_intervals(self):
+        backend = ReplayBackend(EVENTS, speed=2)
+        start = time.monotonic()
+        texts = [backend.read_text() for _ in backend.play()]
+        self.assertEqual(texts, ["第一次", "第二次", "第三次"])
+        # 两倍速回放0.1秒的会话
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
+
+    def test_timed_read_follows_elapsed_time(self):
+        backend = ReplayBackend(EVENTS, speed=1)
+        self.assertEqual(backend.read_text(), "第一次")
+        time.sleep(0.12)
+        self.assertEqual(backend.read_text(), "第三次")
+
+
+class SessionRoundTripTest(unittest.TestCase):
+    """录制的会话可以原样回放"""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recorded_session_replays_in_order(self):
+        path = self.directory / "session" / "capture.jsonl"
+        recorder = SessionRecorder(path)
+        for _, text in EVENTS:
+            recorder.record(text)
+        backend = ReplayBackend.from_file(path, speed=0)
+        self.assertEqual([backend.read_text() for _ in EVENTS], [text for _, text in EVENTS])
+
+
+class PassiveBackendTest(unittest.TestCase):
+    """文件与标准输入后端"""
+
+    def test_stdin_publishes_each_capture(self):
+        stream = io.StringIO(f"小明：\n在吗\n{CAPTURE_SEPARATOR}\n小明：\n在吗\n我：\n在\n")
+        backend = StdinBackend(stream)
+        deadline = time.monotonic() + 1
+        while backend.read_text() != "小明：\n在吗\n我：\n在" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(backend.read_text(), "小明：\n在吗\n我：\n在")
+        self.assertTrue(backend.passive)
+
+    def test_missing_file_returns_none(self):
+        self.assertIsNone(FileBackend(Path(tempfile.gettempdir()) / "不存在的捕获.txt").read_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
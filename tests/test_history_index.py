@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""聊天记录存储与检索测试"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.data import history_index
+from src.data.history_index import HistoryIndex
+from src.data.message_buffer import ChatMessage
+from src.data.wechat_capture import WeChatCapture
+from src.utils.config import Config
+
+
+def make_message(index):
+    """创建测试用的消息记录"""
+    sender = "小明" if index % 2 else "我"
+    return ChatMessage(sender, f"10:{index % 60:02d}", f"话题{index}", index)
+
+
+class HistoryIndexTest(unittest.TestCase):
+    """消息的保存、恢复与保留上限"""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.index = HistoryIndex(self.directory / "history.db", max_messages=5)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_duplicates_are_ignored_and_recent_is_in_order(self):
+        messages = [make_message(i) for i in range(3)]
+        self.assertEqual(self.index.add_messages("小明", messages), 3)
+        self.assertEqual(self.index.add_messages("小明", messages), 0)
+        self.assertEqual(self.index.recent("小明", 2), [("小明", "10:01", "话题1"), ("我", "10:02", "话题2")])
+        self.assertEqual(self.index.last_contact(), "小明")
+
+    def test_trim_removes_messages_from_search(self):
+        original = history_index.TRIM_INTERVAL
+        history_index.TRIM_INTERVAL = 1
+        try:
+            self.index.add_messages("小明", [make_message(i) for i in range(10)])
+        finally:
+            history_index.TRIM_INTERVAL = original
+        self.assertEqual(self.index.count("小明"), 5)
+        found = {content for exchange in self.index.search("话题", "小明", limit=10) for _, content in exchange}
+        self.assertEqual(found, {f"话题{i}" for i in range(5, 10)})
+
+    def test_repeated_messages_are_kept(self):
+        messages = [ChatMessage("小明", None, "好的", 0), ChatMessage("小明", None, "好的", 0)]
+        self.assertEqual(self.index.add_messages("小明", messages), 2)
+        # 再次捕获到相同的两条消息时不重复保存
+        self.assertEqual(self.index.add_messages("小明", messages[1:], messages[:1]), 0)
+        self.assertEqual(self.index.recent("小明", 5), [("小明", None, "好的"), ("小明", None, "好的")])
+
+
+class ConversationRestoreTest(unittest.TestCase):
+    """重新启动后从存储恢复聊天历史"""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.index = HistoryIndex(self.directory / "history.db")
+        self.config = Config()
+        self.config.conversation_store_enabled = True
+        self.config.capture_record_path = ""
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_repeated_line_survives_restore(self):
+        capture = WeChatCapture(self.config, backend=object(), store=self.index)
+        capture.process_chat_content("小明：\n明天去吗\n小明：\n好的\n小明：\n好的")
+        # 之后的捕获与已保存的消息重叠，只保存新消息
+        capture.process_chat_content("小明：\n好的\n小明：\n好的\n我：\n好")
+        self.assertEqual(self.index.count("小明"), 4)
+
+        restored = WeChatCapture(self.config, backend=object(), store=self.index)
+        self.assertEqual(restored.load_recent(), 4)
+        self.assertEqual(restored.get_chat_history(), ["小明：\n明天去吗", "小明：\n好的", "小明：\n好的", "我：\n好"])
+
+
+if __name__ == "__main__":
+    unittest.main()
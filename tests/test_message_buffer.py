@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""聊天消息缓冲测试"""
+
+import unittest
+
+from src.data.message_buffer import ChatMessage, MessageBuffer
+
+
+class MessageBufferWindowTest(unittest.TestCase):
+    """消息窗口的选取"""
+
+    def setUp(self):
+        self.buffer = MessageBuffer(1 << 20)
+        self.buffer.append(ChatMessage.from_block("小明 10:00\n早上好", 1))
+
+    def test_window_keeps_whole_messages_within_budget(self):
+        self.buffer.append(ChatMessage.from_block("我 10:01\n早", 2))
+        window = self.buffer.window(max_tokens=100)
+        self.assertEqual([message.digest for message in window], [1, 2])
+
+    def test_oversized_newest_message_is_truncated_not_dropped(self):
+        self.buffer.append(ChatMessage.from_block("小明 10:02\n" + "很长的消息" * 1000, 2))
+        window = self.buffer.window(max_tokens=50)
+        self.assertEqual(len(window), 1)
+        self.assertEqual(window[0].sender, "小明")
+        self.assertLessEqual(window[0].tokens, 50)
+        self.assertTrue(window[0].text.endswith("很长的消息"))
+
+
+class MessageBufferLimitTest(unittest.TestCase):
+    """按总字节数限制缓冲"""
+
+    def test_oldest_messages_are_evicted(self):
+        message = ChatMessage.from_block("小明 10:00\n你好", 0)
+        buffer = MessageBuffer(message.size * 3)
+        evicted = sum(buffer.append(ChatMessage.from_block("小明 10:00\n你好", index)) for index in range(5))
+        self.assertEqual(evicted, 2)
+        self.assertLessEqual(buffer.nbytes, buffer.max_bytes)
+        self.assertEqual([message.digest for message in buffer], [2, 3, 4])
+        self.assertNotIn(0, buffer)
+        self.assertIn(4, buffer)
+
+    def test_oversized_message_keeps_tail_within_limit(self):
+        buffer = MessageBuffer(64)
+        buffer.append(ChatMessage.from_block("小明 10:00\n" + "很长的消息" * 100 + "结尾", 1))
+        self.assertEqual(len(buffer), 1)
+        self.assertLessEqual(buffer.nbytes, 64)
+        self.assertTrue(buffer.last(1)[0].text.endswith("结尾"))
+
+    def test_repeated_digest_tracked_until_last_copy_evicted(self):
+        message = ChatMessage.from_block("小明：\n好的", 7)
+        buffer = MessageBuffer(message.size * 2)
+        buffer.append(message)
+        buffer.append(ChatMessage.from_block("小明：\n好的", 7))
+        buffer.append(ChatMessage.from_block("我：\n嗯", 8))
+        self.assertIn(7, buffer)
+        buffer.append(ChatMessage.from_block("我：\n嗯", 9))
+        self.assertNotIn(7, buffer)
+        self.assertEqual(buffer.digests(5), [8, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""模型路由测试"""
+
+import unittest
+from types import SimpleNamespace
+
+from src.api.model_router import ModelRouter
+
+
+def make_config():
+    """创建测试用的路由配置"""
+    routes = {
+        mode: {"model": "deepseek-chat", "max_tokens": max_tokens, "temperature": 1.0, "latency_target": 1.0}
+        for mode, max_tokens in (("analyze", 800), ("insights", 1200))
+    }
+    return SimpleNamespace(
+        model_routes=routes, route_adaptive=True, route_min_samples=5,
+        route_min_tokens_ratio=0.4, debug_mode=False,
+    )
+
+
+class ModelRouterTest(unittest.TestCase):
+    """输出上限的自动调整"""
+
+    def test_slow_route_shrinks_but_json_route_does_not(self):
+        router = ModelRouter(make_config())
+        for _ in range(20):
+            router.record("analyze", 10)
+            router.record("insights", 10)
+        self.assertLess(router.options("analyze")["max_tokens"], 800)
+        self.assertEqual(router.options("insights")["max_tokens"], 1200)
+
+
+if __name__ == "__main__":
+    unittest.main()
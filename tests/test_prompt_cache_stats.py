@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""提前结束的流式请求仍记录上下文缓存用量"""
+
+import time
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from src.utils.config import Config
+from src.api.deepseek_api import DeepSeekAPI
+
+# 五个条目之后还有说明文字，最后一个数据块只包含用量
+DELTAS = ["1. 好的\n2. 明天见\n", "3. 哈哈\n4. 行\n", "5. 没问题\n", "以上回复仅供参考", "，可以根据语气调整"]
+USAGE = SimpleNamespace(prompt_cache_hit_tokens=300, prompt_cache_miss_tokens=100)
+
+
+def make_chunks():
+    """构造流式响应的数据块"""
+    chunks = [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))], usage=None)
+        for delta in DELTAS
+    ]
+    chunks.append(SimpleNamespace(choices=[], usage=USAGE))
+    return chunks
+
+
+class FakeStream:
+    """按顺序产出数据块的流式响应"""
+
+    def __init__(self):
+        self.chunks = iter(make_chunks())
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.closed:
+                raise ConnectionError("连接已关闭")
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncStream(FakeStream):
+    """FakeStream的异步版本"""
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            if self.closed:
+                raise ConnectionError("连接已关闭")
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def make_client(stream_class, asynchronous=False):
+    """创建总是返回指定流式响应的客户端"""
+    def create(**kwargs):
+        return stream_class()
+
+    async def acreate(**kwargs):
+        return stream_class()
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=acreate if asynchronous else create
+    )))
+
+
+def wait_for(condition, timeout=2.0):
+    """等待条件成立"""
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class EarlyStopUsageTest(unittest.TestCase):
+    """条目已足够时提前返回，用量在后台读完后记录"""
+
+    def setUp(self):
+        config = Config()
+        config.stream_output = True
+        config.cache_enabled = False
+        self.api = DeepSeekAPI(config)
+
+    def test_sync_request_records_usage(self):
+        self.api.client = make_client(FakeStream)
+        forwarded = []
+        result = self.api._request("predict", [], on_delta=lambda delta, text: forwarded.append(delta))
+        self.assertTrue(result.endswith("5. 没问题\n"))
+        # 五个条目之后的说明文字不再转发
+        self.assertEqual(len(forwarded), 3)
+        self.assertTrue(wait_for(lambda: self.api.get_prompt_cache_hit_ratio("predict") is not None))
+        self.assertAlmostEqual(self.api.get_prompt_cache_hit_ratio("predict"), 0.75)
+
+    def test_async_request_records_usage(self):
+        self.api.async_client = make_client(FakeAsyncStream, asynchronous=True)
+
+        async def scenario():
+            result = await self.api._arequest("suggest", [])
+            # 等待后台读取用量的任务结束
+            await asyncio.gather(*self.api._drains)
+            return result
+
+        self.assertTrue(asyncio.run(scenario()).endswith("5. 没问题\n"))
+        self.assertAlmostEqual(self.api.get_prompt_cache_hit_ratio("suggest"), 0.75)
+
+
+if __name__ == "__main__":
+    unittest.main()
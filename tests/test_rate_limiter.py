@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""令牌桶限流测试"""
+
+import time
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+from src.utils.rate_limiter import TokenBucket, parse_retry_after
+from src.utils.cancellation import CancelToken, RequestCancelled
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    """Retry-After响应头的解析"""
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("2.5"), 2.5)
+        self.assertEqual(parse_retry_after("-1"), 0.0)
+
+    def test_http_date(self):
+        value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(value), 30, delta=2)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("稍后再试"))
+
+
+class TokenBucketTest(unittest.TestCase):
+    """突发容量、429后的暂停与降速"""
+
+    def test_burst_then_queue(self):
+        bucket = TokenBucket(rate=100, capacity=2)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        # 突发额度用完后按速率排队
+        self.assertAlmostEqual(bucket.acquire(), 0.01, delta=0.005)
+
+    def test_rate_limited_blocks_until_retry_after(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        bucket.on_rate_limited(retry_after=0.2)
+        self.assertEqual(bucket.rate, 50)
+        self.assertFalse(bucket.try_acquire())
+        start = time.monotonic()
+        wait = bucket.acquire()
+        self.assertGreaterEqual(wait, 0.15)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(bucket.get_stats()["throttled"], 1)
+
+    def test_rate_recovers_and_respects_minimum(self):
+        bucket = TokenBucket(rate=80, capacity=1, min_rate=20)
+        for _ in range(5):
+            bucket.on_rate_limited(retry_after=0)
+        self.assertEqual(bucket.rate, 20)
+        for _ in range(20):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 80)
+
+    def test_cancel_while_queued_refunds_token(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.acquire()
+        token = CancelToken()
+        token.cancel()
+        with self.assertRaises(RequestCancelled):
+            bucket.acquire(token)
+        # 归还的令牌不会让后续请求多等一个间隔
+        self.assertLess(bucket._reserve(), 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""请求策略测试"""
+
+import time
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+
+from src.api.request_policy import RequestPolicy, DeadlineExceeded
+from src.utils.tracing import start_trace, end_trace, span
+
+
+def make_config(**overrides):
+    """创建测试用的策略配置"""
+    values = dict(
+        request_deadlines={"predict": 5},
+        request_max_retries=0,
+        retry_backoff_base_ms=1,
+        retry_backoff_max_ms=1,
+        hedge_enabled=False,
+        hedge_percentile=95,
+        hedge_min_samples=10,
+        circuit_failure_threshold=1,
+        circuit_reset_seconds=0.01,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+class CircuitProbeCancelTest(unittest.TestCase):
+    """试探请求被取消后熔断器仍能恢复"""
+
+    def setUp(self):
+        self.policy = RequestPolicy(make_config(), retryable_errors=(ConnectionError,))
+
+    def _open_breaker(self):
+        """让熔断器打开并等待冷却结束"""
+        def fail(deadline, claim, cancel_token):
+            raise ConnectionError("连接失败")
+        with self.assertRaises(ConnectionError):
+            self.policy.execute("predict", fail)
+        time.sleep(0.02)
+        self.assertEqual(self.policy.breaker.state, "half_open")
+
+    def test_cancel_during_async_probe_releases_probe(self):
+        self._open_breaker()
+
+        async def slow(deadline, claim):
+            await asyncio.sleep(10)
+
+        async def succeed(deadline, claim):
+            return "ok"
+
+        async def scenario():
+            task = asyncio.ensure_future(self.policy.execute_async("predict", slow))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await self.policy.execute_async("predict", succeed)
+
+        self.assertEqual(asyncio.run(scenario()), "ok")
+        self.assertEqual(self.policy.breaker.state, "closed")
+
+    def test_interrupt_during_sync_probe_releases_probe(self):
+        self._open_breaker()
+
+        def interrupted(deadline, claim, cancel_token):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.policy.execute("predict", interrupted)
+        self.assertEqual(self.policy.execute("predict", lambda deadline, claim, cancel_token: "ok"), "ok")
+        self.assertEqual(self.policy.breaker.state, "closed")
+
+
+class HedgeCancelTest(unittest.TestCase):
+    """对冲落后与超时的尝试会被取消"""
+
+    def setUp(self):
+        self.policy = RequestPolicy(make_config(hedge_enabled=True, request_deadlines={"predict": 0.5}))
+        for _ in range(10):
+            self.policy.latency.record("predict", 0.01)
+        self.tokens = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        end_trace()
+
+    def _attempt(self, respond):
+        """返回一个尝试函数，respond(index)为真的尝试立即返回，其余等待取消"""
+        def attempt(deadline, claim, cancel_token):
+            with self.lock:
+                index = len(self.tokens)
+                self.tokens.append(cancel_token)
+            with span(f"attempt{index}"):
+                if respond(index):
+                    return "ok" if claim() else None
+                cancel_token.wait(2)
+                cancel_token.raise_if_cancelled()
+        return attempt
+
+    def test_loser_is_cancelled_and_spans_recorded(self):
+        trace = start_trace("predict")
+        self.assertEqual(self.policy.execute("predict", self._attempt(lambda index: index == 1)), "ok")
+        self.assertEqual(len(self.tokens), 2)
+        self.assertTrue(self.tokens[0].wait(1))
+        self.assertFalse(self.tokens[1].cancelled)
+        self.assertIn("attempt1", trace.durations())
+
+    def test_deadline_cancels_all_attempts(self):
+        with self.assertRaises(DeadlineExceeded):
+            self.policy.execute("predict", self._attempt(lambda index: False))
+        self.assertTrue(self.tokens)
+        self.assertTrue(all(token.cancelled for token in self.tokens))
+
+
+if __name__ == "__main__":
+    unittest.main()
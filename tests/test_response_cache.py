@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""响应缓存测试"""
+
+import time
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.utils.response_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """内存LRU、磁盘缓存与过期时间"""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_lru_evicts_least_recently_used(self):
+        cache = ResponseCache(self.directory, max_memory_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get_stats()["memory_entries"], 2)
+        # b被淘汰出内存，但仍可从磁盘读取
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.get_stats()["disk_hits"], 1)
+        self.assertEqual(cache.get_stats()["memory_hits"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(self.directory, ttl=0.05)
+        cache.set("a", ["好的"])
+        self.assertIn("a", cache)
+        self.assertEqual(cache.get("a"), ["好的"])
+        time.sleep(0.1)
+        self.assertNotIn("a", cache)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["disk_entries"], 0)
+
+    def test_disk_cache_survives_restart(self):
+        ResponseCache(self.directory).set("a", "分析结果")
+        cache = ResponseCache(self.directory)
+        self.assertEqual(cache.get("a"), "分析结果")
+
+    def test_disk_size_limit_drops_oldest(self):
+        cache = ResponseCache(self.directory, max_disk_bytes=200)
+        for index in range(5):
+            cache.set(str(index), "内容" * 10)
+            time.sleep(0.01)
+        stats = cache.get_stats()
+        self.assertLessEqual(stats["disk_bytes"], 200)
+        self.assertFalse((self.directory / "0.json").exists())
+        self.assertTrue((self.directory / "4.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
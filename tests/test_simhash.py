@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""相似对话检测测试"""
+
+import unittest
+
+from src.utils.simhash import NearDuplicateIndex, simhash, hamming_distance, normalize_conversation
+
+LINES = [
+    ("小明", "周末有空吗，想去爬山"),
+    ("我", "可以啊，去哪座山"),
+    ("小明", "香山怎么样，人可能有点多"),
+    ("我", "那早点出发吧，七点在地铁站见"),
+    ("小明", "好的，我带点吃的"),
+    ("我", "我带水和相机"),
+    ("小明", "天气预报说周六晴天"),
+    ("我", "太好了，记得穿运动鞋"),
+    ("小明", "那就这么定了"),
+]
+
+
+def conversation(lines, minute=0):
+    """由(发送者, 内容)列表生成聊天文本，minute用于改变时间"""
+    return "\n".join(f"{name} 10:{minute + index:02d}\n{content}" for index, (name, content) in enumerate(lines))
+
+
+class SimHashTest(unittest.TestCase):
+    """指纹的计算"""
+
+    def test_time_does_not_change_fingerprint(self):
+        self.assertEqual(normalize_conversation(conversation(LINES)), normalize_conversation(conversation(LINES, 7)))
+
+    def test_similar_text_has_close_fingerprint(self):
+        text = normalize_conversation(conversation(LINES))
+        scrolled = normalize_conversation(conversation(LINES[1:]))
+        other = normalize_conversation(conversation([(name, content[::-1]) for name, content in LINES]))
+        self.assertLess(hamming_distance(simhash(text), simhash(scrolled)),
+                        hamming_distance(simhash(text), simhash(other)))
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    """相似对话的查找"""
+
+    def setUp(self):
+        self.index = NearDuplicateIndex(threshold=12)
+        self.index.add("predict", conversation(LINES), "key")
+
+    def test_scrolled_conversation_is_found(self):
+        found = self.index.find("predict", conversation(LINES[1:], 3))
+        self.assertIsNotNone(found)
+        self.assertEqual(found[0], "key")
+        self.assertLessEqual(found[1], 12)
+
+    def test_new_last_message_is_not_reused(self):
+        self.assertIsNone(self.index.find("predict", conversation(LINES[:-1] + [("小明", "改天吧")])))
+
+    def test_groups_are_separate(self):
+        self.assertIsNone(self.index.find("suggest", conversation(LINES)))
+        self.assertEqual(self.index.get_stats()["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
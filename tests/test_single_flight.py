@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""请求合并测试"""
+
+import time
+import threading
+import unittest
+
+from src.utils.cancellation import CancelToken, RequestCancelled
+from src.utils.single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    """相同请求的合并与取消"""
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.results = []
+        self.leader = threading.Thread(
+            target=lambda: self.results.append(self.flight.do("key", self._slow))
+        )
+        self.leader.start()
+        while not self.flight.is_inflight("key"):
+            time.sleep(0.001)
+
+    def tearDown(self):
+        self.release.set()
+        self.leader.join()
+
+    def _slow(self):
+        """等待测试放行后返回结果"""
+        self.release.wait(5)
+        return "结果"
+
+    def test_follower_shares_leader_result(self):
+        threading.Timer(0.05, self.release.set).start()
+        self.assertEqual(self.flight.do("key", lambda: "重复执行"), "结果")
+        self.assertEqual(self.flight.get_stats()["coalesced"], 1)
+
+    def test_cancelled_follower_stops_waiting(self):
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(RequestCancelled):
+            self.flight.do("key", lambda: "重复执行", token)
+        self.assertLess(time.monotonic() - start, 1)
+        # 负责执行的请求不受等待者取消的影响
+        self.release.set()
+        self.leader.join()
+        self.assertEqual(self.results, ["结果"])
+
+
+if __name__ == "__main__":
+    unittest.main()
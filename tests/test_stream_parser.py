@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""流式结果解析测试"""
+
+import unittest
+
+from src.api.stream_parser import parse_list
+
+
+class ParseListTest(unittest.TestCase):
+    """列表解析"""
+
+    def test_markdown_heading_and_rule_are_not_items(self):
+        content = "**可能的回复：**\n---\n1. 好的\n2. 明天见\n3. 哈哈\n4. 行\n5. 没问题"
+        self.assertEqual(parse_list(content, 5), ["好的", "明天见", "哈哈", "行", "没问题"])
+
+    def test_spaced_rule_is_not_item(self):
+        self.assertEqual(parse_list("* * *\n- 好的\n• 明天见", 5), ["好的", "明天见"])
+
+    def test_numbered_items_without_space(self):
+        self.assertEqual(parse_list("1.好的\n12、明天见\n3）哈哈", 5), ["好的", "明天见", "哈哈"])
+
+
+if __name__ == "__main__":
+    unittest.main()
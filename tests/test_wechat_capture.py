@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""增量捕获测试"""
+
+import unittest
+
+from src.data.wechat_capture import WeChatCapture, find_last_run
+from src.utils.config import Config
+
+
+def capture_text(*lines):
+    """由(发送者, 内容)生成一次捕获的文本"""
+    return "\n".join(f"{name}：\n{content}" for name, content in lines)
+
+
+class FindLastRunTest(unittest.TestCase):
+    """滚动哈希查找连续片段"""
+
+    def test_finds_last_occurrence(self):
+        self.assertEqual(find_last_run([1, 2, 3, 1, 2, 3, 4], [1, 2, 3]), 3)
+        self.assertEqual(find_last_run([5, 1, 2], [1, 2]), 1)
+
+    def test_missing_or_too_long(self):
+        self.assertIsNone(find_last_run([1, 2, 3], [2, 1]))
+        self.assertIsNone(find_last_run([1], [1, 2]))
+        self.assertIsNone(find_last_run([1, 2], []))
+
+
+class DeltaIngestionTest(unittest.TestCase):
+    """只把新出现的消息加入聊天历史"""
+
+    def setUp(self):
+        config = Config()
+        config.capture_record_path = ""
+        self.capture = WeChatCapture(config, backend=object())
+
+    def test_scrolled_capture_adds_only_new_messages(self):
+        self.capture.process_chat_content(capture_text(("小明", "在吗"), ("我", "在"), ("小明", "吃饭了吗")))
+        self.capture.process_chat_content(capture_text(("我", "在"), ("小明", "吃饭了吗"), ("我", "还没")))
+        self.assertEqual([message.text for message in self.capture.last_delta], ["还没"])
+        self.assertEqual(len(self.capture.messages), 4)
+
+    def test_repeated_message_after_anchor_is_new(self):
+        self.capture.process_chat_content(capture_text(("小明", "好的"), ("我", "嗯"), ("小明", "好的")))
+        self.capture.process_chat_content(
+            capture_text(("小明", "好的"), ("我", "嗯"), ("小明", "好的"), ("小明", "好的"))
+        )
+        self.assertEqual(len(self.capture.last_delta), 1)
+        self.assertEqual(len(self.capture.messages), 4)
+
+    def test_unchanged_capture_has_no_delta(self):
+        text = capture_text(("小明", "在吗"), ("我", "在"))
+        self.capture.process_chat_content(text)
+        self.assertIsNone(self.capture.process_chat_content(text))
+
+    def test_unrelated_capture_starts_over(self):
+        self.capture.process_chat_content(capture_text(("小明", "在吗"), ("我", "在")))
+        self.capture.process_chat_content(capture_text(("小红", "明天开会"), ("我", "收到")))
+        self.assertEqual([message.sender for message in self.capture.messages], ["小红", "我"])
+
+
+if __name__ == "__main__":
+    unittest.main()